@@ -0,0 +1,43 @@
+"""
+Database access for code running on an event loop
+
+AsyncDatabaseManager offers every DatabaseManager operation as a coroutine
+on SQLAlchemy's async engine (aiosqlite locally, asyncpg on PostgreSQL; see
+models.get_async_engine). A call runs the DatabaseManager code through
+AsyncSession.run_sync: SQLAlchemy drives it in a greenlet and awaits every
+round trip to the database, so the loop serves other updates while a query
+is in flight. Queries, caches and ledger bookkeeping have one
+implementation for both.
+
+Returned ORM objects cannot lazy load; use what DatabaseManager loads
+(transaction wallets, sources and categories are eager). Generators such
+as iter_transactions_by_period are not offered.
+"""
+
+import functools
+import inspect
+from typing import Callable
+
+from database import DatabaseManager
+
+class AsyncDatabaseManager:
+    def __init__(self, session):
+        """session: an AsyncSession, e.g. models.AsyncSessionLocal()"""
+        self.session = session
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """func(DatabaseManager, *args, **kwargs) on the session's connection"""
+        return await self.session.run_sync(lambda db: func(DatabaseManager(db), *args, **kwargs))
+
+def _operation(func):
+    @functools.wraps(func)
+    async def operation(self, *args, **kwargs):
+        return await self.run(func, *args, **kwargs)
+    return operation
+
+# Public DatabaseManager methods, so new operations get their coroutine automatically
+OPERATIONS = tuple(name for name, func in vars(DatabaseManager).items()
+                   if not name.startswith('_') and inspect.isfunction(func) and not inspect.isgeneratorfunction(func))
+
+for _name in OPERATIONS:
+    setattr(AsyncDatabaseManager, _name, _operation(getattr(DatabaseManager, _name)))
@@ -0,0 +1,16 @@
+"""
+Benchmarks for the finance bot
+
+Run a benchmark as a module from the project root, e.g.:
+
+    python -m benchmarks.bench_indexes
+
+Set BENCH_DATABASE_URL to benchmark against PostgreSQL instead of a
+temporary SQLite file.
+
+benchmarks.suite times every DatabaseManager method and API route on
+SQLite and PostgreSQL and compares the results with a stored baseline:
+
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --baseline baseline.json
+"""
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Mini-app time-to-interactive: the old request waterfall vs /bootstrap
+
+    python -m benchmarks.bench_bootstrap [transactions] [rtt_ms]
+
+Starts the web app on a local port and replays the requests app.js makes
+when it opens. The dashboard is interactive once the summary and recent
+transactions are drawn; the transaction form is ready once the wallet,
+category and income source selects are filled. Local timings are
+measured; the totals at the given round-trip time add rtt_ms per
+sequential round trip, as on a mobile network.
+"""
+
+import os
+import tempfile
+
+# The app reads DATABASE_URL when it is imported
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or \
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), 'bootstrap.db')
+
+import http.client
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import make_server
+
+from benchmarks.common import populate, print_table
+from models import SessionLocal, User
+from webapp import app
+
+def get(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        body = response.read()
+        assert response.status == 200, (path, response.status)
+        return body
+    finally:
+        conn.close()
+
+def waterfall(port, base):
+    """Old app.js: user, then summary, then recent transactions; the form fetches three lists at once"""
+    started = time.perf_counter()
+    get(port, base)
+    get(port, base + '/summary')
+    get(port, base + '/transactions?limit=5')
+    dashboard = time.perf_counter() - started
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(pool.map(lambda path: get(port, base + path), ['/wallets', '/income-sources', '/expense-categories']))
+    return dashboard, time.perf_counter() - started
+
+def bootstrap(port, base):
+    started = time.perf_counter()
+    get(port, base + '/bootstrap')
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+def measure(flow, port, base, repeat=30):
+    for _ in range(3):
+        flow(port, base)
+    samples = [flow(port, base) for _ in range(repeat)]
+    return (statistics.median(s[0] for s in samples) * 1000,
+            statistics.median(s[1] for s in samples) * 1000)
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rtt = float(sys.argv[2]) if len(sys.argv) > 2 else 150.0
+
+    session = SessionLocal()
+    user_id = populate(session, users=1, transactions_per_user=transactions, days=2 * 365)[0]
+    telegram_id = session.query(User.telegram_id).filter(User.id == user_id).scalar()
+    session.close()
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'/api/user/{telegram_id}'
+
+    # (flow, round trips to the dashboard, round trips to a ready form, requests)
+    flows = [('waterfall', waterfall, 3, 4, 6), ('bootstrap', bootstrap, 1, 1, 1)]
+    rows = []
+    try:
+        for name, flow, dashboard_trips, form_trips, requests in flows:
+            dashboard_ms, form_ms = measure(flow, server.port, base)
+            rows.append((name, requests, f'{dashboard_ms:.1f}', f'{form_ms:.1f}',
+                         f'{dashboard_ms + dashboard_trips * rtt:.0f}', f'{form_ms + form_trips * rtt:.0f}'))
+    finally:
+        server.shutdown()
+
+    print(f"📦 {transactions} transactions, {rtt:.0f} ms round trip")
+    print_table(['flow', 'requests', 'dashboard, ms', 'form ready, ms',
+                 f'dashboard @{rtt:.0f}ms', f'form @{rtt:.0f}ms'], rows)
+
+if __name__ == '__main__':
+    main()
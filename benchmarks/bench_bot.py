@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Bot update throughput against a stubbed Bot API
+
+    python -m benchmarks.bench_bot [updates] [api_latency_ms] [db_latency_ms] [--webhook]
+
+Replays /start updates from a few hundred users through FinanceBot with
+its real handlers and database, while a FakeBotAPI answers sendMessage
+after api_latency_ms (the round trip to Telegram). db_latency_ms is added
+to every SQL statement as a stand-in for the network round trip to
+PostgreSQL, which SQLite does not have: a blocking sleep on the
+synchronous engine, an awaited one on the async engine (as asyncpg would
+wait on its socket). Updates go straight
+into the application's queue, or with --webhook are POSTed to the webhook
+listener by 16 client threads. Each configuration reports updates per
+second and p50/p99 latency of the /start handler:
+
+- sequential, database calls on the event loop (the old behaviour)
+- concurrent updates, database calls on the event loop
+- concurrent updates, database calls in the BOT_DB_THREADS pool
+- concurrent updates, database calls on the async engine (BOT_DB_LAYER=async)
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# The bot binds its engine to DATABASE_URL at import. Modules importing this one for
+# its helpers keep their own database
+if __name__ == '__main__':
+    os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or \
+        'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), 'bot.db')
+
+from benchmarks.bench_server import free_port
+from benchmarks.common import print_table
+from benchmarks.fake_bot_api import FakeBotAPI, TOKEN, make_command_update
+
+USERS = 300
+SECRET = 'bench-secret'
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)] * 1000 if samples else 0.0
+
+def post_updates(port: int, updates: list):
+    """Deliver updates to the webhook as Telegram would: concurrent HTTPS POSTs (plain HTTP here)"""
+    def post(update):
+        request = urllib.request.Request(
+            f'http://127.0.0.1:{port}/telegram', data=json.dumps(update).encode(),
+            headers={'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': SECRET})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+
+    with ThreadPoolExecutor(16) as pool:
+        list(pool.map(post, updates))
+
+async def replay(updates: list, latency: float, webhook: bool) -> dict:
+    from telegram import Update
+    from telegram.ext import Application
+    from bot import FinanceBot
+
+    latencies = []
+
+    class TimedBot(FinanceBot):
+        async def start_command(self, update, context):
+            started = time.perf_counter()
+            await super().start_command(update, context)
+            latencies.append(time.perf_counter() - started)
+
+    with FakeBotAPI(latency) as api:
+        bot = TimedBot(Application.builder().token(TOKEN).base_url(api.base_url))
+        application = bot.application
+        await application.initialize()
+        await application.start()
+        try:
+            started = time.perf_counter()
+            if webhook:
+                port = free_port()
+                await application.updater.start_webhook(
+                    listen='127.0.0.1', port=port, url_path='telegram', secret_token=SECRET,
+                    webhook_url='https://example.invalid/telegram')
+                started = time.perf_counter()
+                await asyncio.get_running_loop().run_in_executor(None, post_updates, port, updates)
+            else:
+                for data in updates:
+                    await application.update_queue.put(Update.de_json(data, application.bot))
+            done = await asyncio.get_running_loop().run_in_executor(
+                None, api.wait_for, 'sendMessage', len(updates), 600)
+            elapsed = time.perf_counter() - started
+        finally:
+            if webhook:
+                await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+
+    return {
+        'done': done,
+        'ups': len(updates) / elapsed,
+        'p50_ms': percentile(latencies, 0.5),
+        'p99_ms': percentile(latencies, 0.99),
+        'api_concurrency': api.max_in_flight
+    }
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    webhook = '--webhook' in sys.argv
+    count = int(args[0]) if args else 3000
+    latency = (float(args[1]) if len(args) > 1 else 30) / 1000
+    db_latency = (float(args[2]) if len(args) > 2 else 2) / 1000
+
+    import logging
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.util import await_only
+    from config import Config
+    from migrate_db import init_database
+    for name in ('httpx', 'telegram'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    init_database()
+
+    def add_latency(conn, *args):
+        if conn.dialect.is_async:
+            await_only(asyncio.sleep(db_latency))
+        else:
+            time.sleep(db_latency)
+    if db_latency:
+        # Every engine, including the async one each run creates
+        event.listen(Engine, 'before_cursor_execute', add_latency)
+
+    updates = [make_command_update(n, 10**9 + n % USERS) for n in range(1, count + 1)]
+    concurrency = Config.BOT_CONCURRENT_UPDATES
+    configurations = [
+        ('sequential, DB on the loop', 1, 'threads', 0),
+        (f'{concurrency} concurrent, DB on the loop', concurrency, 'threads', 0),
+        (f'{concurrency} concurrent, {Config.BOT_DB_THREADS} DB threads', concurrency, 'threads', Config.BOT_DB_THREADS),
+        (f'{concurrency} concurrent, async engine', concurrency, 'async', 0),
+    ]
+    rows = []
+    saved = Config.BOT_CONCURRENT_UPDATES, Config.BOT_DB_LAYER, Config.BOT_DB_THREADS
+    for name, *settings in configurations:
+        Config.BOT_CONCURRENT_UPDATES, Config.BOT_DB_LAYER, Config.BOT_DB_THREADS = settings
+        result = asyncio.run(replay(updates, latency, webhook))
+        rows.append((name, f"{result['ups']:.0f}", f"{result['p50_ms']:.1f}", f"{result['p99_ms']:.1f}",
+                     result['api_concurrency'], '' if result['done'] else 'timed out'))
+    Config.BOT_CONCURRENT_UPDATES, Config.BOT_DB_LAYER, Config.BOT_DB_THREADS = saved
+
+    print(f"📦 {count} /start updates from {USERS} users via {'webhook' if webhook else 'the update queue'}, "
+          f"Bot API latency {latency * 1000:.0f} ms, SQL latency {db_latency * 1000:.0f} ms, {os.cpu_count()} CPU")
+    print_table(['configuration', 'updates/s', 'p50, ms', 'p99, ms', 'API calls at once', ''], rows)
+
+if __name__ == '__main__':
+    main()
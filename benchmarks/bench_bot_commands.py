@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Latency of the bot's /balance, /today and /report commands
+
+    python -m benchmarks.bench_bot_commands [transactions] [rounds]
+
+Populates one user with a long history (two years, wallets in three
+currencies), then sends the commands through FinanceBot with its real
+handlers and database to a FakeBotAPI that answers at once. Latency runs
+from the update entering the application's queue to the reply reaching
+the API, so it is the time spent on our side. Each command is measured
+as a miss (the result cache was just invalidated, as after any write of
+the user's, so the reply is computed from daily rollups) and as a hit.
+The target is a p95 under 50 ms.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# The bot binds its engine to DATABASE_URL at import
+if __name__ == '__main__':
+    os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or \
+        'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), 'commands.db')
+
+from benchmarks.bench_bot import percentile
+from benchmarks.common import populate, print_table
+from benchmarks.fake_bot_api import FakeBotAPI, TOKEN, make_command_update
+
+COMMANDS = ['/balance', '/today', '/report', '/report 7', '/report year']
+TARGET_MS = 50
+
+async def replay(api, telegram_id: int, rounds: int, miss: bool) -> dict:
+    from telegram import Update
+    from telegram.ext import Application
+    from bot import FinanceBot
+    from cache import result_cache
+
+    bot = FinanceBot(Application.builder().token(TOKEN).base_url(api.base_url))
+    await bot.application.initialize()
+    await bot.application.start()
+    loop = asyncio.get_running_loop()
+    samples = {command: [] for command in COMMANDS}
+    update_id = 0
+    try:
+        for n in range(rounds + 1):
+            for command in COMMANDS:
+                if miss:
+                    result_cache.clear()
+                update_id += 1
+                update = Update.de_json(make_command_update(update_id, telegram_id, command), bot.application.bot)
+                sent = len(api.sent)
+                started = time.perf_counter()
+                await bot.application.update_queue.put(update)
+                await loop.run_in_executor(None, api.wait_for, 'sendMessage', sent + 1, 30)
+                # The first round warms up connections and, for hits, the cache
+                if n:
+                    samples[command].append(api.sent[sent][2] - started)
+    finally:
+        await bot.application.stop()
+        await bot.application.shutdown()
+    return samples
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+    from config import Config
+    from ledger import ledger_cache
+    from migrate_db import init_database
+    from models import SessionLocal, User, engine
+    init_database(engine)
+    session = SessionLocal()
+    user_id = populate(session, users=1, transactions_per_user=transactions, days=2 * 365)[0]
+    telegram_id = session.get(User, user_id).telegram_id
+    session.close()
+
+    results = {}
+    with FakeBotAPI() as api:
+        for name, miss in [('miss', True), ('hit', False)]:
+            results[name] = asyncio.run(replay(api, telegram_id, rounds, miss))
+
+    rows = []
+    for command in COMMANDS:
+        row = [command]
+        for name in results:
+            samples = results[name][command]
+            row += [f'{percentile(samples, 0.5):.1f}', f'{percentile(samples, 0.95):.1f}']
+        rows.append(row)
+    print(f"📦 {engine.dialect.name}: {transactions} transactions, {rounds} rounds, "
+          f"BOT_DB_LAYER={Config.BOT_DB_LAYER}, ledger {'on' if ledger_cache.maxsize else 'off'}")
+    print_table(['command', 'miss p50, ms', 'miss p95, ms', 'hit p50, ms', 'hit p95, ms'], rows)
+    for name in results:
+        worst = max(percentile(samples, 0.95) for samples in results[name].values())
+        print(f"{'✅' if worst < TARGET_MS else '❌'} worst {name} p95 {worst:.1f} ms (target {TARGET_MS} ms)")
+
+if __name__ == '__main__':
+    main()
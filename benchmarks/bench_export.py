@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the streaming export vs materializing the ledger
+
+    python -m benchmarks.bench_export [rows ...]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import make_engine, make_session, populate, print_table
+from database import DatabaseManager
+import exporter
+
+def measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20, elapsed
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 200_000]
+    rows = []
+
+    for size in sizes:
+        engine = make_engine(f'export-{size}')
+        session = make_session(engine)
+        user_id = populate(session, users=1, transactions_per_user=size, days=5 * 365)[0]
+        db_manager = DatabaseManager(session)
+
+        def stream():
+            for fmt in ('csv', 'ndjson'):
+                for _ in exporter.export_rows(db_manager.iter_transactions_by_period(user_id), fmt):
+                    pass
+
+        def materialize():
+            db_manager.get_transactions_by_period(user_id, None, None)
+
+        stream_mb, stream_s = measure(stream)
+        session.expunge_all()
+        list_mb, list_s = measure(materialize)
+        rows.append((size, f'{stream_mb:.1f}', f'{stream_s / 2:.2f}', f'{list_mb:.1f}', f'{list_s:.2f}'))
+
+    print_table(['rows', 'export peak, MiB', 'export s/format', '.all() peak, MiB', '.all() s'], rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Bulk import throughput for CSV and JSON lines
+
+    python -m benchmarks.bench_import [rows]
+"""
+
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func
+
+from benchmarks.common import make_engine, make_session, populate, print_table, CATEGORY_NAMES, SOURCE_NAMES
+from database import DatabaseManager
+from importer import import_transactions
+from models import Transaction, Wallet
+
+COLUMNS = ['date', 'type', 'amount', 'currency', 'wallet', 'category', 'source', 'description']
+
+def generate_rows(count, wallet_names, seed=7):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    for n in range(count):
+        income = rng.random() < 0.25
+        yield {
+            'date': (now - timedelta(minutes=rng.randrange(5 * 365 * 24 * 60))).isoformat(timespec='seconds'),
+            'type': 'income' if income else 'expense',
+            'amount': f'{rng.uniform(1, 2000 if income else 300):.2f}',
+            'currency': '',
+            'wallet': rng.choice(wallet_names),
+            'category': '' if income else rng.choice(CATEGORY_NAMES),
+            'source': rng.choice(SOURCE_NAMES) if income else '',
+            'description': f'row {n}'
+        }
+
+def write_file(fmt, count, wallet_names):
+    path = os.path.join(tempfile.mkdtemp(prefix='finance-import-'), f'rows.{fmt}')
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, COLUMNS)
+            writer.writeheader()
+            writer.writerows(generate_rows(count, wallet_names))
+        else:
+            for row in generate_rows(count, wallet_names):
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+    return path
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = []
+
+    for fmt in ('csv', 'ndjson'):
+        engine = make_engine(f'import-{fmt}')
+        session = make_session(engine)
+        user_id = populate(session, users=1, transactions_per_user=0)[0]
+        db_manager = DatabaseManager(session)
+        wallet_names = [wallet.name for wallet in db_manager.get_user_wallets(user_id)]
+        path = write_file(fmt, count, wallet_names)
+
+        started = time.perf_counter()
+        with open(path, 'rb') as f:
+            report = import_transactions(db_manager, user_id, f, fmt)
+        elapsed = time.perf_counter() - started
+
+        signed = case((Transaction.transaction_type == 'income', Transaction.amount), else_=-Transaction.amount)
+        ledger = session.query(func.sum(signed)).filter(Transaction.user_id == user_id).scalar()
+        balance = session.query(func.sum(Wallet.balance)).filter(Wallet.user_id == user_id).scalar()
+        assert abs(ledger - balance) < 1e-6, 'wallet balances drifted from the ledger'
+
+        rows.append((engine.dialect.name, fmt, report['imported'], report['failed'],
+                     f'{elapsed:.2f}', f'{report["imported"] / elapsed:,.0f}'))
+
+    print_table(['database', 'format', 'imported', 'failed', 'seconds', 'rows/s'], rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Query times before and after the ledger index migrations
+
+    python -m benchmarks.bench_indexes [users] [transactions_per_user]
+"""
+
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.common import make_engine, make_session, populate, median_ms, print_table
+from database import DatabaseManager
+from migrate_db import migrate_database
+
+INDEXES = [
+    'ix_transactions_user_date',
+    'ix_transactions_user_date_id',
+    'ix_wallets_user_active',
+    'ix_income_sources_user_active',
+    'ix_expense_categories_user_active',
+]
+
+def run_queries(db_manager, user_id):
+    now = datetime.utcnow()
+    queries = [
+        ('get_user_transactions(limit=50)', lambda: db_manager.get_user_transactions(user_id, 50)),
+        ('get_transactions_by_period(30d)', lambda: db_manager.get_transactions_by_period(user_id, now - timedelta(days=30), now)),
+        ('get_user_summary(30d)', lambda: db_manager.get_user_summary(user_id, 30)),
+        ('get_user_summary(365d)', lambda: db_manager.get_user_summary(user_id, 365)),
+        ('get_user_wallets', lambda: db_manager.get_user_wallets(user_id)),
+        ('get_user_income_sources', lambda: db_manager.get_user_income_sources(user_id)),
+        ('get_user_expense_categories', lambda: db_manager.get_user_expense_categories(user_id)),
+    ]
+    results = {}
+    for name, query in queries:
+        results[name] = median_ms(query)
+        db_manager.db.rollback()
+    return results
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    engine = make_engine('indexes')
+    print(f"📦 {engine.dialect.name}: {users} users × {per_user} transactions")
+
+    with engine.begin() as conn:
+        for index in INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+    session = make_session(engine)
+    user_ids = populate(session, users=users, transactions_per_user=per_user)
+    user_id = user_ids[len(user_ids) // 2]
+    db_manager = DatabaseManager(session)
+
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    before = run_queries(db_manager, user_id)
+
+    session.close()
+    migrate_database(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    session = make_session(engine)
+    after = run_queries(DatabaseManager(session), user_id)
+
+    print_table(
+        ['query', 'before, ms', 'after, ms', 'speedup'],
+        [(name, f'{before[name]:.2f}', f'{after[name]:.2f}', f'{before[name] / after[name]:.1f}x')
+         for name in before]
+    )
+
+if __name__ == '__main__':
+    main()
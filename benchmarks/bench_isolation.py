@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Web and bot isolation: one shared interpreter vs supervised processes
+
+    python -m benchmarks.bench_isolation [seconds] [clients] [updates_per_second]
+
+Runs the app the old way (the Flask server in a thread of the bot's
+process, as run.py did) and the new way (run.py's supervisor with gunicorn
+and bot.py as separate processes). The bot polls a FakeBotAPI. Each layout
+goes through three phases of the given length:
+
+- bot only: /start updates arrive at a steady rate;
+- web only: client threads request a mix of API routes (summaries over
+  5000 transactions);
+- mixed: both at once.
+
+Reported per phase: web requests per second and p95 latency, bot latency
+from an update being available to its reply (p50/p95), and CPU seconds
+spent by the web and bot processes (from /proc, Linux only). The isolation
+question is how much the bot's latency grows when web load is added, and
+the other way around.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# The app binds its engine to DATABASE_URL at import
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or \
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), 'isolation.db')
+
+from benchmarks.bench_bot import percentile
+from benchmarks.bench_server import ROOT, free_port, load, wait_ready
+from benchmarks.common import populate, print_table
+from benchmarks.fake_bot_api import FakeBotAPI, TOKEN, make_command_update
+
+SHARED_PROCESS = '''
+import threading
+from webapp import app
+threading.Thread(target=lambda: app.run(host='127.0.0.1', port={port}, threaded=True), daemon=True).start()
+import bot
+bot.main()
+'''
+
+def process_cpu(root_pid: int) -> dict:
+    """CPU seconds of root_pid and its descendants by role: 'bot', 'web', 'shared' (both in one process)"""
+    if not os.path.isdir('/proc'):
+        return {}
+    ticks = os.sysconf('SC_CLK_TCK')
+    parents, cpu, roles = {}, {}, {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{name}/cmdline', 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode(errors='replace')
+        except OSError:
+            continue
+        pid = int(name)
+        # Fields after the command: state, ppid, ... utime (14th overall), stime (15th)
+        parents[pid] = int(fields[1])
+        cpu[pid] = (int(fields[11]) + int(fields[12])) / ticks
+        roles[pid] = 'shared' if 'bot.main' in cmdline else 'bot' if 'bot.py' in cmdline else 'web'
+    totals = {}
+    for pid in cpu:
+        ancestor = pid
+        while ancestor not in (root_pid, 0, 1) and ancestor in parents:
+            ancestor = parents[ancestor]
+        if ancestor == root_pid:
+            role = 'supervisor' if pid == root_pid and roles[pid] == 'web' else roles[pid]
+            totals[role] = totals.get(role, 0.0) + cpu[pid]
+    return totals
+
+class UpdateStream:
+    """Pushes /start updates from new users to the fake API at a steady rate"""
+
+    def __init__(self, api: FakeBotAPI, rate: float, first_user: int):
+        self.api = api
+        self.rate = rate
+        self.next_user = first_user
+        self.pushed = {}
+
+    def push(self, count: int = 1):
+        updates = []
+        for _ in range(count):
+            self.next_user += 1
+            updates.append(make_command_update(self.next_user - 10**9, self.next_user))
+            self.pushed[self.next_user] = time.perf_counter()
+        self.api.push_updates(updates)
+
+    def run(self, seconds: float):
+        started = time.perf_counter()
+        n = 0
+        while time.perf_counter() - started < seconds:
+            self.push()
+            n += 1
+            time.sleep(max(0.0, started + n / self.rate - time.perf_counter()))
+
+    def latencies(self, user_ids) -> list:
+        replies = {int(params['chat_id']): at for method, params, at in list(self.api.calls)
+                   if method == 'sendMessage'}
+        return [replies[user_id] - self.pushed[user_id] for user_id in user_ids if user_id in replies]
+
+def measure(name, command, env, api, port, paths, seconds, clients, rate, first_user):
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rows = []
+    try:
+        wait_ready(port, time.perf_counter())
+        stream = UpdateStream(api, rate, first_user)
+        # The bot answers once it polls; warm up the web workers too
+        sent = api.count('sendMessage')
+        stream.push()
+        if not api.wait_for('sendMessage', sent + 1, 60):
+            raise RuntimeError(f"{name}: the bot did not answer")
+        load(port, paths, 1, clients)
+
+        for phase in ('bot only', 'web only', 'mixed'):
+            before = process_cpu(process.pid)
+            first_user = stream.next_user + 1
+            sent_before = api.count('sendMessage')
+            web = {}
+            threads = []
+            if phase != 'web only':
+                threads.append(threading.Thread(target=stream.run, args=(seconds,)))
+            if phase != 'bot only':
+                threads.append(threading.Thread(target=lambda: web.update(load(port, paths, seconds, clients))))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if phase != 'web only':
+                api.wait_for('sendMessage', sent_before + stream.next_user - first_user + 1, 30)
+            after = process_cpu(process.pid)
+            cpu = {role: after.get(role, 0.0) - before.get(role, 0.0) for role in after}
+            latencies = stream.latencies(range(first_user, stream.next_user + 1)) if phase != 'web only' else []
+            rows.append((name, phase,
+                         f"{web['rps']:.0f}" if web else '', f"{web['p95_ms']:.1f}" if web else '',
+                         f'{percentile(latencies, 0.5):.1f}' if latencies else '',
+                         f'{percentile(latencies, 0.95):.1f}' if latencies else '',
+                         f"{cpu['shared']:.1f} (both)" if 'shared' in cpu else f"{cpu.get('web', 0.0):.1f}",
+                         '' if 'shared' in cpu else f"{cpu.get('bot', 0.0):.1f}"))
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+    return rows
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    from migrate_db import init_database
+    from models import SessionLocal, User, engine
+    init_database(engine)
+    session = SessionLocal()
+    user_id = populate(session, users=1, transactions_per_user=5000)[0]
+    telegram_id = session.get(User, user_id).telegram_id
+    session.close()
+    engine.dispose()
+
+    base = f'/api/user/{telegram_id}'
+    paths = ['/api/currencies', base, base + '/wallets', base + '/transactions?limit=20',
+             base + '/summary?period=30', base + '/summary?period=365']
+
+    rows = []
+    with FakeBotAPI() as api:
+        for n, (name, command) in enumerate([
+            ('one process (thread)', lambda port: [sys.executable, '-c', SHARED_PROCESS.format(port=port)]),
+            ('supervisor (processes)', lambda port: [sys.executable, 'run.py']),
+        ]):
+            port = free_port()
+            env = dict(os.environ, PYTHONPATH=ROOT, PORT=str(port), TELEGRAM_TOKEN=TOKEN, BOT_API_URL=api.base_url,
+                       WEBAPP_URL='http://localhost', WEB_CONCURRENCY=os.getenv('WEB_CONCURRENCY', '2'),
+                       WEB_THREADS=os.getenv('WEB_THREADS', '4'))
+            rows.extend(measure(name, command(port), env, api, port, paths, seconds, clients, rate,
+                                first_user=2 * 10**9 + n * 10**6))
+
+    print(f"📦 {seconds:.0f}s per phase, {clients} web clients, {rate:.0f} bot updates/s, {os.cpu_count()} CPU")
+    print_table(['layout', 'phase', 'web req/s', 'web p95, ms', 'bot p50, ms', 'bot p95, ms',
+                 'web CPU, s', 'bot CPU, s'], rows)
+
+if __name__ == '__main__':
+    main()
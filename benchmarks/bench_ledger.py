@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Summaries and balances from SQL vs the in-memory columnar ledger
+
+    python -m benchmarks.bench_ledger [transactions]
+
+Loads one user's two-year ledger, then times each query on the SQL path
+(daily rollups plus raw edge days) and on the ledger, and checks that
+both give the same answer. Memory is reported per 100k transactions,
+both for the arrays alone and for everything still allocated after
+the load (tracemalloc).
+"""
+
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_engine, make_session, populate, median_ms, print_table
+from database import DatabaseManager
+from cache import result_cache
+from ledger import ledger_cache
+
+def same(a, b):
+    """Equal up to float summation order"""
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same(a[key], b[key]) for key in a)
+    if isinstance(a, float):
+        return abs(a - b) <= 1e-9 * max(1.0, abs(a), abs(b))
+    return a == b
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    days = 2 * 365
+
+    # Time the computations, not cached results
+    result_cache.backend = None
+    engine = make_engine('ledger')
+    session = make_session(engine)
+    user_id = populate(session, users=1, transactions_per_user=transactions, days=days)[0]
+    db_manager = DatabaseManager(session)
+
+    now = datetime.utcnow()
+    db_manager.upsert_fx_rates([
+        {'day': (now - timedelta(days=n)).date(), 'currency': currency, 'rate': rate * (1 + n / 10000)}
+        for n in range(days + 1)
+        for currency, rate in (('USD', 3.2), ('RUB', 0.035))
+    ])
+
+    ledger_cache.maxsize = 1
+    started = time.perf_counter()
+    ledger = db_manager.get_ledger(user_id)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    # Loaded again under tracemalloc, which slows allocation down too much to time it
+    ledger_cache.clear()
+    tracemalloc.start()
+    ledger = db_manager.get_ledger(user_id)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    per_100k = 100_000 / max(len(ledger), 1)
+    print(f"📦 {engine.dialect.name}: {len(ledger)} transactions over {days} days, "
+          f"ledger loaded in {load_ms:.0f} ms")
+    print(f"💾 per 100k transactions: {ledger.nbytes() * per_100k / 2**20:.1f} MiB of arrays, "
+          f"{retained * per_100k / 2**20:.1f} MiB retained after the load")
+
+    queries = [
+        ('summary 30d', lambda: db_manager.get_user_summary(user_id, 30)),
+        ('summary 365d', lambda: db_manager.get_user_summary(user_id, 365)),
+        ('summary all', lambda: db_manager.get_user_summary(user_id, days + 1)),
+        ('summary 30d in BYN', lambda: db_manager.get_user_summary(user_id, 30, 'BYN')),
+        ('summary 365d in BYN', lambda: db_manager.get_user_summary(user_id, 365, 'BYN')),
+        ('balances 1y ago', lambda: db_manager.get_balances_at(user_id, now - timedelta(days=365))),
+        ('balances now', lambda: db_manager.get_balances_at(user_id, now)),
+    ]
+    rows = []
+    for name, query in queries:
+        ledger_cache.maxsize = 0
+        expected = query()
+        sql_ms = median_ms(query, repeat=10)
+        ledger_cache.maxsize = 1
+        actual = query()
+        ledger_ms = median_ms(query, repeat=10)
+        rows.append((name, f'{sql_ms:.2f}', f'{ledger_ms:.2f}', f'{sql_ms / ledger_ms:.1f}x',
+                     'yes' if same(actual, expected) else 'NO'))
+
+    versions_ms = median_ms(lambda: db_manager.get_versions(user_id))
+    print_table(['query', 'SQL, ms', 'ledger, ms', 'speedup', 'same result'], rows)
+    print(f"🔁 every ledger read includes the data_versions check: {versions_ms:.2f} ms")
+
+if __name__ == '__main__':
+    main()
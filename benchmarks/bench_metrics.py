@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Cost of the Prometheus instrumentation per request
+
+    python -m benchmarks.bench_metrics [requests] [transactions]
+
+Sends the same API requests through the Flask test client with
+METRICS_ENABLED on and off, alternating so both runs see the same cache
+and disk state, and reports median latencies per route. Also times the
+pieces on their own: recording one request, one SQL statement with and
+without the engine listeners doing work, and rendering /metrics.
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# The web app binds its engine to DATABASE_URL at import
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='finance-bench-'),
+                                                                  'metrics.db'))
+
+from benchmarks.common import median_ms, populate, print_table
+
+def time_calls(call, repeat: int) -> float:
+    """Mean microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    from sqlalchemy import text
+    import metrics
+    from models import Base, SessionLocal, User, engine
+    import webapp
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    user_id = populate(session, users=1, transactions_per_user=transactions)[0]
+    telegram_id = session.get(User, user_id).telegram_id
+    session.close()
+
+    base = f'/api/user/{telegram_id}'
+    paths = [base, base + '/wallets', base + '/expense-categories', base + '/transactions?limit=50',
+             base + '/summary?period=30', '/api/currencies']
+    client = webapp.app.test_client()
+    for path in paths:
+        assert client.get(path).status_code == 200, path
+
+    samples = {(path, flag): [] for path in paths for flag in (True, False)}
+    for _ in range(requests):
+        for path in paths:
+            for flag in (True, False):
+                metrics.enabled = flag
+                started = time.perf_counter()
+                client.get(path)
+                samples[(path, flag)].append(time.perf_counter() - started)
+    metrics.enabled = True
+
+    rows = []
+    for path in paths:
+        on, off = (statistics.median(samples[(path, flag)]) * 1000 for flag in (True, False))
+        rows.append((path.replace(base, '/api/user/<id>'), f'{off:.3f}', f'{on:.3f}', f'{on - off:+.3f}'))
+    print(f"📦 {engine.dialect.name}: {transactions} transactions, {requests} requests per route and mode")
+    print_table(['route', 'off, ms', 'on, ms', 'overhead, ms'], rows)
+
+    repeat = 20_000
+    timer_cost = time_calls(
+        lambda: metrics.finish_request(metrics.start_request(), 'GET', '/bench', 200), repeat)
+    with engine.connect() as conn:
+        statement = text('SELECT 1')
+        metrics.enabled = False
+        sql_off = time_calls(lambda: conn.execute(statement), repeat)
+        metrics.enabled = True
+        sql_on = time_calls(lambda: conn.execute(statement), repeat)
+    render_ms = median_ms(metrics.registry.render, repeat=50)
+
+    print(f"⏱️  recording one request: {timer_cost:.1f} µs")
+    print(f"⏱️  SELECT 1: {sql_off:.1f} µs off, {sql_on:.1f} µs on ({sql_on - sql_off:+.1f} µs per statement)")
+    print(f"⏱️  rendering /metrics: {render_ms:.2f} ms for {len(metrics.registry.render().splitlines())} lines")
+
+if __name__ == '__main__':
+    main()
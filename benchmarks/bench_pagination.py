@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Offset vs keyset pagination of a large ledger
+
+    python -m benchmarks.bench_pagination [transactions] [page_size]
+"""
+
+import sys
+
+from sqlalchemy import text
+
+from benchmarks.common import make_engine, make_session, populate, median_ms, print_table
+from database import DatabaseManager, encode_cursor
+from models import Transaction
+
+def cursor_before_page(session, user_id, page, page_size):
+    """Cursor of the last row of the previous page, as a client would hold it"""
+    if page == 1:
+        return None
+    last = session.query(Transaction.date, Transaction.id)\
+                  .filter(Transaction.user_id == user_id)\
+                  .order_by(Transaction.date.desc(), Transaction.id.desc())\
+                  .offset((page - 1) * page_size - 1).first()
+    return encode_cursor(last.date, last.id)
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    engine = make_engine('pagination')
+    session = make_session(engine)
+    user_id = populate(session, users=1, transactions_per_user=transactions, days=5 * 365)[0]
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    db_manager = DatabaseManager(session)
+    print(f"📦 {engine.dialect.name}: {transactions} transactions, page size {page_size}")
+
+    rows = []
+    for page in (1, 10, 100, 1000):
+        if (page - 1) * page_size >= transactions:
+            break
+        offset = (page - 1) * page_size
+        cursor = cursor_before_page(session, user_id, page, page_size)
+        offset_ms = median_ms(lambda: db_manager.get_user_transactions(user_id, page_size, offset))
+        keyset_ms = median_ms(lambda: db_manager.get_user_transactions_page(user_id, page_size, cursor))
+        rows.append((page, f'{offset_ms:.2f}', f'{keyset_ms:.2f}'))
+
+    print_table(['page', 'offset, ms', 'keyset, ms'], rows)
+
+if __name__ == '__main__':
+    main()
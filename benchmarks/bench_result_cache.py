@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Summary latency with and without the result cache
+
+    python -m benchmarks.bench_result_cache [transactions] [writes_every]
+
+Replays the calls the dashboard and the reports page make (30-day summary
+in the user's currency, 7/30/90/365-day summaries, wallet balances) for
+one user. A transaction is written every writes_every calls, which
+invalidates the user's entries. The cached run is reported per call kind
+with its hit ratio.
+"""
+
+import random
+import sys
+import time
+from collections import defaultdict
+
+from benchmarks.common import make_engine, make_session, populate, print_table
+from cache import LRUCache, result_cache
+from database import DatabaseManager
+
+CALLS = [
+    ('summary 30d BYN', lambda db, user_id: db.get_user_summary(user_id, 30, 'BYN')),
+    ('summary 7d', lambda db, user_id: db.get_user_summary(user_id, 7)),
+    ('summary 30d', lambda db, user_id: db.get_user_summary(user_id, 30)),
+    ('summary 90d', lambda db, user_id: db.get_user_summary(user_id, 90)),
+    ('summary 365d', lambda db, user_id: db.get_user_summary(user_id, 365)),
+    ('wallet balances', lambda db, user_id: db.get_wallet_balances(user_id)),
+]
+
+def replay(db_manager, user_id, wallet, calls, writes_every, seed=7):
+    rng = random.Random(seed)
+    samples = defaultdict(list)
+    for n in range(calls):
+        if writes_every and n and n % writes_every == 0:
+            db_manager.create_transaction(user_id, wallet.id, 'expense', 1.0, wallet.currency)
+        name, call = rng.choice(CALLS)
+        started = time.perf_counter()
+        call(db_manager, user_id)
+        samples[name].append((time.perf_counter() - started) * 1000)
+    return samples
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    writes_every = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    calls = 600
+
+    engine = make_engine('result-cache')
+    session = make_session(engine)
+    user_id = populate(session, users=1, transactions_per_user=transactions, days=2 * 365)[0]
+    db_manager = DatabaseManager(session)
+    wallet = db_manager.get_user_wallets(user_id)[0]
+
+    result_cache.backend = None
+    uncached = replay(db_manager, user_id, wallet, calls, writes_every)
+    result_cache.backend = LRUCache(1000, 60)
+    result_cache.reset()
+    cached = replay(db_manager, user_id, wallet, calls, writes_every)
+    stats = result_cache.stats()
+
+    rows = []
+    for name, _ in CALLS:
+        before, after = uncached[name], cached[name]
+        rows.append((name, len(after), f'{sum(before) / len(before):.2f}', f'{sum(after) / len(after):.2f}'))
+    total_before = sum(map(sum, uncached.values()))
+    total_after = sum(map(sum, cached.values()))
+    rows.append(('all calls', calls, f'{total_before / calls:.2f}', f'{total_after / calls:.2f}'))
+
+    print(f"📦 {engine.dialect.name}: {transactions} transactions, a write every {writes_every} calls")
+    print_table(['call', 'calls', 'no cache, ms', 'cached, ms'], rows)
+    print(f"🎯 hit rate {stats['hit_rate']:.0%}, hit {stats['avg_hit_ms']:.3f} ms, "
+          f"miss {stats['avg_miss_ms']:.2f} ms (version check not included)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Cold start and throughput of the web app servers
+
+    python -m benchmarks.bench_server [seconds] [clients]
+
+Cold start: time to import the app in a fresh interpreter (what every
+process paid before) with and without the schema setup that used to run at
+import, and time until a server answers its first request.
+
+Throughput: the Flask development server (threaded) and gunicorn with
+gunicorn.conf.py at one and several workers, each loaded for the given
+number of seconds by client threads sending a mix of API requests over new
+connections. The clients run on the same machine, so absolute numbers are
+bounded by its CPU count; the comparison is what matters.
+"""
+
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# The app binds its engine to DATABASE_URL at import. Modules importing this one for
+# its helpers (other benchmarks, tests) keep their own database
+if __name__ == '__main__':
+    os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL') or \
+        'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), 'server.db')
+
+from benchmarks.common import populate, print_table
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def get(port: int, path: str, timeout: float = 10) -> int:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+def wait_ready(port: int, started: float, timeout: float = 60) -> float:
+    """Seconds from started until /api/currencies answers"""
+    while time.perf_counter() - started < timeout:
+        try:
+            if get(port, '/api/currencies', timeout=1) == 200:
+                return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.02)
+    raise RuntimeError(f"server on port {port} did not start")
+
+def python_seconds(env: dict, code: str, repeat: int = 5) -> float:
+    """Median seconds a fresh interpreter reports for code (which prints its own timing)"""
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], env=env, cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+def load(port: int, paths: list, seconds: float, clients: int) -> dict:
+    latencies, errors = [], []
+    stop = time.perf_counter() + seconds
+
+    def client(n):
+        i = n
+        while time.perf_counter() < stop:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                status = get(port, path)
+            except OSError as e:
+                errors.append(str(e))
+                continue
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return {
+        'rps': len(latencies) / seconds,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        'errors': len(errors)
+    }
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    url = os.environ['DATABASE_URL']
+    env = dict(os.environ, PYTHONPATH=ROOT)
+
+    from migrate_db import init_database
+    from models import SessionLocal, User, engine
+    init_database(engine)
+    session = SessionLocal()
+    user_id = populate(session, users=1, transactions_per_user=5000)[0]
+    telegram_id = session.get(User, user_id).telegram_id
+    session.close()
+    engine.dispose()
+
+    timed_import = ('import time; started = time.perf_counter(); import wsgi; {extra}'
+                    'print(time.perf_counter() - started)')
+    import_s = python_seconds(env, timed_import.format(extra=''))
+    old_import_s = python_seconds(env, timed_import.format(
+        extra='from migrate_db import init_database; init_database(); '))
+    print(f"🧊 import wsgi: {import_s * 1000:.0f} ms; "
+          f"with the schema setup it used to run: {old_import_s * 1000:.0f} ms")
+
+    base = f'/api/user/{telegram_id}'
+    paths = ['/api/currencies', base, base + '/wallets', base + '/expense-categories',
+             base + '/transactions?limit=20', base + '/summary?period=30']
+    servers = [
+        ('flask dev server, threaded', lambda port: [
+            sys.executable, '-c', f'from wsgi import app; app.run(port={port}, threaded=True)'], {}),
+        ('gunicorn 1 worker × 4 threads', lambda port: [
+            sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+         {'WEB_CONCURRENCY': '1', 'WEB_THREADS': '4'}),
+        ('gunicorn 4 workers × 4 threads', lambda port: [
+            sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+         {'WEB_CONCURRENCY': '4', 'WEB_THREADS': '4'}),
+    ]
+
+    rows = []
+    for name, command, extra_env in servers:
+        port = free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen(command(port), cwd=ROOT, env=dict(env, PORT=str(port), **extra_env),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            ready_s = wait_ready(port, started)
+            load(port, paths, 1, clients)  # warm up every worker
+            result = load(port, paths, seconds, clients)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        rows.append((name, f'{ready_s * 1000:.0f}', f"{result['rps']:.0f}", f"{result['p50_ms']:.1f}",
+                     f"{result['p95_ms']:.1f}", result['errors']))
+
+    print(f"📦 {url.split(':')[0]}, {clients} clients, {seconds:.0f}s per server, {os.cpu_count()} CPU")
+    print_table(['server', 'first response, ms', 'req/s', 'p50, ms', 'p95, ms', 'errors'], rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Time-series report latency over a five-year history
+
+    python -m benchmarks.bench_timeseries [transactions]
+
+Times the SQL bucketing alone and the full report (series, rolling
+averages, deltas, forecast) for each bucket, with and without the
+category split, converted into BYN at daily USD/RUB rates. The last row
+is the naive approach for comparison: load the ledger and bucket it in
+Python.
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.common import make_engine, make_session, populate, median_ms, print_table
+from database import DatabaseManager
+import fx
+import reports
+
+# Full five-year report, any bucket, without the category split
+BUDGET_MS = 250
+
+def naive_groups(db_manager, user_id, start, end, bucket):
+    """Every transaction through the ORM, converted and bucketed one by one"""
+    rates = fx.get_rates(db_manager)
+    groups = {}
+    for t in db_manager.get_transactions_by_period(user_id, None, None):
+        day = t.date.date()
+        if start <= day <= end:
+            key = (reports.bucket_start(day, bucket), t.transaction_type, None)
+            total, count = groups.get(key, (0.0, 0))
+            groups[key] = (total + rates.convert(t.amount, t.currency, 'BYN', day), count + 1)
+    return [key + value for key, value in groups.items()]
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    years = 5
+
+    engine = make_engine('timeseries')
+    session = make_session(engine)
+    user_id = populate(session, users=1, transactions_per_user=transactions, days=years * 365)[0]
+    db_manager = DatabaseManager(session)
+
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=years * 365)
+    db_manager.upsert_fx_rates([
+        {'day': start + timedelta(days=n), 'currency': currency, 'rate': rate * (1 + n / 10000)}
+        for n in range(years * 365 + 1)
+        for currency, rate in (('USD', 3.2), ('RUB', 0.035))
+    ])
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"📦 {engine.dialect.name}: {transactions} transactions over {years} years, daily FX rates")
+
+    rows = []
+    for bucket in reports.BUCKETS:
+        for by_category in (False, True):
+            def groups():
+                return db_manager.get_timeseries_groups(user_id, start, end, bucket, by_category, 'BYN')
+
+            def report():
+                result, _ = groups()
+                return reports.build_timeseries(result, start, end, bucket, 3, by_category, end)
+
+            points = len(reports.bucket_range(start, end, bucket))
+            report_ms = median_ms(report, repeat=10)
+            within = '' if by_category else ('yes' if report_ms <= BUDGET_MS else 'NO')
+            rows.append((bucket, 'yes' if by_category else 'no', points, f'{len(groups()[0]):,}',
+                         f'{median_ms(groups, repeat=10):.1f}', f'{report_ms:.1f}', within))
+
+    started = time.perf_counter()
+    naive = naive_groups(db_manager, user_id, start, end, 'month')
+    reports.build_timeseries(naive, start, end, 'month', 3, False, end)
+    naive_ms = (time.perf_counter() - started) * 1000
+    rows.append(('month (naive)', 'no', len(reports.bucket_range(start, end, 'month')), f'{len(naive):,}',
+                 '', f'{naive_ms:.1f}', ''))
+
+    print_table(['bucket', 'by category', 'points', 'groups', 'query+convert, ms', 'full report, ms',
+                 f'<= {BUDGET_MS} ms'], rows)
+
+if __name__ == '__main__':
+    main()
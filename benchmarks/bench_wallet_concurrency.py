@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Many threads writing to one wallet: throughput and lost updates
+
+    python -m benchmarks.bench_wallet_concurrency [threads] [writes_per_thread]
+
+Runs the current create_transaction and, for comparison, the previous
+read-modify-write balance update with its two commits per write.
+"""
+
+import random
+import sys
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import case, func
+
+from benchmarks.common import make_engine, make_session, populate, print_table
+from database import DatabaseManager
+from models import Transaction, Wallet
+
+def legacy_create_transaction(db, user_id, wallet_id, transaction_type, amount):
+    """The previous flow: read the balance, add in Python, commit it, then commit again"""
+    transaction = Transaction(user_id=user_id, wallet_id=wallet_id, transaction_type=transaction_type,
+                              amount=amount, currency='BYN', date=datetime.utcnow())
+    db.add(transaction)
+    DatabaseManager(db)._apply_to_rollup(transaction, 1)
+    wallet = db.query(Wallet).filter(Wallet.id == wallet_id).first()
+    wallet.balance += amount if transaction_type == 'income' else -amount
+    db.commit()
+    db.commit()
+    db.refresh(transaction)
+
+def hammer(engine, user_id, wallet_id, threads, writes, legacy):
+    def worker(seed):
+        rng = random.Random(seed)
+        session = make_session(engine)
+        try:
+            for _ in range(writes):
+                transaction_type = 'income' if rng.random() < 0.3 else 'expense'
+                amount = rng.randrange(1, 10000) / 100
+                if legacy:
+                    legacy_create_transaction(session, user_id, wallet_id, transaction_type, amount)
+                else:
+                    DatabaseManager(session).create_transaction(user_id, wallet_id, transaction_type, amount, 'BYN')
+        finally:
+            session.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return time.perf_counter() - started
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    writes = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+    rows = []
+
+    for legacy in (True, False):
+        engine = make_engine('wallet-legacy' if legacy else 'wallet')
+        session = make_session(engine)
+        user_id = populate(session, users=1, transactions_per_user=0)[0]
+        wallet_id = DatabaseManager(session).get_user_wallets(user_id)[0].id
+        session.close()
+
+        elapsed = hammer(engine, user_id, wallet_id, threads, writes, legacy)
+
+        session = make_session(engine)
+        signed = case((Transaction.transaction_type == 'income', Transaction.amount), else_=-Transaction.amount)
+        ledger = session.query(func.sum(signed)).filter(Transaction.wallet_id == wallet_id).scalar()
+        balance = session.query(Wallet.balance).filter(Wallet.id == wallet_id).scalar()
+        count = session.query(func.count(Transaction.id)).filter(Transaction.wallet_id == wallet_id).scalar()
+        session.close()
+
+        rows.append((
+            'read-modify-write' if legacy else 'atomic',
+            count,
+            f'{count / elapsed:,.0f}',
+            f'{ledger:.2f}',
+            f'{balance:.2f}',
+            'yes' if abs(ledger - balance) < 0.005 else 'NO'
+        ))
+
+    print(f"📦 {engine.dialect.name}: {threads} threads × {writes} writes on one wallet")
+    print_table(['mode', 'writes', 'writes/s', 'ledger sum', 'balance', 'consistent'], rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from database import DatabaseManager
+from models import Base, User, Wallet, IncomeSource, ExpenseCategory, Transaction
+
+CURRENCIES = ['BYN', 'RUB', 'USD']
+CATEGORY_NAMES = ['Продукты', 'Транспорт', 'Жильё', 'Развлечения', 'Здоровье', 'Одежда']
+SOURCE_NAMES = ['Зарплата', 'Фриланс', 'Проценты']
+
+def make_engine(name='bench'):
+    """Create an empty benchmark database and return its engine"""
+    url = os.getenv('BENCH_DATABASE_URL')
+    if not url:
+        path = os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), f'{name}.db')
+        url = f'sqlite:///{path}'
+    # Concurrent benchmarks wait for SQLite's write lock instead of failing fast
+    connect_args = {'timeout': 60} if url.startswith('sqlite') else {}
+    engine = create_engine(url, connect_args=connect_args)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+def make_session(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+def populate(session, users=10, transactions_per_user=1000, days=365, seed=42):
+    """Insert users with wallets, categories, sources and random transactions.
+
+    Returns the list of created user ids. Wallet balances and daily rollups
+    match the ledger.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    first_telegram_id = rng.randrange(10**9, 2 * 10**9)
+    user_ids = []
+
+    for n in range(users):
+        user = User(telegram_id=first_telegram_id + n, first_name=f'User {n}')
+        wallets = [Wallet(user=user, name=f'Кошелёк {currency}', currency=currency) for currency in CURRENCIES]
+        categories = [ExpenseCategory(user=user, name=name) for name in CATEGORY_NAMES]
+        sources = [IncomeSource(user=user, name=name) for name in SOURCE_NAMES]
+        session.add_all([user] + wallets + categories + sources)
+        session.flush()
+
+        balances = {wallet.id: 0.0 for wallet in wallets}
+        rows = []
+        for _ in range(transactions_per_user):
+            wallet = rng.choice(wallets)
+            transaction_type = 'income' if rng.random() < 0.25 else 'expense'
+            amount = round(rng.uniform(1, 300 if transaction_type == 'expense' else 2000), 2)
+            balances[wallet.id] += amount if transaction_type == 'income' else -amount
+            rows.append({
+                'user_id': user.id,
+                'wallet_id': wallet.id,
+                'transaction_type': transaction_type,
+                'amount': amount,
+                'currency': wallet.currency,
+                'description': None,
+                'date': now - timedelta(seconds=rng.uniform(0, days * 86400)),
+                'created_at': now,
+                'updated_at': now,
+                'income_source_id': rng.choice(sources).id if transaction_type == 'income' else None,
+                'expense_category_id': rng.choice(categories).id if transaction_type == 'expense' else None
+            })
+        if rows:
+            session.execute(insert(Transaction), rows)
+        for wallet in wallets:
+            wallet.balance = balances[wallet.id]
+        user_ids.append(user.id)
+
+    session.commit()
+    DatabaseManager(session).rebuild_daily_rollups()
+    return user_ids
+
+def median_ms(func, repeat=20, warmup=2):
+    """Run func repeatedly and return the median wall time in milliseconds"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    line = '  '.join(f'{{:<{width}}}' for width in widths)
+    print(line.format(*headers))
+    print(line.format(*('-' * width for width in widths)))
+    for row in rows:
+        print(line.format(*row))
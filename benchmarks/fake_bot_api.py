@@ -0,0 +1,179 @@
+"""
+A local stand-in for the Telegram Bot API
+
+FakeBotAPI answers the methods the bot calls (getMe, sendMessage,
+setWebhook, ...) on 127.0.0.1 after an optional delay that plays the part
+of the round trip to Telegram, and records every call. Point a bot at it
+with Application.builder().token(TOKEN).base_url(api.base_url), or a bot
+process with TELEGRAM_TOKEN=TOKEN and BOT_API_URL=api.base_url. Updates
+given to push_updates() are served to long polling through getUpdates,
+and fail() makes sendMessage answer with an error (429 with retry_after,
+403, ...) the way Telegram does.
+
+make_command_update() builds the JSON of a private-chat command message,
+as Telegram would post it to a webhook.
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+TOKEN = '123456:TEST-TOKEN'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Finance', 'username': 'finance_test_bot',
+            'can_join_groups': False, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+
+def make_command_update(update_id: int, user_id: int, command: str = '/start') -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}', 'username': f'user{user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': user['first_name']},
+            'from': user,
+            'text': command,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command.split()[0])}]
+        }
+    }
+
+class APIError(Exception):
+    def __init__(self, error_code: int, description: str, retry_after: int = None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.retry_after = retry_after
+
+    def payload(self) -> dict:
+        payload = {'ok': False, 'error_code': self.error_code, 'description': self.description}
+        if self.retry_after is not None:
+            payload['parameters'] = {'retry_after': self.retry_after}
+        return payload
+
+class FakeBotAPI:
+    """Threaded HTTP server speaking enough of the Bot API for the bot's handlers"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = []
+        self.counts = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._condition = threading.Condition()
+        self._message_ids = iter(range(1, 10**9))
+        self._updates = []
+        self._failures = []
+        # (chat_id, text, perf_counter) of every message delivered
+        self.sent = []
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                params = dict(parse_qsl(self.rfile.read(length).decode()))
+                method = self.path.rsplit('/', 1)[-1]
+                try:
+                    status, payload = 200, {'ok': True, 'result': api.answer(method, params)}
+                except APIError as e:
+                    status, payload = e.error_code, e.payload()
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The bot went away in the middle of a long poll
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}/bot'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name='fake-bot-api')
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def answer(self, method: str, params: dict):
+        with self._condition:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if method == 'getMe':
+                return BOT_USER
+            if method == 'sendMessage':
+                chat_id = int(params['chat_id'])
+                self._maybe_fail(chat_id)
+                with self._condition:
+                    self.sent.append((chat_id, params.get('text', ''), time.perf_counter()))
+                return {'message_id': next(self._message_ids), 'date': int(time.time()),
+                        'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER, 'text': params.get('text', '')}
+            if method == 'getUpdates':
+                return self.get_updates(int(params.get('offset') or 0), float(params.get('timeout') or 0),
+                                        int(params.get('limit') or 100))
+            return True
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self.calls.append((method, params, time.perf_counter()))
+                self.counts[method] += 1
+                self._condition.notify_all()
+
+    def fail(self, error_code: int, description: str, chat_id: int = None, times: int = 1, retry_after: int = None):
+        """Answer the next times sendMessage calls (to chat_id, or to any chat) with an error"""
+        with self._condition:
+            self._failures.append([chat_id, times, APIError(error_code, description, retry_after)])
+
+    def _maybe_fail(self, chat_id: int):
+        with self._condition:
+            for failure in self._failures:
+                if failure[0] in (None, chat_id) and failure[1] > 0:
+                    failure[1] -= 1
+                    raise failure[2]
+
+    def push_updates(self, updates: list):
+        """Queue update dicts (see make_command_update) for the next getUpdates"""
+        with self._condition:
+            self._updates.extend(updates)
+            self._condition.notify_all()
+
+    def get_updates(self, offset: int, timeout: float, limit: int) -> list:
+        # Long polling: updates below offset are confirmed and dropped; wait up to a second for new ones
+        deadline = time.monotonic() + min(timeout, 1.0)
+        with self._condition:
+            while True:
+                self._updates = [update for update in self._updates if update['update_id'] >= offset]
+                remaining = deadline - time.monotonic()
+                if self._updates or remaining <= 0:
+                    return self._updates[:limit]
+                self._condition.wait(remaining)
+
+    def count(self, method: str) -> int:
+        with self._condition:
+            return self.counts[method]
+
+    def wait_for(self, method: str, count: int, timeout: float = 60) -> bool:
+        """Block until method has been called count times"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.counts[method] < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: every DatabaseManager method and every API route
+
+    python -m benchmarks.suite [--users N] [--transactions M] [--seed S]
+                               [--output results.json] [--baseline baseline.json]
+                               [--threshold 0.25]
+
+Generates N users × M transactions with benchmarks.common.populate (the
+same seed gives the same data), then times each DatabaseManager method and
+each Flask route through the test client. It runs on a temporary SQLite
+file and on PostgreSQL when one answers at BENCH_POSTGRES_URL (default
+postgresql://postgres@localhost/finance_bot_bench; its tables are dropped
+and recreated). Every database runs in its own process, because the app
+binds its engine to DATABASE_URL at import.
+
+Results are written as JSON. With --baseline, every timing is compared to
+the stored one; a median slower by more than the threshold (and by more
+than 0.5 ms) is a regression and the exit status is 1. Summary and ledger
+caches are turned off so that the computations themselves are timed.
+"""
+
+import argparse
+import contextlib
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl, urlsplit
+
+DEFAULT_POSTGRES_URL = 'postgresql://postgres@localhost/finance_bot_bench'
+
+# Slower medians below this many milliseconds are noise, whatever the ratio
+NOISE_FLOOR_MS = 0.5
+
+def measure(call, setup=None, repeat=20, warmup=2) -> dict:
+    """Median, 95th percentile and minimum of call() in milliseconds; setup() runs untimed before each call"""
+    samples = []
+    for n in range(warmup + repeat):
+        argument = setup() if setup else None
+        started = time.perf_counter()
+        call(argument) if setup else call()
+        elapsed = (time.perf_counter() - started) * 1000
+        if n >= warmup:
+            samples.append(elapsed)
+    samples.sort()
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'min_ms': round(samples[0], 3),
+        'runs': len(samples)
+    }
+
+def method_cases(db_manager, fixture):
+    """(name, call, setup) for DatabaseManager; the name up to '[' is the method"""
+    from cache import user_cache
+    from database import encode_cursor
+    from ledger import ledger_cache
+
+    user_id, telegram_id = fixture['user_id'], fixture['telegram_id']
+    wallet_id, category_id, source_id = fixture['wallet_id'], fixture['category_id'], fixture['source_id']
+    now = datetime.utcnow()
+    month_ago, year_ago = now - timedelta(days=30), now - timedelta(days=365)
+    oldest_page = db_manager.get_user_transactions(user_id, 50)[-1]
+    cursor = encode_cursor(oldest_page.date, oldest_page.id)
+    bulk_rows = [{
+        'wallet_id': wallet_id, 'transaction_type': 'expense', 'amount': 1.0 + n, 'currency': 'BYN',
+        'description': None, 'date': now - timedelta(hours=n), 'income_source_id': None,
+        'expense_category_id': category_id
+    } for n in range(100)]
+    rates = [{'day': (now - timedelta(days=n)).date(), 'currency': 'USD', 'rate': 3.2} for n in range(30)]
+    currencies = iter(['USD', 'BYN'] * 1000)
+
+    def new_transaction():
+        return db_manager.create_transaction(user_id, wallet_id, 'expense', 1.0, 'BYN',
+                                             expense_category_id=category_id).id
+
+    def cold_ledger():
+        ledger_cache.maxsize = 1
+        try:
+            ledger_cache.clear()
+            return db_manager.get_ledger(user_id)
+        finally:
+            ledger_cache.maxsize = 0
+
+    return [
+        ('get_or_create_user', lambda: db_manager.get_or_create_user(telegram_id), None),
+        ('get_user', lambda: db_manager.get_user(telegram_id), None),
+        ('resolve_user[uncached]', lambda _: db_manager.resolve_user(telegram_id), user_cache.clear),
+        ('resolve_user[cached]', lambda: db_manager.resolve_user(telegram_id), None),
+        ('update_user_currency', lambda: db_manager.update_user_currency(telegram_id, next(currencies)), None),
+        ('create_wallet', lambda: db_manager.create_wallet(user_id, 'Bench', 'BYN'), None),
+        ('get_user_wallets', lambda: db_manager.get_user_wallets(user_id), None),
+        ('update_wallet_balance', lambda: db_manager.update_wallet_balance(wallet_id, 0.0), None),
+        ('delete_wallet', lambda created: db_manager.delete_wallet(created, user_id),
+         lambda: db_manager.create_wallet(user_id, 'Bench', 'BYN').id),
+        ('create_income_source', lambda: db_manager.create_income_source(user_id, 'Bench'), None),
+        ('get_user_income_sources', lambda: db_manager.get_user_income_sources(user_id), None),
+        ('delete_income_source', lambda created: db_manager.delete_income_source(created, user_id),
+         lambda: db_manager.create_income_source(user_id, 'Bench').id),
+        ('create_expense_category', lambda: db_manager.create_expense_category(user_id, 'Bench'), None),
+        ('get_user_expense_categories', lambda: db_manager.get_user_expense_categories(user_id), None),
+        ('delete_expense_category', lambda created: db_manager.delete_expense_category(created, user_id),
+         lambda: db_manager.create_expense_category(user_id, 'Bench').id),
+        ('create_transaction', new_transaction, None),
+        ('bulk_create_transactions[100]', lambda: db_manager.bulk_create_transactions(user_id, bulk_rows), None),
+        ('get_user_transactions[50]', lambda: db_manager.get_user_transactions(user_id, 50), None),
+        ('get_user_transactions[offset 1000]', lambda: db_manager.get_user_transactions(user_id, 50, 1000), None),
+        ('get_user_transactions_page[2nd page]',
+         lambda: db_manager.get_user_transactions_page(user_id, 50, cursor), None),
+        ('get_transactions_by_period[30d]',
+         lambda: db_manager.get_transactions_by_period(user_id, month_ago, now), None),
+        ('iter_transactions_by_period[365d]',
+         lambda: sum(1 for _ in db_manager.iter_transactions_by_period(user_id, year_ago, now)), None),
+        ('delete_transaction', lambda created: db_manager.delete_transaction(created, user_id), new_transaction),
+        ('bump_version', lambda: (db_manager.bump_version(user_id, 'wallets'), db_manager.db.commit()), None),
+        ('get_versions', lambda: db_manager.get_versions(user_id), None),
+        ('get_version', lambda: db_manager.get_version(user_id, 'wallets'), None),
+        ('get_timeseries_groups[month 365d BYN]',
+         lambda: db_manager.get_timeseries_groups(user_id, year_ago.date(), now.date(), 'month', True, 'BYN'), None),
+        ('get_ledger[cold load]', cold_ledger, None),
+        ('upsert_fx_rates[30]', lambda: db_manager.upsert_fx_rates(rates), None),
+        ('get_fx_rates', lambda: db_manager.get_fx_rates(), None),
+        ('rebuild_daily_rollups[user]', lambda: db_manager.rebuild_daily_rollups(user_id), None),
+        ('get_user_summary[30d]', lambda: db_manager.get_user_summary(user_id, 30), None),
+        ('get_user_summary[365d BYN]', lambda: db_manager.get_user_summary(user_id, 365, 'BYN'), None),
+        ('get_period_summary[all]', lambda: db_manager.get_period_summary(user_id, datetime(2000, 1, 1), now), None),
+        ('get_net_worth', lambda: db_manager.get_net_worth(user_id, 'BYN'), None),
+        ('get_balances_at[1y ago]', lambda: db_manager.get_balances_at(user_id, year_ago), None),
+        ('get_wallet_balances', lambda: db_manager.get_wallet_balances(user_id), None),
+    ]
+
+def route_cases(client, db_manager, fixture, admin_headers):
+    """(rule, method, request, setup): request(argument) returns test client kwargs"""
+    base = f"/api/user/{fixture['telegram_id']}"
+    user_id = fixture['user_id']
+    transaction = {'wallet_id': fixture['wallet_id'], 'transaction_type': 'expense', 'amount': 12.5,
+                   'currency': 'BYN', 'expense_category_id': fixture['category_id']}
+    now = datetime.utcnow()
+    import_csv = 'date,type,amount,currency,wallet_id\n' + ''.join(
+        f"{(now - timedelta(hours=n)).isoformat()},expense,{n + 1},BYN,{fixture['wallet_id']}\n" for n in range(100))
+    page = client.get(base + '/transactions?limit=50&cursor=').get_json()
+
+    def created(kind, name):
+        return lambda: getattr(db_manager, f'create_{kind}')(user_id, name, *(('BYN',) if kind == 'wallet' else ())).id
+
+    user_rule = '/api/user/<int:telegram_id>'
+    return [
+        ('/', 'GET', lambda _: {'path': '/'}, None),
+        (user_rule, 'GET', lambda _: {'path': base}, None),
+        (user_rule, 'POST', lambda _: {'path': base, 'json': {'first_name': 'Bench'}}, None),
+        (user_rule + '/currency', 'PUT', lambda _: {'path': base + '/currency', 'json': {'currency': 'BYN'}}, None),
+        (user_rule + '/wallets', 'GET', lambda _: {'path': base + '/wallets'}, None),
+        (user_rule + '/wallets', 'POST',
+         lambda _: {'path': base + '/wallets', 'json': {'name': 'Bench', 'currency': 'BYN'}}, None),
+        (user_rule + '/wallets/<int:wallet_id>', 'DELETE',
+         lambda wallet_id: {'path': f'{base}/wallets/{wallet_id}'}, created('wallet', 'Bench')),
+        (user_rule + '/income-sources', 'GET', lambda _: {'path': base + '/income-sources'}, None),
+        (user_rule + '/income-sources', 'POST',
+         lambda _: {'path': base + '/income-sources', 'json': {'name': 'Bench'}}, None),
+        (user_rule + '/income-sources/<int:source_id>', 'DELETE',
+         lambda source_id: {'path': f'{base}/income-sources/{source_id}'}, created('income_source', 'Bench')),
+        (user_rule + '/expense-categories', 'GET', lambda _: {'path': base + '/expense-categories'}, None),
+        (user_rule + '/expense-categories', 'POST',
+         lambda _: {'path': base + '/expense-categories', 'json': {'name': 'Bench'}}, None),
+        (user_rule + '/expense-categories/<int:category_id>', 'DELETE',
+         lambda category_id: {'path': f'{base}/expense-categories/{category_id}'},
+         created('expense_category', 'Bench')),
+        (user_rule + '/transactions', 'GET', lambda _: {'path': base + '/transactions?limit=50'}, None),
+        (user_rule + '/transactions', 'GET',
+         lambda _: {'path': base + '/transactions?limit=50&cursor=' + page['next_cursor']}, None),
+        (user_rule + '/transactions', 'POST', lambda _: {'path': base + '/transactions', 'json': transaction}, None),
+        (user_rule + '/transactions/import', 'POST',
+         lambda _: {'path': base + '/transactions/import?format=csv', 'data': import_csv}, None),
+        (user_rule + '/transactions/<int:transaction_id>', 'DELETE',
+         lambda transaction_id: {'path': f'{base}/transactions/{transaction_id}'},
+         lambda: db_manager.create_transaction(user_id, fixture['wallet_id'], 'expense', 1.0, 'BYN').id),
+        (user_rule + '/export', 'GET', lambda _: {'path': base + '/export?format=csv'}, None),
+        (user_rule + '/summary', 'GET', lambda _: {'path': base + '/summary'}, None),
+        (user_rule + '/summary', 'GET', lambda _: {'path': base + '/summary?period=365&currency=USD'}, None),
+        (user_rule + '/timeseries', 'GET', lambda _: {'path': base + '/timeseries?bucket=month'}, None),
+        (user_rule + '/timeseries', 'GET',
+         lambda _: {'path': base + '/timeseries?bucket=day&by_category=1'}, None),
+        (user_rule + '/bootstrap', 'GET', lambda _: {'path': base + '/bootstrap'}, None),
+        ('/api/currencies', 'GET', lambda _: {'path': '/api/currencies'}, None),
+        ('/api/admin/fx-rates', 'GET', lambda _: {'path': '/api/admin/fx-rates', 'headers': admin_headers}, None),
+        ('/api/admin/fx-rates', 'POST', lambda _: {
+            'path': '/api/admin/fx-rates', 'headers': admin_headers,
+            'data': 'date,currency,rate\n' + now.date().isoformat() + ',USD,3.2\n'
+        }, None),
+        ('/api/admin/cache', 'GET', lambda _: {'path': '/api/admin/cache', 'headers': admin_headers}, None),
+        ('/api/admin/slow-queries', 'GET',
+         lambda _: {'path': '/api/admin/slow-queries', 'headers': admin_headers}, None),
+        ('/metrics', 'GET', lambda _: {'path': '/metrics'}, None),
+    ]
+
+def route_key(method: str, rule: str, path: str) -> str:
+    """Stable name of a route case: method, rule and the query without cursor values"""
+    params = [name if name == 'cursor' else f'{name}={value}'
+              for name, value in parse_qsl(urlsplit(path).query, keep_blank_values=True)]
+    return f"{method} {rule}" + ('?' + '&'.join(params) if params else '')
+
+def run_worker(args) -> dict:
+    """Populate the database at DATABASE_URL and time everything; runs in a child process"""
+    from benchmarks.common import populate
+    from cache import result_cache
+    from config import Config
+    from database import DatabaseManager
+    from models import Base, SessionLocal, Wallet, ExpenseCategory, IncomeSource, User, engine
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    started = time.perf_counter()
+    user_ids = populate(session, users=args.users, transactions_per_user=args.transactions, days=2 * 365,
+                        seed=args.seed)
+    populate_s = time.perf_counter() - started
+    user_id = user_ids[0]
+    fixture = {
+        'user_id': user_id,
+        'telegram_id': session.query(User.telegram_id).filter(User.id == user_id).scalar(),
+        'wallet_id': session.query(Wallet.id).filter(Wallet.user_id == user_id, Wallet.currency == 'BYN').scalar(),
+        'category_id': session.query(ExpenseCategory.id).filter(ExpenseCategory.user_id == user_id).first()[0],
+        'source_id': session.query(IncomeSource.id).filter(IncomeSource.user_id == user_id).first()[0]
+    }
+    result_cache.backend = None
+    Config.ADMIN_TOKEN = 'bench'
+
+    import webapp
+    client = webapp.app.test_client()
+    db_manager = DatabaseManager(session)
+
+    methods = {}
+    for name, call, setup in method_cases(db_manager, fixture):
+        methods[name] = measure(call, setup, repeat=args.repeat)
+        session.rollback()
+
+    routes = {}
+    for rule, method, make_request, setup in route_cases(client, db_manager, fixture, {'X-Admin-Token': 'bench'}):
+        def call(argument=None, make_request=make_request, method=method):
+            kwargs = make_request(argument)
+            response = client.open(method=method, **kwargs)
+            response.get_data()
+            assert response.status_code < 400, (method, kwargs['path'], response.status_code)
+        routes[route_key(method, rule, make_request(None)['path'])] = \
+            dict(measure(call, setup, repeat=args.repeat), rule=rule)
+
+    public_methods = {name for name, _ in inspect.getmembers(DatabaseManager, inspect.isfunction)
+                      if not name.startswith('_')}
+    covered_methods = {name.split('[')[0] for name in methods}
+    api_routes = {(rule.rule, method) for rule in webapp.app.url_map.iter_rules() if rule.endpoint != 'static'
+                  for method in rule.methods - {'HEAD', 'OPTIONS'}}
+    covered_routes = {(timing['rule'], key.split(' ')[0]) for key, timing in routes.items()}
+    session.close()
+
+    return {
+        'status': 'ok',
+        'dialect': engine.dialect.name,
+        'populate_s': round(populate_s, 2),
+        'methods': methods,
+        'routes': routes,
+        'not_covered': {
+            'methods': sorted(public_methods - covered_methods),
+            'routes': sorted(f'{method} {rule}' for rule, method in api_routes - covered_routes)
+        }
+    }
+
+def postgres_url():
+    url = os.getenv('BENCH_POSTGRES_URL') or DEFAULT_POSTGRES_URL
+    try:
+        from sqlalchemy import create_engine
+        probe = create_engine(url, connect_args={'connect_timeout': 2})
+        with probe.connect():
+            pass
+        probe.dispose()
+        return url, None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {str(e).strip().splitlines()[0] if str(e).strip() else ""}'
+
+def run_database(name, url, args) -> dict:
+    print(f"⏱️  {name}: {args.users} users × {args.transactions} transactions...", file=sys.stderr)
+    # The app prints while it starts, so results come back in a file rather than on stdout
+    output = os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), f'{name}.json')
+    command = [sys.executable, '-m', 'benchmarks.suite', '--worker', output,
+               '--users', str(args.users), '--transactions', str(args.transactions),
+               '--seed', str(args.seed), '--repeat', str(args.repeat)]
+    env = dict(os.environ, DATABASE_URL=url)
+    completed = subprocess.run(command, env=env, stdout=sys.stderr)
+    if completed.returncode != 0:
+        return {'status': 'failed', 'reason': f'worker exited with {completed.returncode}'}
+    with open(output, encoding='utf-8') as f:
+        return json.load(f)
+
+def compare(results: dict, baseline: dict) -> list:
+    """(database, section, name, baseline ms, current ms, ratio) for every timing in both runs"""
+    rows = []
+    for database, current in results['databases'].items():
+        previous = baseline.get('databases', {}).get(database, {})
+        for section in ('methods', 'routes'):
+            for name, timing in current.get(section, {}).items():
+                if name in previous.get(section, {}):
+                    before, after = previous[section][name]['median_ms'], timing['median_ms']
+                    rows.append((database, section, name, before, after, after / before if before else float('inf')))
+    return rows
+
+def is_regression(row, threshold: float) -> bool:
+    _, _, _, before, after, ratio = row
+    return ratio > 1 + threshold and after - before > NOISE_FLOOR_MS
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--transactions', type=int, default=5000, help='per user')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='write the results JSON here (default: stdout)')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, 0.25 = 25%%')
+    parser.add_argument('--worker', metavar='OUTPUT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker, 'w', encoding='utf-8') as f:
+            json.dump(run_worker(args), f)
+        return
+
+    from benchmarks.common import print_table
+
+    results = {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'users': args.users,
+            'transactions_per_user': args.transactions,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'machine': f'{platform.system()} {platform.machine()}, {os.cpu_count()} CPU'
+        },
+        'databases': {}
+    }
+    sqlite_path = os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), 'suite.db')
+    results['databases']['sqlite'] = run_database('sqlite', f'sqlite:///{sqlite_path}', args)
+    url, reason = postgres_url()
+    if url:
+        results['databases']['postgresql'] = run_database('postgresql', url, args)
+    else:
+        print(f"⚠️  PostgreSQL skipped ({reason})", file=sys.stderr)
+        results['databases']['postgresql'] = {'status': 'skipped', 'reason': reason}
+
+    for database, result in results['databases'].items():
+        for kind, missing in result.get('not_covered', {}).items():
+            if missing:
+                print(f"⚠️  {database}: {kind} without a benchmark: {', '.join(missing)}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"💾 Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline)
+        regressions = [row for row in rows if is_regression(row, args.threshold)]
+        changed = [row for row in rows if is_regression(row, args.threshold) or row[5] < 1 / (1 + args.threshold)]
+        if changed:
+            with contextlib.redirect_stdout(sys.stderr):
+                print_table(['database', 'section', 'name', 'baseline, ms', 'now, ms', 'ratio'], [
+                    (database, section, name, f'{before:.2f}', f'{after:.2f}',
+                     f'{ratio:.2f}x' + ('  ❌' if row in regressions else ''))
+                    for row in changed
+                    for database, section, name, before, after, ratio in [row]
+                ])
+        print(f"{'❌' if regressions else '✅'} {len(regressions)} regressions in {len(rows)} timings "
+              f"(threshold {args.threshold:.0%}, noise floor {NOISE_FLOOR_MS} ms)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
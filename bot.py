@@ -1,10 +1,19 @@
 import asyncio
+import contextvars
+import functools
+import html
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional
 from telegram import Update, WebAppInfo, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from models import get_db, create_tables
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes
+from models import SessionLocal, AsyncSessionLocal, dispose_async_engine
 from database import DatabaseManager
+from async_database import AsyncDatabaseManager
 from config import Config
+from notifications import Dispatcher
+import metrics
 import os
 
 # Configure logging
@@ -14,29 +23,170 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Create database tables
-create_tables()
+# /report periods by name; a number of days is accepted too
+REPORT_PERIODS = {'week': 7, 'неделя': 7, 'month': 30, 'месяц': 30,
+                  'quarter': 90, 'квартал': 90, 'year': 365, 'год': 365}
+MAX_REPORT_DAYS = 3660
+# Categories and sources listed in a report; the rest are summed up as one line
+REPORT_BREAKDOWN_LINES = 5
+
+def parse_period(args: List[str]) -> Optional[int]:
+    """Days of a /report period ('30', 'month', 'год'...; 30 by default), None if not understood"""
+    if not args:
+        return 30
+    period = args[0].lower()
+    if period.isdecimal():
+        days = int(period)
+        return days if 1 <= days <= MAX_REPORT_DAYS else None
+    return REPORT_PERIODS.get(period)
+
+def format_amount(amount: float, currency: str) -> str:
+    return f"{amount:,.2f}".replace(',', ' ') + f" {currency}"
+
+def balance_data(db_manager: DatabaseManager, telegram_id: int):
+    """(wallet balances, net worth in the user's currency), or None for an unknown user"""
+    user = db_manager.resolve_user(telegram_id)
+    if user is None:
+        return None
+    return db_manager.get_wallet_balances(user.id), db_manager.get_net_worth(user.id, user.default_currency)
+
+def summary_data(db_manager: DatabaseManager, telegram_id: int, period_days: int = None) -> Optional[dict]:
+    """Summary in the user's currency of today (UTC) or the last period_days, or None for an unknown user.
+    
+    Both come from result_cache, computed from daily rollups on a miss.
+    """
+    user = db_manager.resolve_user(telegram_id)
+    if user is None:
+        return None
+    if period_days is None:
+        return db_manager.get_day_summary(user.id, datetime.utcnow().date(), user.default_currency)
+    return db_manager.get_user_summary(user.id, period_days, user.default_currency)
+
+def balance_message(balances: List[dict], net_worth: dict) -> str:
+    if not balances:
+        return "💳 У вас пока нет кошельков. Создайте их в приложении: /menu"
+    lines = ["💳 <b>Балансы:</b>", ""]
+    lines += [f"• {html.escape(wallet['name'])}: {format_amount(wallet['balance'] or 0.0, wallet['currency'])}"
+              for wallet in balances]
+    lines += ["", f"💰 <b>Всего:</b> {format_amount(net_worth['total'], net_worth['currency'])}"]
+    if net_worth['unconverted_currencies']:
+        lines.append(f"<i>Без пересчёта по курсу: {', '.join(net_worth['unconverted_currencies'])}</i>")
+    return "\n".join(lines)
+
+def breakdown_lines(amounts: dict, currency: str) -> List[str]:
+    ranked = sorted(amounts.items(), key=lambda item: -item[1])
+    lines = [f"• {html.escape(name)}: {format_amount(amount, currency)}"
+             for name, amount in ranked[:REPORT_BREAKDOWN_LINES]]
+    rest = ranked[REPORT_BREAKDOWN_LINES:]
+    if rest:
+        lines.append(f"• остальное ({len(rest)}): {format_amount(sum(amount for name, amount in rest), currency)}")
+    return lines
+
+def summary_message(title: str, summary: dict) -> str:
+    if not summary['transaction_count']:
+        return f"{title}\n\nОпераций за этот период нет."
+    currency = summary['currency']
+    lines = [title, "",
+             f"📈 Доходы: {format_amount(summary['total_income'], currency)}",
+             f"📉 Расходы: {format_amount(summary['total_expense'], currency)}",
+             f"💰 Итог: {format_amount(summary['net_income'], currency)}",
+             f"🧾 Операций: {summary['transaction_count']}"]
+    if summary['expenses_by_category']:
+        lines += ["", "🏷️ <b>Расходы по категориям:</b>"] + breakdown_lines(summary['expenses_by_category'], currency)
+    if summary['income_by_source']:
+        lines += ["", "💼 <b>Доходы по источникам:</b>"] + breakdown_lines(summary['income_by_source'], currency)
+    if summary['unconverted_currencies']:
+        lines += ["", f"<i>Без пересчёта по курсу: {', '.join(summary['unconverted_currencies'])}</i>"]
+    return "\n".join(lines)
 
 class FinanceBot:
-    def __init__(self):
-        self.application = Application.builder().token(Config.TELEGRAM_TOKEN).build()
+    def __init__(self, builder=None):
+        """builder: ApplicationBuilder with the token set (tests point it at a fake Bot API)"""
+        if builder is None:
+            builder = Application.builder().token(Config.TELEGRAM_TOKEN)
+            if Config.BOT_API_URL:
+                builder = builder.base_url(Config.BOT_API_URL)
+        concurrency = max(Config.BOT_CONCURRENT_UPDATES, 1)
+        # Up to BOT_CONCURRENT_UPDATES updates are handled at once and NOTIFY_CONCURRENCY notifications
+        # sent; each may hold a Bot API connection
+        self.application = (builder
+                            .concurrent_updates(concurrency)
+                            .connection_pool_size(concurrency + Config.NOTIFY_CONCURRENCY + 1)
+                            .post_init(self.on_startup)
+                            .post_stop(self.stop_notifications)
+                            .post_shutdown(self.shutdown_db)
+                            .build())
+        # Handlers share one event loop: database calls either await the async engine or
+        # run in a thread pool, never block the loop (unless BOT_DB_THREADS=0)
+        self.async_db = Config.BOT_DB_LAYER == 'async'
+        self.db_pool = ThreadPoolExecutor(Config.BOT_DB_THREADS, thread_name_prefix='bot-db') \
+            if not self.async_db and Config.BOT_DB_THREADS > 0 else None
+        self.notifications = Dispatcher(self.application.bot, self.call_db)
         self.setup_handlers()
     
+    async def call_db(self, operation, *args, **kwargs):
+        """DatabaseManager operation (e.g. DatabaseManager.get_user) through the configured BOT_DB_LAYER"""
+        if self.async_db:
+            async with AsyncSessionLocal() as session:
+                return await AsyncDatabaseManager(session).run(operation, *args, **kwargs)
+        return await self.run_db(self.call_sync, operation, *args, **kwargs)
+    
+    @staticmethod
+    def call_sync(operation, *args, **kwargs):
+        with SessionLocal() as db:
+            return operation(DatabaseManager(db), *args, **kwargs)
+    
+    async def run_db(self, func, *args, **kwargs):
+        """Run blocking database work in the pool (inline when BOT_DB_THREADS=0), keeping contextvars"""
+        call = functools.partial(func, *args, **kwargs)
+        if self.db_pool is None:
+            return call()
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.db_pool, context.run, call)
+    
+    async def on_startup(self, application: Application):
+        self.notifications.start()
+        await self.mark_ready(application)
+    
+    async def stop_notifications(self, application: Application):
+        # Before the bot's HTTP client closes, so sends in flight can finish
+        await self.notifications.stop()
+    
+    async def mark_ready(self, application: Application):
+        """Touch BOT_READY_FILE once the token is verified; the supervisor waits for it"""
+        if Config.BOT_READY_FILE:
+            with open(Config.BOT_READY_FILE, 'w') as f:
+                f.write(str(os.getpid()))
+    
+    async def shutdown_db(self, application: Application):
+        if self.db_pool is not None:
+            self.db_pool.shutdown(wait=True)
+        await dispose_async_engine()
+    
     def setup_handlers(self):
         """Setup bot command handlers"""
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("menu", self.menu_command))
-        self.application.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, self.handle_webapp_data))
+        # Group -1 sees every update before the handlers below
+        self.application.add_handler(TypeHandler(Update, self.count_update), group=-1)
+        self.application.add_handler(CommandHandler("start", metrics.instrument_handler("start", self.start_command)))
+        self.application.add_handler(CommandHandler("help", metrics.instrument_handler("help", self.help_command)))
+        self.application.add_handler(CommandHandler("menu", metrics.instrument_handler("menu", self.menu_command)))
+        self.application.add_handler(CommandHandler("balance", metrics.instrument_handler("balance", self.balance_command)))
+        self.application.add_handler(CommandHandler("today", metrics.instrument_handler("today", self.today_command)))
+        self.application.add_handler(CommandHandler("report", metrics.instrument_handler("report", self.report_command)))
+        self.application.add_handler(MessageHandler(
+            filters.StatusUpdate.WEB_APP_DATA, metrics.instrument_handler("web_app_data", self.handle_webapp_data)))
+    
+    async def count_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Count received updates by type for /metrics"""
+        metrics.count_update(update)
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         user = update.effective_user
         
         # Create or get user from database
-        db = next(get_db())
-        db_manager = DatabaseManager(db)
-        db_user = db_manager.get_or_create_user(
+        await self.call_db(
+            DatabaseManager.get_or_create_user,
             telegram_id=user.id,
             username=user.username,
             first_name=user.first_name,
@@ -81,6 +231,9 @@ class FinanceBot:
 🤖 <b>Справка по командам:</b>
 
 /start - Запустить бота и открыть приложение
+/balance - Балансы кошельков
+/today - Доходы и расходы за сегодня
+/report [период] - Отчёт за 7, 30, 365... дней или week / month / year (по умолчанию 30 дней)
 /menu - Показать главное меню
 /help - Показать эту справку
 
@@ -140,6 +293,42 @@ class FinanceBot:
             parse_mode='HTML'
         )
     
+    async def balance_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /balance command"""
+        data = await self.call_db(balance_data, update.effective_user.id)
+        if data is None:
+            await self.reply_unknown_user(update)
+            return
+        await update.message.reply_text(balance_message(*data), parse_mode='HTML')
+    
+    async def today_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /today command"""
+        summary = await self.call_db(summary_data, update.effective_user.id)
+        if summary is None:
+            await self.reply_unknown_user(update)
+            return
+        await update.message.reply_text(summary_message("📅 <b>Сегодня</b>", summary), parse_mode='HTML')
+    
+    async def report_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /report [period] command"""
+        period_days = parse_period(context.args)
+        if period_days is None:
+            await update.message.reply_text(
+                f"❓ Укажите период: число дней от 1 до {MAX_REPORT_DAYS} или week, month, quarter, year. "
+                "Например: /report 7",
+                parse_mode='HTML'
+            )
+            return
+        summary = await self.call_db(summary_data, update.effective_user.id, period_days)
+        if summary is None:
+            await self.reply_unknown_user(update)
+            return
+        await update.message.reply_text(
+            summary_message(f"📊 <b>Отчёт за {period_days} дн.</b>", summary), parse_mode='HTML')
+    
+    async def reply_unknown_user(self, update: Update):
+        await update.message.reply_text("👋 Сначала отправьте /start, чтобы создать профиль.", parse_mode='HTML')
+    
     async def handle_webapp_data(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle web app data"""
         try:
@@ -161,21 +350,32 @@ class FinanceBot:
                 parse_mode='HTML'
             )
     
-    async def send_notification(self, user_id: int, message: str):
-        """Send notification to user"""
-        try:
-            await self.application.bot.send_message(
-                chat_id=user_id,
-                text=message,
-                parse_mode='HTML'
-            )
-        except Exception as e:
-            logger.error(f"Error sending notification to {user_id}: {e}")
+    async def send_notification(self, user_id: int, message: str, kind: str = 'message', dedup_key: str = None) -> int:
+        """Queue a notification to a user's chat; the dispatcher sends it within the rate limits.
+        
+        Returns 1, or 0 when dedup_key was queued before.
+        """
+        return await self.notifications.enqueue(user_id, message, kind=kind, dedup_key=dedup_key)
     
     def run(self):
         """Run the bot"""
-        logger.info("Starting Finance Bot...")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if Config.BOT_MODE == 'webhook':
+            if not Config.BOT_WEBHOOK_URL:
+                raise RuntimeError("BOT_MODE=webhook needs BOT_WEBHOOK_URL")
+            logger.info(f"Starting Finance Bot with a webhook on port {Config.BOT_WEBHOOK_PORT}...")
+            # Telegram posts updates to BOT_WEBHOOK_URL/<path>; a proxy forwards them to this listener
+            self.application.run_webhook(
+                listen=Config.BOT_WEBHOOK_LISTEN,
+                port=Config.BOT_WEBHOOK_PORT,
+                url_path=Config.BOT_WEBHOOK_PATH,
+                webhook_url=f"{Config.BOT_WEBHOOK_URL.rstrip('/')}/{Config.BOT_WEBHOOK_PATH}",
+                secret_token=Config.BOT_WEBHOOK_SECRET or None,
+                max_connections=Config.BOT_CONCURRENT_UPDATES,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            logger.info("Starting Finance Bot with long polling...")
+            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 def main():
     """Main function"""
@@ -183,6 +383,10 @@ def main():
         logger.error("TELEGRAM_TOKEN not set in environment variables")
         return
     
+    if Config.BOT_METRICS_PORT:
+        metrics.serve(Config.BOT_METRICS_PORT)
+        logger.info(f"Serving metrics on port {Config.BOT_METRICS_PORT}")
+    
     bot = FinanceBot()
     bot.run()
 
@@ -0,0 +1,186 @@
+"""
+In-process caches shared by the web app and the bot
+
+Each gunicorn worker keeps its own copy. Writes invalidate the local copy
+only, so other workers may serve a stale entry until its TTL expires.
+
+result_cache memoizes summaries under keys that embed the user's
+data_versions, so any transaction, wallet or category write makes the
+old entries unreachable in every worker. It keeps them in process by
+default or, with RESULT_CACHE_URL, in a redis shared by all workers.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from config import Config
+import metrics
+
+CachedUser = namedtuple('CachedUser', ['id', 'default_currency'])
+
+class LRUCache:
+    """Thread-safe LRU mapping whose entries expire after ttl seconds"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, self.clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+class RedisBackend:
+    """Result cache backend shared by all workers, on a redis client.
+    
+    Values are stored as JSON and expire after ttl seconds; size is bounded
+    by the server's maxmemory with an LRU eviction policy.
+    """
+
+    def __init__(self, client, ttl: float = 60.0, prefix: str = 'finance-bot:result:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), px=max(int(self.ttl * 1000), 1))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self) -> dict:
+        return {'ttl': self.ttl}
+
+class ResultCache:
+    """get_or_compute() over a pluggable backend, with hit ratio and latency counters"""
+
+    def __init__(self, backend=None, clock=time.perf_counter):
+        self.backend = backend
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.hits = self.misses = 0
+        self.hit_seconds = self.miss_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None and getattr(self.backend, 'maxsize', 1) > 0
+
+    def get_or_compute(self, key: str, compute):
+        """Cached value of key, or compute() stored under it. Callers must not mutate the result."""
+        if not self.enabled:
+            return compute()
+        started = self.clock()
+        value = self.backend.get(key)
+        hit = value is not None
+        if not hit:
+            value = compute()
+            self.backend.set(key, value)
+        elapsed = self.clock() - started
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_seconds += elapsed
+            else:
+                self.misses += 1
+                self.miss_seconds += elapsed
+        return value
+
+    def clear(self):
+        """Drop every entry; the counters keep running"""
+        if self.backend is not None:
+            self.backend.clear()
+
+    def reset(self):
+        self.clear()
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'backend': type(self.backend).__name__ if self.backend is not None else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'avg_hit_ms': self.hit_seconds / self.hits * 1000 if self.hits else 0.0,
+                'avg_miss_ms': self.miss_seconds / self.misses * 1000 if self.misses else 0.0
+            }
+        if self.backend is not None:
+            stats.update((f'backend_{name}', value) for name, value in self.backend.stats().items()
+                         if name not in ('hits', 'misses', 'hit_rate'))
+        return stats
+
+def make_result_backend(url: str = None):
+    """Redis backend for a redis:// URL, otherwise an in-process LRU"""
+    url = Config.RESULT_CACHE_URL if url is None else url
+    if not url:
+        return LRUCache(Config.RESULT_CACHE_SIZE, Config.RESULT_CACHE_TTL)
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError("RESULT_CACHE_URL needs the redis package: pip install redis")
+    return RedisBackend(redis.Redis.from_url(url), Config.RESULT_CACHE_TTL)
+
+# telegram_id -> CachedUser(id, default_currency)
+user_cache = LRUCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)
+
+# "<user id>:<data_versions>:<call>" -> summary or wallet balances
+result_cache = ResultCache(make_result_backend())
+
+metrics.register_cache('users', user_cache)
+metrics.register_cache('results', result_cache)
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+# Tests never touch the configured database: point the app at a scratch SQLite
+# file before config.py is imported. TEST_DATABASE_URL overrides it.
+os.environ['DATABASE_URL'] = os.getenv(
+    'TEST_DATABASE_URL',
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='finance-bot-test-'), 'test.db')
+)
+os.environ['SLOW_QUERY_LOG'] = os.path.join(tempfile.mkdtemp(prefix='finance-bot-test-'), 'slow_queries.jsonl')
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+    """Process-wide caches must not leak state between tests"""
+    from cache import user_cache, result_cache
+    from ledger import ledger_cache
+    import fx
+    user_cache.clear()
+    result_cache.reset()
+    ledger_cache.clear()
+    fx.invalidate_rates()
+    yield
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database():
+    """Importing the app no longer creates the schema; do the deploy step once"""
+    from migrate_db import init_database
+    assert init_database()
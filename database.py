@@ -1,9 +1,91 @@
-from sqlalchemy.orm import Session
-from models import User, Wallet, IncomeSource, ExpenseCategory, Transaction
-from datetime import datetime, timedelta
-from typing import List, Optional
+from sqlalchemy import func, tuple_, and_, or_, case, cast, type_coerce, select, insert, literal, Date, String
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload, raiseload
+from cache import user_cache, result_cache, CachedUser
+import fx
+import ledger
+import reports
+from models import User, Wallet, IncomeSource, ExpenseCategory, Transaction, DailyRollup, DataVersion, FxRate, NotificationJob
+from datetime import date, datetime, timedelta, time
+from typing import Dict, Iterator, List, Optional, Tuple
+import base64
 import json
 
+def encode_cursor(date: datetime, transaction_id: int) -> str:
+    """Opaque pagination cursor pointing at the last row of a page"""
+    payload = json.dumps([date.isoformat(), transaction_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date, transaction_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(date), int(transaction_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+ROLLUP_KEY = ['user_id', 'day', 'wallet_id', 'transaction_type', 'ref_id', 'currency']
+
+def rollup_ref_id(transaction_type: str, income_source_id: Optional[int], expense_category_id: Optional[int]) -> int:
+    """The category (expense) or source (income) a transaction is rolled up under"""
+    if transaction_type == 'expense':
+        return expense_category_id or 0
+    if transaction_type == 'income':
+        return income_source_id or 0
+    return 0
+
+def _ref_id_column():
+    """rollup_ref_id as a SQL expression over the transactions table"""
+    return case(
+        (Transaction.transaction_type == 'expense', func.coalesce(Transaction.expense_category_id, 0)),
+        (Transaction.transaction_type == 'income', func.coalesce(Transaction.income_source_id, 0)),
+        else_=0
+    )
+
+_ROLLUP_UPSERTS = {}
+
+def _rollup_upsert(dialect: str):
+    """INSERT ... ON CONFLICT DO UPDATE adding onto daily_rollups, built once per dialect"""
+    if dialect not in _ROLLUP_UPSERTS:
+        stmt = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(DailyRollup.__table__)
+        _ROLLUP_UPSERTS[dialect] = stmt.on_conflict_do_update(
+            index_elements=ROLLUP_KEY,
+            set_={'total': DailyRollup.total + stmt.excluded.total, 'count': DailyRollup.count + stmt.excluded.count}
+        )
+    return _ROLLUP_UPSERTS[dialect]
+
+# Reference lists with a per-user change counter (see DataVersion)
+VERSION_SCOPES = ('wallets', 'expense_categories', 'income_sources')
+
+_VERSION_BUMPS = {}
+
+def _version_bump(dialect: str):
+    """INSERT ... ON CONFLICT DO UPDATE incrementing data_versions, built once per dialect"""
+    if dialect not in _VERSION_BUMPS:
+        stmt = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(DataVersion.__table__)
+        _VERSION_BUMPS[dialect] = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'scope'],
+            set_={'version': DataVersion.version + 1}
+        )
+    return _VERSION_BUMPS[dialect]
+
+def _bucket_expression(dialect: str, bucket: str, day):
+    """SQL for the first day of the day/week/month containing day, or None if unsupported"""
+    if bucket == 'day':
+        return day
+    if dialect == 'postgresql':
+        return cast(func.date_trunc(bucket, day), Date)
+    if dialect == 'sqlite':
+        if bucket == 'week':
+            # Next Sunday (or the day itself), then back to its Monday
+            return func.date(day, 'weekday 0', '-6 days')
+        return func.strftime('%Y-%m-01', day)
+    return None
+
+def _as_date(value) -> date:
+    # SQLite returns DATE(...) as an ISO string
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
 class DatabaseManager:
     def __init__(self, db: Session):
         self.db = db
@@ -21,16 +103,34 @@ class DatabaseManager:
             self.db.add(user)
             self.db.commit()
             self.db.refresh(user)
+        user_cache.set(telegram_id, CachedUser(user.id, user.default_currency))
         return user
     
     def get_user(self, telegram_id: int) -> Optional[User]:
-        return self.db.query(User).filter(User.telegram_id == telegram_id).first()
+        user = self.db.query(User).filter(User.telegram_id == telegram_id).first()
+        if user:
+            user_cache.set(telegram_id, CachedUser(user.id, user.default_currency))
+        return user
+    
+    def resolve_user(self, telegram_id: int) -> Optional[CachedUser]:
+        """User id and default currency for a telegram id, served from the cache when possible"""
+        cached = user_cache.get(telegram_id)
+        if cached is not None:
+            return cached
+        row = self.db.query(User.id, User.default_currency).filter(User.telegram_id == telegram_id).first()
+        if row is None:
+            # Unknown ids are not cached: the user may be created by another process
+            return None
+        cached = CachedUser(row.id, row.default_currency)
+        user_cache.set(telegram_id, cached)
+        return cached
     
     def update_user_currency(self, telegram_id: int, currency: str) -> bool:
         user = self.get_user(telegram_id)
         if user:
             user.default_currency = currency
             self.db.commit()
+            user_cache.invalidate(telegram_id)
             return True
         return False
     
@@ -38,26 +138,30 @@ class DatabaseManager:
     def create_wallet(self, user_id: int, name: str, currency: str) -> Wallet:
         wallet = Wallet(user_id=user_id, name=name, currency=currency)
         self.db.add(wallet)
+        self.bump_version(user_id, 'wallets')
         self.db.commit()
         self.db.refresh(wallet)
+        self._sync_ledger(user_id)
         return wallet
     
     def get_user_wallets(self, user_id: int) -> List[Wallet]:
         return self.db.query(Wallet).filter(Wallet.user_id == user_id, Wallet.is_active == True).all()
     
-    def update_wallet_balance(self, wallet_id: int, amount: float) -> bool:
-        wallet = self.db.query(Wallet).filter(Wallet.id == wallet_id).first()
-        if wallet:
-            wallet.balance += amount
+    def update_wallet_balance(self, wallet_id: int, amount: float, commit: bool = True) -> bool:
+        # Single UPDATE balance = balance + :amount, so concurrent writers cannot lose updates
+        updated = self.db.query(Wallet).filter(Wallet.id == wallet_id)\
+                      .update({Wallet.balance: Wallet.balance + amount})
+        if commit:
             self.db.commit()
-            return True
-        return False
+        return updated > 0
     
     def delete_wallet(self, wallet_id: int, user_id: int) -> bool:
         wallet = self.db.query(Wallet).filter(Wallet.id == wallet_id, Wallet.user_id == user_id).first()
         if wallet:
             wallet.is_active = False
+            self.bump_version(user_id, 'wallets')
             self.db.commit()
+            self._sync_ledger(user_id)
             return True
         return False
     
@@ -65,6 +169,7 @@ class DatabaseManager:
     def create_income_source(self, user_id: int, name: str, description: str = None) -> IncomeSource:
         income_source = IncomeSource(user_id=user_id, name=name, description=description)
         self.db.add(income_source)
+        self.bump_version(user_id, 'income_sources')
         self.db.commit()
         self.db.refresh(income_source)
         return income_source
@@ -76,6 +181,7 @@ class DatabaseManager:
         source = self.db.query(IncomeSource).filter(IncomeSource.id == source_id, IncomeSource.user_id == user_id).first()
         if source:
             source.is_active = False
+            self.bump_version(user_id, 'income_sources')
             self.db.commit()
             return True
         return False
@@ -90,6 +196,7 @@ class DatabaseManager:
             icon=icon
         )
         self.db.add(category)
+        self.bump_version(user_id, 'expense_categories')
         self.db.commit()
         self.db.refresh(category)
         return category
@@ -101,6 +208,7 @@ class DatabaseManager:
         category = self.db.query(ExpenseCategory).filter(ExpenseCategory.id == category_id, ExpenseCategory.user_id == user_id).first()
         if category:
             category.is_active = False
+            self.bump_version(user_id, 'expense_categories')
             self.db.commit()
             return True
         return False
@@ -125,88 +233,697 @@ class DatabaseManager:
         )
         
         self.db.add(transaction)
+        self._apply_to_rollup(transaction, 1)
         
-        # Update wallet balance
+        # Update wallet balance in the same database transaction
         if transaction_type == 'income':
-            self.update_wallet_balance(wallet_id, amount)
+            self.update_wallet_balance(wallet_id, amount, commit=False)
         else:
-            self.update_wallet_balance(wallet_id, -amount)
+            self.update_wallet_balance(wallet_id, -amount, commit=False)
+        # The wallet list carries balances
+        self.bump_version(user_id, 'wallets')
         
         self.db.commit()
         self.db.refresh(transaction)
+        self._sync_ledger(user_id, lambda cached: cached.add(
+            transaction.id, transaction.date, transaction_type, transaction.amount, currency, wallet_id,
+            rollup_ref_id(transaction_type, income_source_id, expense_category_id)
+        ))
         return transaction
     
+    def bulk_create_transactions(self, user_id: int, rows: List[dict]) -> int:
+        """Insert pre-validated transaction rows in one database transaction.
+        
+        Wallet balances and daily rollups get one aggregated update per key
+        instead of one per row. Returns the number of inserted rows.
+        """
+        if not rows:
+            return 0
+        
+        balance_deltas = {}
+        rollups = {}
+        for row in rows:
+            sign = 1 if row['transaction_type'] == 'income' else -1
+            balance_deltas[row['wallet_id']] = balance_deltas.get(row['wallet_id'], 0.0) + sign * row['amount']
+            
+            key = (user_id, row['date'].date(), row['wallet_id'], row['transaction_type'],
+                   rollup_ref_id(row['transaction_type'], row.get('income_source_id'), row.get('expense_category_id')),
+                   row['currency'])
+            total, count = rollups.get(key, (0.0, 0))
+            rollups[key] = (total + row['amount'], count + 1)
+        
+        self.db.execute(insert(Transaction.__table__), [dict(row, user_id=user_id) for row in rows])
+        # Rows are locked in key order so concurrent imports cannot deadlock
+        self._upsert_rollups([
+            dict(zip(ROLLUP_KEY, key), total=total, count=count)
+            for key, (total, count) in sorted(rollups.items())
+        ])
+        # Wallets already in the session get the new balance too: async sessions do not expire on commit
+        for wallet_id, delta in sorted(balance_deltas.items()):
+            self.db.query(Wallet).filter(Wallet.id == wallet_id, Wallet.user_id == user_id)\
+                .update({Wallet.balance: Wallet.balance + delta})
+        self.bump_version(user_id, 'wallets')
+        self.db.commit()
+        # Row ids are not returned; the next read reloads the ledger
+        ledger.ledger_cache.invalidate(user_id)
+        return len(rows)
+    
+    def _user_transactions_query(self, user_id: int):
+        # Wallet, source and category come in the same query; any other lazy load raises
+        return self.db.query(Transaction)\
+                   .options(
+                       joinedload(Transaction.wallet),
+                       joinedload(Transaction.income_source),
+                       joinedload(Transaction.expense_category),
+                       raiseload('*')
+                   )\
+                   .filter(Transaction.user_id == user_id)\
+                   .order_by(Transaction.date.desc(), Transaction.id.desc())
+    
     def get_user_transactions(self, user_id: int, limit: int = 50, offset: int = 0) -> List[Transaction]:
-        return self.db.query(Transaction).filter(Transaction.user_id == user_id)\
-                   .order_by(Transaction.date.desc())\
-                   .limit(limit).offset(offset).all()
+        return self._user_transactions_query(user_id).limit(limit).offset(offset).all()
+    
+    def get_user_transactions_page(self, user_id: int, limit: int = 50, cursor: str = None) -> Tuple[List[Transaction], Optional[str]]:
+        """Keyset pagination over (date, id), newest first.
+        
+        Returns the page and the cursor of the next one (None on the last page).
+        Raises ValueError for a malformed cursor or a limit below 1.
+        """
+        if limit < 1:
+            raise ValueError(f"Invalid limit: {limit}")
+        query = self._user_transactions_query(user_id)
+        if cursor:
+            date, transaction_id = decode_cursor(cursor)
+            query = query.filter(tuple_(Transaction.date, Transaction.id) < (date, transaction_id))
+        
+        transactions = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(transactions) > limit:
+            transactions = transactions[:limit]
+            next_cursor = encode_cursor(transactions[-1].date, transactions[-1].id)
+        return transactions, next_cursor
+    
+    def _period_filter(self, user_id: int, start_date: datetime = None, end_date: datetime = None) -> list:
+        conditions = [Transaction.user_id == user_id]
+        if start_date is not None:
+            conditions.append(Transaction.date >= start_date)
+        if end_date is not None:
+            conditions.append(Transaction.date <= end_date)
+        return conditions
     
     def get_transactions_by_period(self, user_id: int, start_date: datetime, end_date: datetime) -> List[Transaction]:
         return self.db.query(Transaction).filter(
-            Transaction.user_id == user_id,
-            Transaction.date >= start_date,
-            Transaction.date <= end_date
+            *self._period_filter(user_id, start_date, end_date)
         ).order_by(Transaction.date.desc()).all()
     
+    def iter_transactions_by_period(self, user_id: int, start_date: datetime = None, end_date: datetime = None,
+                                    chunk_size: int = 1000) -> Iterator:
+        """Stream a user's ledger oldest first, with wallet, category and source names.
+        
+        Rows are fetched chunk_size at a time from a server-side cursor, so
+        memory use does not depend on the size of the ledger. Either bound
+        may be omitted.
+        """
+        stmt = select(
+            Transaction.id,
+            Transaction.date,
+            Transaction.transaction_type,
+            Transaction.amount,
+            Transaction.currency,
+            Wallet.name.label('wallet'),
+            ExpenseCategory.name.label('category'),
+            IncomeSource.name.label('source'),
+            Transaction.description
+        ).join(Wallet, Transaction.wallet_id == Wallet.id)\
+         .outerjoin(ExpenseCategory, Transaction.expense_category_id == ExpenseCategory.id)\
+         .outerjoin(IncomeSource, Transaction.income_source_id == IncomeSource.id)\
+         .where(*self._period_filter(user_id, start_date, end_date))\
+         .order_by(Transaction.date, Transaction.id)\
+         .execution_options(yield_per=chunk_size)
+        
+        for partition in self.db.execute(stmt).partitions():
+            yield from partition
+    
     def delete_transaction(self, transaction_id: int, user_id: int) -> bool:
         transaction = self.db.query(Transaction).filter(Transaction.id == transaction_id, Transaction.user_id == user_id).first()
         if transaction:
+            key = (transaction_id, transaction.date, transaction.transaction_type, transaction.currency,
+                   transaction.wallet_id, rollup_ref_id(transaction.transaction_type, transaction.income_source_id,
+                                                        transaction.expense_category_id))
+            self._apply_to_rollup(transaction, -1)
+            
             # Revert wallet balance
             if transaction.transaction_type == 'income':
-                self.update_wallet_balance(transaction.wallet_id, -transaction.amount)
+                self.update_wallet_balance(transaction.wallet_id, -transaction.amount, commit=False)
             else:
-                self.update_wallet_balance(transaction.wallet_id, transaction.amount)
+                self.update_wallet_balance(transaction.wallet_id, transaction.amount, commit=False)
+            self.bump_version(user_id, 'wallets')
             
             self.db.delete(transaction)
             self.db.commit()
+            self._sync_ledger(user_id, lambda cached: cached.remove(*key))
             return True
         return False
     
+    # Data versions
+    def bump_version(self, user_id: int, scope: str):
+        """Increment a reference list's change counter; committed by the caller"""
+        dialect = self.db.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            self.db.execute(_version_bump(dialect), {'user_id': user_id, 'scope': scope, 'version': 1})
+            return
+        updated = self.db.query(DataVersion).filter_by(user_id=user_id, scope=scope)\
+                      .update({DataVersion.version: DataVersion.version + 1}, synchronize_session=False)
+        if not updated:
+            self.db.add(DataVersion(user_id=user_id, scope=scope, version=1))
+            self.db.flush()
+    
+    def get_versions(self, user_id: int) -> dict:
+        """Change counters of every reference list, 0 for lists never written"""
+        versions = dict.fromkeys(VERSION_SCOPES, 0)
+        versions.update(self.db.query(DataVersion.scope, DataVersion.version)
+                        .filter(DataVersion.user_id == user_id).all())
+        return versions
+    
+    def get_version(self, user_id: int, scope: str) -> int:
+        version = self.db.query(DataVersion.version)\
+                      .filter(DataVersion.user_id == user_id, DataVersion.scope == scope).scalar()
+        return version or 0
+    
+    def get_timeseries_groups(self, user_id: int, start: date, end: date, bucket: str = 'month',
+                              by_category: bool = False, currency: str = None) -> Tuple[list, List[str]]:
+        """(bucket start, transaction_type, name, total, count) groups of days start..end.
+        
+        Buckets are computed in SQL from daily_rollups. name is the category or
+        income source when by_category is set, else None. With a currency,
+        foreign amounts are converted at the rate of their day (the query
+        splits only those groups by day). Returns the groups and the currencies
+        left unconverted for lack of a rate.
+        """
+        dialect = self.db.get_bind().dialect.name
+        bucket_column = _bucket_expression(dialect, bucket, DailyRollup.day)
+        if bucket_column is None:
+            # Other databases: group by day and bucket in Python
+            bucket_column = DailyRollup.day
+        
+        # Dates come back raw (ISO strings on SQLite) and are parsed once per distinct value
+        keys = [type_coerce(bucket_column, String), DailyRollup.transaction_type]
+        if by_category:
+            # Names are mapped in Python; joining them onto every rollup row costs more
+            keys.append(DailyRollup.ref_id)
+        if currency is not None:
+            target = literal(currency, literal_execute=True)
+            keys += [DailyRollup.currency,
+                     type_coerce(case((DailyRollup.currency == target, None), else_=DailyRollup.day), String)]
+        
+        rows = self.db.execute(
+            select(func.sum(DailyRollup.total), func.sum(DailyRollup.count), *keys).where(
+                DailyRollup.user_id == user_id,
+                DailyRollup.day >= start,
+                DailyRollup.day <= end
+            ).group_by(*keys)
+        )
+        
+        names = self._reference_names(user_id) if by_category else {}
+        converter = fx.Converter(fx.get_rates(self), currency) if currency is not None else None
+        periods = {}
+        factors = {}
+        merged = {}
+        for row in rows:
+            total, count, period, transaction_type = row[:4]
+            name = names[transaction_type].get(row[4]) if by_category else None
+            if period not in periods:
+                periods[period] = reports.bucket_start(_as_date(period), bucket)
+            if currency is not None and row[-1] is not None:
+                factor_key = (row[-2], row[-1])
+                if factor_key not in factors:
+                    factors[factor_key] = converter.factor(row[-2], _as_date(row[-1]))
+                total *= factors[factor_key]
+            
+            key = (periods[period], transaction_type, name)
+            previous_total, previous_count = merged.get(key, (0.0, 0))
+            merged[key] = (previous_total + total, previous_count + count)
+        
+        groups = [(period, transaction_type, name, total, count)
+                  for (period, transaction_type, name), (total, count) in merged.items()]
+        return groups, sorted(converter.unconverted) if converter else []
+    
+    def _reference_names(self, user_id: int) -> Dict[str, dict]:
+        """transaction_type -> {category or income source id: name}, deleted ones included"""
+        return {
+            'expense': dict(self.db.query(ExpenseCategory.id, ExpenseCategory.name)
+                            .filter(ExpenseCategory.user_id == user_id).all()),
+            'income': dict(self.db.query(IncomeSource.id, IncomeSource.name)
+                           .filter(IncomeSource.user_id == user_id).all())
+        }
+    
+    # In-memory ledgers (see ledger.py)
+    def _load_ledger(self, user_id: int, versions: dict) -> ledger.UserLedger:
+        # Dates come back raw and are parsed by the ledger; SQLAlchemy's SQLite DATETIME parsing dominates a load
+        rows = self.db.execute(
+            select(Transaction.id, type_coerce(Transaction.date, String), Transaction.transaction_type,
+                   Transaction.amount, Transaction.currency, Transaction.wallet_id, _ref_id_column())
+            .where(Transaction.user_id == user_id)
+            .order_by(Transaction.date, Transaction.id)
+            .execution_options(yield_per=10000)
+        )
+        return ledger.UserLedger(rows, versions, self._reference_names(user_id))
+    
+    def get_ledger(self, user_id: int) -> Optional[ledger.UserLedger]:
+        """The user's in-memory ledger, reloaded when data_versions moved on; None when disabled"""
+        if not ledger.enabled():
+            return None
+        versions = self.get_versions(user_id)
+        cached = ledger.ledger_cache.get(user_id)
+        if cached is None or cached.versions['wallets'] != versions['wallets']:
+            # Transactions were written elsewhere (another process or a bulk import).
+            # The versions and the rows are separate reads: a write committed between them would
+            # be in the rows but not the versions, and applied a second time by _sync_ledger.
+            # Only a ledger whose versions held still across the load is cached
+            for _ in range(3):
+                cached = self._load_ledger(user_id, versions)
+                current = self.get_versions(user_id)
+                if current['wallets'] == versions['wallets']:
+                    ledger.ledger_cache.set(user_id, cached)
+                    break
+                versions = current
+            else:
+                ledger.ledger_cache.invalidate(user_id)
+        elif cached.versions != versions:
+            names = self._reference_names(user_id)
+            with cached.lock:
+                cached.names = names
+                cached.versions.update(versions)
+        return cached
+    
+    def _sync_ledger(self, user_id: int, change=None):
+        """After a committed 'wallets' bump: apply change to the cached ledger if it was current.
+        
+        Otherwise another writer got in between and the ledger is dropped.
+        """
+        if not ledger.enabled():
+            return
+        cached = ledger.ledger_cache.get(user_id)
+        if cached is None:
+            return
+        version = self.get_version(user_id, 'wallets')
+        with cached.lock:
+            if cached.versions['wallets'] + 1 == version:
+                if change is not None:
+                    change(cached)
+                cached.versions['wallets'] = version
+                return
+        ledger.ledger_cache.invalidate(user_id)
+    
+    # FX rate operations
+    def upsert_fx_rates(self, rows: List[dict]) -> int:
+        """Insert or replace {day, currency, rate} rows; returns the number written"""
+        if not rows:
+            return 0
+        dialect = self.db.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            stmt = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(FxRate.__table__)
+            stmt = stmt.on_conflict_do_update(index_elements=['currency', 'day'], set_={'rate': stmt.excluded.rate})
+            self.db.execute(stmt, rows)
+        else:
+            for row in rows:
+                self.db.merge(FxRate(**row))
+        self.db.commit()
+        fx.invalidate_rates()
+        # Converted summaries were computed at the old rates
+        result_cache.clear()
+        return len(rows)
+    
+    def get_fx_rates(self) -> List[Tuple[date, str, float]]:
+        return [tuple(row) for row in self.db.query(FxRate.day, FxRate.currency, FxRate.rate)]
+    
+    # Notification operations (the queue behind notifications.Dispatcher)
+    def enqueue_notifications(self, rows: List[dict]) -> int:
+        """Queue {chat_id, text, kind?, parse_mode?, dedup_key?} messages; returns the number queued.
+        
+        Rows whose dedup_key was queued before are skipped, so re-running a
+        broadcast does not message anyone twice.
+        """
+        keys = [row['dedup_key'] for row in rows if row.get('dedup_key')]
+        known = set()
+        for start in range(0, len(keys), 500):
+            known.update(key for (key,) in self.db.query(NotificationJob.dedup_key)
+                         .filter(NotificationJob.dedup_key.in_(keys[start:start + 500])))
+        now = datetime.utcnow()
+        queued = []
+        for row in rows:
+            key = row.get('dedup_key')
+            if key:
+                if key in known:
+                    continue
+                known.add(key)
+            queued.append({
+                'chat_id': row['chat_id'],
+                'text': row['text'],
+                'parse_mode': row.get('parse_mode', 'HTML'),
+                'kind': row.get('kind', 'message'),
+                'dedup_key': key or None,
+                'status': 'pending',
+                'attempts': 0,
+                'next_attempt_at': now,
+                'created_at': now
+            })
+        if not queued:
+            return 0
+        
+        dialect = self.db.get_bind().dialect.name
+        stmt = insert(NotificationJob.__table__)
+        if dialect in ('postgresql', 'sqlite'):
+            # A concurrent enqueue of the same key wins; this one is dropped
+            stmt = (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(NotificationJob.__table__)\
+                .on_conflict_do_nothing(index_elements=['dedup_key'])
+        self.db.execute(stmt, queued)
+        self.db.commit()
+        return len(queued)
+    
+    def enqueue_broadcast(self, text: str, kind: str = 'broadcast', dedup_key: str = None,
+                          telegram_ids: List[int] = None) -> int:
+        """Queue text to every user (or the given ones); dedup_key makes a re-run skip users already queued"""
+        if telegram_ids is None:
+            telegram_ids = [telegram_id for (telegram_id,) in self.db.query(User.telegram_id).order_by(User.id)]
+        queued = 0
+        for start in range(0, len(telegram_ids), 1000):
+            queued += self.enqueue_notifications([
+                {'chat_id': telegram_id, 'text': text, 'kind': kind,
+                 'dedup_key': f'{dedup_key}:{telegram_id}' if dedup_key else None}
+                for telegram_id in telegram_ids[start:start + 1000]
+            ])
+        return queued
+    
+    def claim_notifications(self, limit: int, token: str) -> list:
+        """Mark up to limit due jobs as sending under token and return them, oldest first.
+        
+        Committed before anything is sent, so a job goes to one dispatcher.
+        Rows have id, chat_id, text, parse_mode, kind, attempts, created_at.
+        """
+        now = datetime.utcnow()
+        ids = [job_id for (job_id,) in self.db.query(NotificationJob.id)
+               .filter(NotificationJob.status == 'pending', NotificationJob.next_attempt_at <= now)
+               .order_by(NotificationJob.id).limit(limit)]
+        if not ids:
+            return []
+        self.db.query(NotificationJob)\
+            .filter(NotificationJob.id.in_(ids), NotificationJob.status == 'pending')\
+            .update({NotificationJob.status: 'sending', NotificationJob.claim_token: token,
+                     NotificationJob.claimed_at: now}, synchronize_session=False)
+        self.db.commit()
+        return self.db.query(NotificationJob.id, NotificationJob.chat_id, NotificationJob.text,
+                             NotificationJob.parse_mode, NotificationJob.kind, NotificationJob.attempts,
+                             NotificationJob.created_at)\
+                   .filter(NotificationJob.id.in_(ids), NotificationJob.claim_token == token,
+                           NotificationJob.status == 'sending')\
+                   .order_by(NotificationJob.id).all()
+    
+    def _finish_notification(self, job_id: int, values: dict) -> bool:
+        values[NotificationJob.claim_token] = None
+        values[NotificationJob.claimed_at] = None
+        updated = self.db.query(NotificationJob)\
+                      .filter(NotificationJob.id == job_id, NotificationJob.status == 'sending')\
+                      .update(values, synchronize_session=False)
+        self.db.commit()
+        return updated > 0
+    
+    def complete_notification(self, job_id: int, message_id: int = None) -> bool:
+        return self._finish_notification(job_id, {
+            NotificationJob.status: 'sent',
+            NotificationJob.attempts: NotificationJob.attempts + 1,
+            NotificationJob.message_id: message_id,
+            NotificationJob.sent_at: datetime.utcnow()
+        })
+    
+    def retry_notification(self, job_id: int, delay: float, error: str, count_attempt: bool = True) -> bool:
+        """Back to pending, due after delay seconds; rate limit retries (count_attempt=False) are free"""
+        return self._finish_notification(job_id, {
+            NotificationJob.status: 'pending',
+            NotificationJob.attempts: NotificationJob.attempts + (1 if count_attempt else 0),
+            NotificationJob.next_attempt_at: datetime.utcnow() + timedelta(seconds=delay),
+            NotificationJob.last_error: error[:300]
+        })
+    
+    def fail_notification(self, job_id: int, error: str) -> bool:
+        return self._finish_notification(job_id, {
+            NotificationJob.status: 'failed',
+            NotificationJob.attempts: NotificationJob.attempts + 1,
+            NotificationJob.last_error: error[:300]
+        })
+    
+    def refresh_notification_claims(self, job_ids: List[int], token: str) -> int:
+        """Mark the claims of token on job_ids as still held"""
+        if not job_ids:
+            return 0
+        refreshed = self.db.query(NotificationJob)\
+                        .filter(NotificationJob.id.in_(job_ids), NotificationJob.claim_token == token,
+                                NotificationJob.status == 'sending')\
+                        .update({NotificationJob.claimed_at: datetime.utcnow()}, synchronize_session=False)
+        self.db.commit()
+        return refreshed
+    
+    def release_notifications(self, token: str = None, stale_after: float = None) -> int:
+        """Return claimed jobs to pending: those of token, or with stale_after the claims nobody
+        refreshed for that many seconds (left by a dispatcher that died)"""
+        if token is None and stale_after is None:
+            raise ValueError("Pass a token or stale_after")
+        query = self.db.query(NotificationJob).filter(NotificationJob.status == 'sending')
+        if token is not None:
+            query = query.filter(NotificationJob.claim_token == token)
+        if stale_after is not None:
+            cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+            query = query.filter(or_(NotificationJob.claimed_at.is_(None), NotificationJob.claimed_at < cutoff))
+        released = query.update({NotificationJob.status: 'pending', NotificationJob.claim_token: None,
+                                 NotificationJob.claimed_at: None}, synchronize_session=False)
+        self.db.commit()
+        return released
+    
+    def get_notification_counts(self) -> Dict[str, int]:
+        """Jobs by status (pending, sending, sent, failed)"""
+        return dict(self.db.query(NotificationJob.status, func.count(NotificationJob.id))
+                    .group_by(NotificationJob.status).all())
+    
+    # Daily rollups
+    def _upsert_rollups(self, rows: List[dict]):
+        """Add each row's total and count onto its daily_rollups key"""
+        dialect = self.db.get_bind().dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            for row in rows:
+                key = {column: row[column] for column in ROLLUP_KEY}
+                rollup = self.db.query(DailyRollup).filter_by(**key).with_for_update().first()
+                if rollup:
+                    rollup.total += row['total']
+                    rollup.count += row['count']
+                else:
+                    self.db.add(DailyRollup(**row))
+            self.db.flush()
+            return
+        
+        self.db.execute(_rollup_upsert(dialect), rows)
+    
+    def _apply_to_rollup(self, transaction: Transaction, sign: int):
+        """Add (sign=1) or remove (sign=-1) a transaction from daily_rollups"""
+        key = {
+            'user_id': transaction.user_id,
+            'day': transaction.date.date(),
+            'wallet_id': transaction.wallet_id,
+            'transaction_type': transaction.transaction_type,
+            'ref_id': rollup_ref_id(transaction.transaction_type, transaction.income_source_id, transaction.expense_category_id),
+            'currency': transaction.currency
+        }
+        self._upsert_rollups([dict(key, total=sign * transaction.amount, count=sign)])
+        if sign < 0:
+            self.db.query(DailyRollup).filter_by(**key).filter(DailyRollup.count <= 0)\
+                .delete(synchronize_session=False)
+    
+    def rebuild_daily_rollups(self, user_id: int = None) -> int:
+        """Recompute daily_rollups from the transactions table, for one user or everyone"""
+        stale = self.db.query(DailyRollup)
+        if user_id is not None:
+            stale = stale.filter(DailyRollup.user_id == user_id)
+        stale.delete(synchronize_session=False)
+        
+        day = func.date(Transaction.date)
+        key = [Transaction.user_id, day, Transaction.wallet_id, Transaction.transaction_type, _ref_id_column(), Transaction.currency]
+        grouped = select(*key, func.sum(Transaction.amount), func.count(Transaction.id)).group_by(*key)
+        if user_id is not None:
+            grouped = grouped.where(Transaction.user_id == user_id)
+        
+        result = self.db.execute(insert(DailyRollup.__table__).from_select(ROLLUP_KEY + ['total', 'count'], grouped))
+        self.db.commit()
+        return result.rowcount
+    
     # Analytics and reports
-    def get_user_summary(self, user_id: int, period_days: int = 30) -> dict:
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=period_days)
+    def _period_groups(self, user_id: int, start_date: datetime, end_date: datetime,
+                       convert_to: str = None) -> list:
+        """(transaction_type, category or source name, total, count, currency, day) groups of a period.
+        
+        Whole days are read from daily_rollups; only the partial days at both
+        ends of the period are aggregated from raw transactions. Currency and
+        day are None unless convert_to is given; then groups are split by
+        currency, and by day for currencies other than convert_to.
+        """
+        first_full_day = start_date.date() + timedelta(days=1)
+        last_day = end_date.date()
+        groups = []
+        
+        def grouped(query, model, day):
+            name = func.coalesce(ExpenseCategory.name, IncomeSource.name)
+            keys = [model.transaction_type, name]
+            if convert_to is not None:
+                # Inlined so PostgreSQL sees the same expression in SELECT and GROUP BY
+                target = literal(convert_to, literal_execute=True)
+                keys += [model.currency, case((model.currency == target, None), else_=day)]
+            else:
+                keys += [None, None]
+            return query.add_columns(*keys).group_by(*[key for key in keys if key is not None])
         
-        transactions = self.get_transactions_by_period(user_id, start_date, end_date)
+        if first_full_day < last_day:
+            query = self.db.query(func.sum(DailyRollup.total), func.sum(DailyRollup.count))\
+                .outerjoin(ExpenseCategory, and_(
+                    DailyRollup.transaction_type == 'expense', DailyRollup.ref_id == ExpenseCategory.id
+                )).outerjoin(IncomeSource, and_(
+                    DailyRollup.transaction_type == 'income', DailyRollup.ref_id == IncomeSource.id
+                )).filter(
+                    DailyRollup.user_id == user_id,
+                    DailyRollup.day >= first_full_day,
+                    DailyRollup.day < last_day
+                )
+            groups += grouped(query, DailyRollup, DailyRollup.day).all()
+            
+            edges = or_(
+                and_(Transaction.date >= start_date, Transaction.date < datetime.combine(first_full_day, time.min)),
+                and_(Transaction.date >= datetime.combine(last_day, time.min), Transaction.date <= end_date)
+            )
+        else:
+            edges = and_(Transaction.date >= start_date, Transaction.date <= end_date)
         
-        total_income = sum(t.amount for t in transactions if t.transaction_type == 'income')
-        total_expense = sum(t.amount for t in transactions if t.transaction_type == 'expense')
+        query = self.db.query(func.sum(Transaction.amount), func.count(Transaction.id))\
+            .outerjoin(ExpenseCategory, and_(
+                Transaction.transaction_type == 'expense', Transaction.expense_category_id == ExpenseCategory.id
+            )).outerjoin(IncomeSource, and_(
+                Transaction.transaction_type == 'income', Transaction.income_source_id == IncomeSource.id
+            )).filter(Transaction.user_id == user_id, edges)
+        groups += grouped(query, Transaction, func.date(Transaction.date)).all()
         
-        # Group by category
+        return [(transaction_type, name, total, count, currency, day)
+                for total, count, transaction_type, name, currency, day in groups]
+    
+    def _cached_result(self, user_id: int, call: tuple, compute):
+        """compute() through result_cache, keyed by the user's data_versions and the call.
+        
+        Every transaction, wallet and category write bumps a version, so entries
+        from before it are never served again.
+        """
+        if not result_cache.enabled:
+            return compute()
+        versions = self.get_versions(user_id)
+        key = ':'.join(str(part) for part in (user_id, *(versions[scope] for scope in VERSION_SCOPES), *call))
+        return result_cache.get_or_compute(key, compute)
+    
+    def get_user_summary(self, user_id: int, period_days: int = 30, currency: str = None) -> dict:
+        """Income, expenses and breakdowns of the last period_days; cached (see _cached_result)"""
+        def compute():
+            end_date = datetime.utcnow()
+            return self.get_period_summary(user_id, end_date - timedelta(days=period_days), end_date, currency)
+        return self._cached_result(user_id, ('summary', period_days, currency), compute)
+    
+    def get_day_summary(self, user_id: int, day: date, currency: str = None) -> dict:
+        """get_period_summary of one calendar day (UTC); cached like get_user_summary"""
+        def compute():
+            start_date = datetime.combine(day, time.min)
+            return self.get_period_summary(user_id, start_date, start_date + timedelta(days=1, microseconds=-1), currency)
+        return self._cached_result(user_id, ('day', day.isoformat(), currency), compute)
+    
+    def get_period_summary(self, user_id: int, start_date: datetime, end_date: datetime,
+                           currency: str = None) -> dict:
+        """Income, expenses and breakdowns of start_date <= date <= end_date.
+        
+        With a currency, every amount is converted into it at the rate of its
+        day; groups without a rate are added unconverted and their currencies
+        listed under unconverted_currencies. Served from the in-memory ledger
+        when it is enabled.
+        """
+        user_ledger = self.get_ledger(user_id)
+        if user_ledger is not None:
+            with user_ledger.lock:
+                groups = user_ledger.period_groups(start_date, end_date, currency)
+        else:
+            groups = self._period_groups(user_id, start_date, end_date, currency)
+        
+        converter = fx.Converter(fx.get_rates(self), currency) if currency is not None else None
+        
+        totals = {}
         expenses_by_category = {}
-        for t in transactions:
-            if t.transaction_type == 'expense' and t.expense_category:
-                cat_name = t.expense_category.name
-                if cat_name not in expenses_by_category:
-                    expenses_by_category[cat_name] = 0
-                expenses_by_category[cat_name] += t.amount
-        
-        # Group by income source
         income_by_source = {}
-        for t in transactions:
-            if t.transaction_type == 'income' and t.income_source:
-                source_name = t.income_source.name
-                if source_name not in income_by_source:
-                    income_by_source[source_name] = 0
-                income_by_source[source_name] += t.amount
+        transaction_count = 0
+        for transaction_type, name, amount, count, group_currency, day in groups:
+            if day is not None:
+                # One factor per currency and day, however many groups share it
+                amount *= converter.factor(group_currency, _as_date(day))
+            
+            totals[transaction_type] = totals.get(transaction_type, 0.0) + amount
+            transaction_count += count
+            
+            # Group by category / income source
+            if name is not None:
+                breakdown = expenses_by_category if transaction_type == 'expense' else income_by_source
+                breakdown[name] = breakdown.get(name, 0.0) + amount
         
-        return {
+        total_income = totals.get('income', 0.0)
+        total_expense = totals.get('expense', 0.0)
+        
+        summary = {
             'total_income': total_income,
             'total_expense': total_expense,
             'net_income': total_income - total_expense,
             'expenses_by_category': expenses_by_category,
             'income_by_source': income_by_source,
-            'transaction_count': len(transactions)
+            'transaction_count': transaction_count
         }
+        if currency is not None:
+            summary['currency'] = currency
+            summary['unconverted_currencies'] = sorted(converter.unconverted)
+        return summary
+    
+    def get_net_worth(self, user_id: int, currency: str, balances: List[dict] = None) -> dict:
+        """Sum of active wallet balances converted into currency at today's rates.
+        
+        balances are get_wallet_balances rows, fetched (cached) when not given.
+        """
+        if balances is None:
+            balances = self.get_wallet_balances(user_id)
+        rates = fx.get_rates(self)
+        today = datetime.utcnow().date()
+        total = 0.0
+        unconverted = set()
+        for wallet in balances:
+            try:
+                total += rates.convert(wallet['balance'] or 0.0, wallet['currency'], currency, today)
+            except fx.MissingRateError:
+                total += wallet['balance'] or 0.0
+                unconverted.add(wallet['currency'])
+        return {'currency': currency, 'total': total, 'unconverted_currencies': sorted(unconverted)}
+    
+    def get_balances_at(self, user_id: int, moment: datetime) -> Dict[int, float]:
+        """wallet_id -> balance after every transaction up to moment; wallets without any are left out"""
+        user_ledger = self.get_ledger(user_id)
+        if user_ledger is not None:
+            with user_ledger.lock:
+                return user_ledger.balances_at(moment)
+        signed = case((Transaction.transaction_type == 'income', Transaction.amount), else_=-Transaction.amount)
+        return dict(self.db.query(Transaction.wallet_id, func.sum(signed))
+                    .filter(*self._period_filter(user_id, None, moment))
+                    .group_by(Transaction.wallet_id).all())
     
     def get_wallet_balances(self, user_id: int) -> List[dict]:
-        wallets = self.get_user_wallets(user_id)
-        return [
+        return self._cached_result(user_id, ('wallet_balances',), lambda: [
             {
                 'id': wallet.id,
                 'name': wallet.name,
                 'currency': wallet.currency,
                 'balance': wallet.balance
             }
-            for wallet in wallets
-        ] 
\ No newline at end of file
+            for wallet in self.get_user_wallets(user_id)
+        ])
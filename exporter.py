@@ -0,0 +1,61 @@
+"""
+Streaming transaction export to CSV or JSON lines
+
+The output uses the same columns as the importer, so an export can be
+imported back. Rows are encoded one chunk at a time from the row iterator
+returned by DatabaseManager.iter_transactions_by_period.
+"""
+
+import csv
+import io
+import json
+from typing import Iterable, Iterator
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+COLUMNS = ['id', 'date', 'type', 'amount', 'currency', 'wallet', 'category', 'source', 'description']
+
+def _record(row) -> dict:
+    return {
+        'id': row.id,
+        'date': row.date.isoformat(),
+        'type': row.transaction_type,
+        'amount': row.amount,
+        'currency': row.currency,
+        'wallet': row.wallet,
+        'category': row.category,
+        'source': row.source,
+        'description': row.description
+    }
+
+def iter_csv(rows: Iterable, chunk_rows: int = 1000) -> Iterator[str]:
+    """Encode rows as CSV with a header, yielding one string per chunk of rows"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, COLUMNS)
+    writer.writeheader()
+    for n, row in enumerate(rows, start=1):
+        writer.writerow(_record(row))
+        if n % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def iter_ndjson(rows: Iterable, chunk_rows: int = 1000) -> Iterator[str]:
+    """Encode rows as JSON lines, yielding one string per chunk of rows"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(_record(row), ensure_ascii=False) + '\n')
+        if len(lines) >= chunk_rows:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+def export_rows(rows: Iterable, fmt: str = 'csv') -> Iterator[str]:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return iter_ndjson(rows) if fmt == 'ndjson' else iter_csv(rows)
@@ -0,0 +1,141 @@
+"""
+Currency conversion with dated FX rates
+
+Rates are stored in the fx_rates table as the price of one unit of a
+currency in Config.FX_BASE_CURRENCY on a given day. A conversion on some
+day uses the latest rate published on or before it. Each process keeps
+the whole table in memory and reloads it after FX_CACHE_TTL seconds, or
+immediately after it loads new rates itself.
+
+Rates file format (CSV with a header):
+
+    date,currency,rate
+    2024-01-02,USD,3.2712
+    2024-01-02,RUB,0.0362
+"""
+
+import csv
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+from typing import Iterable, List, Tuple
+
+from config import Config
+
+class MissingRateError(LookupError):
+    """No rate for a currency on or before the requested day"""
+
+class FxRates:
+    """Immutable snapshot of the rate table with as-of lookups"""
+
+    def __init__(self, rows: Iterable[Tuple[date, str, float]], base: str = None):
+        self.base = base or Config.FX_BASE_CURRENCY
+        series = {}
+        for day, currency, rate in sorted(rows):
+            days, rates = series.setdefault(currency, ([], []))
+            days.append(day)
+            rates.append(rate)
+        self._series = series
+
+    def __len__(self):
+        return sum(len(days) for days, _ in self._series.values())
+
+    def rate(self, currency: str, day: date) -> float:
+        """Price of one unit of currency in the base currency on day"""
+        if currency == self.base:
+            return 1.0
+        days, rates = self._series.get(currency, ((), ()))
+        index = bisect_right(days, day)
+        if index == 0:
+            raise MissingRateError(f"no {currency} rate on or before {day}")
+        return rates[index - 1]
+
+    def factor(self, from_currency: str, to_currency: str, day: date) -> float:
+        """Multiplier converting amounts from one currency to another on day"""
+        if from_currency == to_currency:
+            return 1.0
+        return self.rate(from_currency, day) / self.rate(to_currency, day)
+
+    def convert(self, amount: float, from_currency: str, to_currency: str, day: date) -> float:
+        return amount * self.factor(from_currency, to_currency, day)
+
+class Converter:
+    """Memoized factors into one currency for aggregated groups.
+    
+    A missing rate gives a factor of 1 (the amount stays unconverted) and
+    the currency is recorded in unconverted.
+    """
+
+    def __init__(self, rates: FxRates, currency: str):
+        self.rates = rates
+        self.currency = currency
+        self.unconverted = set()
+        self._factors = {}
+
+    def factor(self, from_currency: str, day: date) -> float:
+        key = (from_currency, day)
+        if key not in self._factors:
+            try:
+                self._factors[key] = self.rates.factor(from_currency, self.currency, day)
+            except MissingRateError:
+                self._factors[key] = 1.0
+                self.unconverted.add(from_currency)
+        return self._factors[key]
+
+def parse_rates(rows: Iterable[dict]) -> List[dict]:
+    """Validate {date, currency, rate} records into fx_rates rows; raises ValueError"""
+    parsed = []
+    for n, row in enumerate(rows, start=1):
+        try:
+            day = row['date'] if isinstance(row['date'], date) else date.fromisoformat(str(row['date']).strip()[:10])
+            currency = str(row['currency']).strip().upper()
+            rate = float(str(row['rate']).replace(',', '.'))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"rate {n}: expected date, currency and rate ({e})")
+        if currency not in Config.SUPPORTED_CURRENCIES:
+            raise ValueError(f"rate {n}: unsupported currency {currency!r}")
+        if currency == Config.FX_BASE_CURRENCY:
+            raise ValueError(f"rate {n}: {currency} is the base currency")
+        if not rate > 0:
+            raise ValueError(f"rate {n}: rate must be positive")
+        parsed.append({'day': day, 'currency': currency, 'rate': rate})
+    return parsed
+
+def read_rates_csv(stream) -> List[dict]:
+    """Parse a date,currency,rate CSV text stream"""
+    return parse_rates(csv.DictReader(stream))
+
+_lock = threading.Lock()
+_snapshot = None
+_loaded_at = 0.0
+# Bumped by invalidate_rates, so a load that started before it is not installed
+_generation = 0
+
+def _fresh() -> bool:
+    return _snapshot is not None and time.monotonic() - _loaded_at < Config.FX_CACHE_TTL
+
+def get_rates(db_manager) -> FxRates:
+    """The process-wide rate snapshot, reloaded from the database when stale"""
+    global _snapshot, _loaded_at
+    with _lock:
+        if _fresh():
+            return _snapshot
+        generation = _generation
+    # Loaded without the lock: under AsyncDatabaseManager the query hands the event loop to other
+    # handlers, and one of them waiting for the lock would block the loop the query needs to finish
+    rates = FxRates(db_manager.get_fx_rates())
+    with _lock:
+        if _fresh():
+            # Another caller loaded it meanwhile
+            return _snapshot
+        if generation == _generation:
+            _snapshot = rates
+            _loaded_at = time.monotonic()
+    return rates
+
+def invalidate_rates():
+    global _snapshot, _generation
+    with _lock:
+        _snapshot = None
+        _generation += 1
@@ -0,0 +1,29 @@
+"""
+Gunicorn settings for the web app (see wsgi.py)
+
+Workers are forked from a master that has already imported the app, so
+they start in milliseconds and share its memory pages. Each worker serves
+WEB_THREADS requests at once; keep DB_POOL_SIZE + DB_MAX_OVERFLOW at
+least that high. Caches and /metrics are per worker.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('WEB_THREADS', '4'))
+worker_class = 'gthread'
+preload_app = True
+timeout = int(os.getenv('WEB_TIMEOUT', '30'))
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot accumulate (0 = never)
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv('WEB_ACCESS_LOG') or None
+
+def post_fork(server, worker):
+    # The pool was created in the master; a forked worker must not reuse its
+    # connections (close=False leaves them open for the master) and opens its own
+    from models import engine
+    engine.dispose(close=False)
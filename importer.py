@@ -0,0 +1,228 @@
+"""
+Bulk transaction import from CSV or JSON lines
+
+Rows are parsed one at a time from the input stream, validated against the
+user's wallets, categories and income sources, and written in large batches
+through DatabaseManager.bulk_create_transactions. Invalid rows are reported
+with their line number and skipped; they never abort the import. Input that
+cannot be read at all (not UTF-8, broken CSV) stops it: the valid rows read
+before that point are stored and the report carries an 'error'.
+
+Recognized columns (CSV header or JSON keys):
+
+    date, type, amount, currency, wallet | wallet_id,
+    category | expense_category_id, source | income_source_id, description
+"""
+
+import codecs
+import csv
+import io
+import json
+import math
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Tuple
+
+from config import Config
+
+FORMATS = ('csv', 'ndjson')
+
+# Only the first errors are kept in the report; the failed counter is exact
+MAX_REPORTED_ERRORS = 1000
+
+def detect_format(filename: str = None, content_type: str = None) -> str:
+    """Guess the input format from a file name or MIME type (CSV by default)"""
+    name = (filename or '').lower()
+    mime = (content_type or '').lower()
+    if name.endswith(('.jsonl', '.ndjson', '.json')) or 'json' in mime:
+        return 'ndjson'
+    return 'csv'
+
+def decode_stream(binary):
+    """Wrap a binary stream for lazy UTF-8 decoding (a leading BOM is skipped)"""
+    try:
+        return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+    except (AttributeError, io.UnsupportedOperation):
+        # Objects without the full io interface (old SpooledTemporaryFile)
+        return codecs.getreader('utf-8-sig')(binary)
+
+def iter_csv_rows(stream) -> Iterator[Tuple[int, object]]:
+    """Yield (line number, row dict) from a text stream with a header line"""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+def iter_json_rows(stream) -> Iterator[Tuple[int, object]]:
+    """Yield (line number, object) from JSON lines; malformed lines yield the error"""
+    for line_num, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError as e:
+            yield line_num, e
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def _parse_date(value, now):
+    value = _text(value)
+    if value is None:
+        return now
+    try:
+        date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"invalid date {value!r}")
+    if date.tzinfo is not None:
+        try:
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
+        except OverflowError:
+            # 0001-01-01T00:00:00+05:00 has no UTC datetime
+            raise ValueError(f"date out of range {value!r}")
+    return date
+
+class TransactionImporter:
+    """Validates rows for one user and inserts them in batches"""
+
+    def __init__(self, db_manager, user_id: int, batch_size: int = 5000):
+        self.db_manager = db_manager
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.now = datetime.utcnow()
+
+        wallets = db_manager.get_user_wallets(user_id)
+        categories = db_manager.get_user_expense_categories(user_id)
+        sources = db_manager.get_user_income_sources(user_id)
+        self.wallets = self._index(wallets)
+        self.categories = self._index(categories)
+        self.sources = self._index(sources)
+        self.wallet_currency = {wallet.id: wallet.currency for wallet in wallets}
+
+    @staticmethod
+    def _index(items):
+        """Lookup table by id and by case-insensitive name"""
+        index = {}
+        for item in items:
+            index[item.id] = item.id
+            index.setdefault(item.name.strip().lower(), item.id)
+        return index
+
+    def _resolve(self, index, row, name_key, id_key, label):
+        raw_id = _text(row.get(id_key))
+        if raw_id is not None:
+            try:
+                key = int(raw_id)
+            except ValueError:
+                raise ValueError(f"invalid {id_key} {raw_id!r}")
+        else:
+            key = _text(row.get(name_key))
+            if key is None:
+                return None
+            key = key.lower()
+            # A spreadsheet may carry ids in the name column
+            if key not in index and key.isdigit():
+                key = int(key)
+        if key not in index:
+            raise ValueError(f"unknown {label} {raw_id or row.get(name_key)!r}")
+        return index[key]
+
+    def parse_row(self, row) -> dict:
+        """Validate one input row and return the transaction column values"""
+        if not isinstance(row, dict):
+            raise ValueError("row is not an object")
+
+        transaction_type = (_text(row.get('type') or row.get('transaction_type')) or '').lower()
+        if transaction_type not in ('income', 'expense'):
+            raise ValueError("type must be 'income' or 'expense'")
+
+        try:
+            amount = float(str(row.get('amount')).replace(',', '.').strip())
+        except ValueError:
+            raise ValueError(f"invalid amount {row.get('amount')!r}")
+        if not math.isfinite(amount) or amount <= 0:
+            raise ValueError("amount must be a positive number")
+
+        wallet_id = self._resolve(self.wallets, row, 'wallet', 'wallet_id', 'wallet')
+        if wallet_id is None:
+            raise ValueError("wallet is required")
+
+        currency = (_text(row.get('currency')) or self.wallet_currency[wallet_id]).upper()
+        if currency not in Config.SUPPORTED_CURRENCIES:
+            raise ValueError(f"unsupported currency {currency!r}")
+
+        expense_category_id = income_source_id = None
+        if transaction_type == 'expense':
+            expense_category_id = self._resolve(self.categories, row, 'category', 'expense_category_id', 'category')
+        else:
+            income_source_id = self._resolve(self.sources, row, 'source', 'income_source_id', 'income source')
+
+        return {
+            'user_id': self.user_id,
+            'wallet_id': wallet_id,
+            'transaction_type': transaction_type,
+            'amount': amount,
+            'currency': currency,
+            'description': _text(row.get('description')),
+            'date': _parse_date(row.get('date'), self.now),
+            'income_source_id': income_source_id,
+            'expense_category_id': expense_category_id,
+            'created_at': self.now,
+            'updated_at': self.now
+        }
+
+    def run(self, rows: Iterable[Tuple[int, object]]) -> dict:
+        """Import (line number, row) pairs and return a report.
+
+        If the input stops being readable, the report has an 'error' and
+        'imported' counts every row stored, all from before that point.
+        """
+        imported = failed = 0
+        errors = []
+        batch = []
+        file_error = None
+        rows = iter(rows)
+        line_num = 0
+
+        while True:
+            try:
+                line_num, row = next(rows)
+            except StopIteration:
+                break
+            except UnicodeDecodeError as e:
+                file_error = f"input is not valid UTF-8 after line {line_num}: {e.reason}"
+                break
+            except csv.Error as e:
+                file_error = f"malformed CSV after line {line_num}: {e}"
+                break
+
+            try:
+                if isinstance(row, Exception):
+                    raise ValueError(f"malformed line: {row}")
+                batch.append(self.parse_row(row))
+            except ValueError as e:
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'line': line_num, 'error': str(e)})
+                continue
+
+            if len(batch) >= self.batch_size:
+                imported += self.db_manager.bulk_create_transactions(self.user_id, batch)
+                batch = []
+
+        if batch:
+            imported += self.db_manager.bulk_create_transactions(self.user_id, batch)
+
+        report = {'imported': imported, 'failed': failed, 'errors': errors}
+        if file_error is not None:
+            report['error'] = file_error
+        return report
+
+def import_transactions(db_manager, user_id: int, binary, fmt: str = 'csv', batch_size: int = 5000) -> dict:
+    """Import transactions for a user from a binary stream in the given format"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported import format: {fmt}")
+    stream = decode_stream(binary)
+    rows = iter_json_rows(stream) if fmt == 'ndjson' else iter_csv_rows(stream)
+    return TransactionImporter(db_manager, user_id, batch_size).run(rows)
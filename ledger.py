@@ -0,0 +1,207 @@
+"""
+Per-user columnar ledgers for analytics without SQL
+
+A UserLedger splits one user's transactions into partitions by the
+daily_rollups key (wallet, type, category or source, currency). Each
+partition keeps typed arrays ordered by (date, id): timestamp, id,
+amount and the running total of amounts with its rounding error (a
+compensated sum), 40 bytes per transaction. The total of any period is
+then two bisections and a subtraction per partition, so summaries and
+balances at a date cost the same for a month as for the whole history;
+only conversion into another currency walks the days of foreign
+partitions.
+
+Thanks to the compensation a span's total is its correctly rounded sum
+(math.fsum of its amounts), however large the running total before it.
+SQL SUM rounds after every row in scan order (and sums daily_rollups
+that were themselves summed that way), so the two paths can differ in the
+last bits of a float; with the engine on, every answer comes from it.
+
+Ledgers live in ledger_cache, an LRU of users sized by
+Config.LEDGER_CACHE_USERS (0 turns the engine off). DatabaseManager loads
+them on first use, applies its own transaction writes to them and checks
+the user's data_versions on every read, so writes made by other processes
+cause a reload instead of a stale answer.
+"""
+
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from math import fsum
+from typing import Dict, Iterable, Iterator, Tuple
+
+from cache import LRUCache
+from config import Config
+import metrics
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+DAY_MICROS = 86400 * 10**6
+
+def to_micros(moment) -> int:
+    """Microseconds since the epoch of a naive UTC datetime or its ISO string (SQLite)"""
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+def running_sums(amounts, running: float = 0.0, error: float = 0.0) -> Tuple[array, array]:
+    """Prefix sums of amounts and their rounding errors (TwoSum), from running + error on.
+
+    running[i] + errors[i] is the sum of amounts[:i + 1] to about twice double precision.
+    """
+    sums, errors = array('d'), array('d')
+    for amount in amounts:
+        total = running + amount
+        virtual = total - running
+        error += (running - (total - virtual)) + (amount - virtual)
+        running = total
+        sums.append(running)
+        errors.append(error)
+    return sums, errors
+
+class Partition:
+    """Transactions sharing a rollup key, as arrays ordered by (date, id)"""
+
+    __slots__ = ('moments', 'ids', 'amounts', 'running', 'errors')
+
+    def __init__(self, moments=(), ids=(), amounts=()):
+        self.moments = array('q', moments)
+        self.ids = array('q', ids)
+        self.amounts = array('d', amounts)
+        self.running, self.errors = running_sums(self.amounts)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column)
+                   for column in (self.moments, self.ids, self.amounts, self.running, self.errors))
+
+    def span(self, start: int, end: int) -> Tuple[int, int]:
+        """Index range of rows with start <= moment <= end"""
+        return bisect_left(self.moments, start), bisect_right(self.moments, end)
+
+    def total(self, lo: int, hi: int) -> float:
+        """Correctly rounded sum of amounts[lo:hi]"""
+        if lo >= hi:
+            return 0.0
+        if not lo:
+            return fsum((self.running[hi - 1], self.errors[hi - 1]))
+        return fsum((self.running[hi - 1], self.errors[hi - 1], -self.running[lo - 1], -self.errors[lo - 1]))
+
+    def days(self, lo: int, hi: int) -> Iterator[Tuple[int, int, int]]:
+        """(day ordinal, lo, hi) of each day with rows in lo..hi"""
+        while lo < hi:
+            day = self.moments[lo] // DAY_MICROS
+            end = bisect_left(self.moments, (day + 1) * DAY_MICROS, lo, hi)
+            yield EPOCH_ORDINAL + day, lo, end
+            lo = end
+
+    def _rerun(self, position: int):
+        """Recompute running totals from position on, exactly as a fresh load would"""
+        start = (self.running[position - 1], self.errors[position - 1]) if position else ()
+        self.running[position:], self.errors[position:] = running_sums(self.amounts[position:], *start)
+
+    def insert(self, moment: int, transaction_id: int, amount: float):
+        position = bisect_right(self.moments, moment)
+        while position > 0 and self.moments[position - 1] == moment and self.ids[position - 1] > transaction_id:
+            position -= 1
+        self.moments.insert(position, moment)
+        self.ids.insert(position, transaction_id)
+        self.amounts.insert(position, amount)
+        self._rerun(position)
+
+    def remove(self, moment: int, transaction_id: int) -> bool:
+        position = bisect_left(self.moments, moment)
+        while position < len(self.ids) and self.moments[position] == moment:
+            if self.ids[position] == transaction_id:
+                del self.moments[position], self.ids[position], self.amounts[position]
+                self._rerun(position)
+                return True
+            position += 1
+        return False
+
+class UserLedger:
+    """One user's transactions partitioned by (wallet_id, transaction_type, ref_id, currency).
+
+    versions holds the data_versions the arrays correspond to and names maps
+    transaction type -> {category or source id: name}. Readers and writers
+    take lock.
+    """
+
+    def __init__(self, rows: Iterable, versions: dict, names: Dict[str, dict]):
+        """rows are (id, date, transaction_type, amount, currency, wallet_id, ref_id) ordered by (date, id)"""
+        self.versions = dict(versions)
+        self.names = names
+        self.lock = threading.Lock()
+        columns = {}
+        for transaction_id, moment, transaction_type, amount, currency, wallet_id, ref_id in rows:
+            moments, ids, amounts = columns.setdefault((wallet_id, transaction_type, ref_id, currency), ([], [], []))
+            moments.append(to_micros(moment))
+            ids.append(transaction_id)
+            amounts.append(amount)
+        self.partitions = {key: Partition(*values) for key, values in columns.items()}
+
+    def __len__(self):
+        return sum(len(partition) for partition in self.partitions.values())
+
+    def nbytes(self) -> int:
+        """Memory held by the partition arrays"""
+        return sum(partition.nbytes() for partition in self.partitions.values())
+
+    def add(self, transaction_id: int, moment: datetime, transaction_type: str, amount: float,
+            currency: str, wallet_id: int, ref_id: int):
+        key = (wallet_id, transaction_type, ref_id, currency)
+        self.partitions.setdefault(key, Partition()).insert(to_micros(moment), transaction_id, amount)
+
+    def remove(self, transaction_id: int, moment: datetime, transaction_type: str,
+               currency: str, wallet_id: int, ref_id: int) -> bool:
+        partition = self.partitions.get((wallet_id, transaction_type, ref_id, currency))
+        return partition is not None and partition.remove(to_micros(moment), transaction_id)
+
+    def period_groups(self, start_date: datetime, end_date: datetime, convert_to: str = None) -> list:
+        """The groups DatabaseManager._period_groups returns, computed from the partitions"""
+        start, end = to_micros(start_date), to_micros(end_date)
+        merged = {}
+
+        def add(group, total, count):
+            previous_total, previous_count = merged.get(group, (0.0, 0))
+            merged[group] = (previous_total + total, previous_count + count)
+
+        for (wallet_id, transaction_type, ref_id, currency), partition in self.partitions.items():
+            lo, hi = partition.span(start, end)
+            if lo == hi:
+                continue
+            name = self.names.get(transaction_type, {}).get(ref_id)
+            if convert_to is None:
+                add((transaction_type, name, None, None), partition.total(lo, hi), hi - lo)
+            elif currency == convert_to:
+                add((transaction_type, name, currency, None), partition.total(lo, hi), hi - lo)
+            else:
+                # Foreign amounts are converted at the rate of their day
+                for day, day_lo, day_hi in partition.days(lo, hi):
+                    add((transaction_type, name, currency, date.fromordinal(day)),
+                        partition.total(day_lo, day_hi), day_hi - day_lo)
+
+        return [(transaction_type, name, total, count, currency, day)
+                for (transaction_type, name, currency, day), (total, count) in merged.items()]
+
+    def balances_at(self, moment: datetime) -> Dict[int, float]:
+        """Balance of every wallet with transactions on or before moment"""
+        end = to_micros(moment)
+        balances = {}
+        for (wallet_id, transaction_type, _, _), partition in self.partitions.items():
+            hi = bisect_right(partition.moments, end)
+            if hi:
+                # As in create_transaction: income adds to the wallet, anything else subtracts
+                total = partition.total(0, hi)
+                balances[wallet_id] = balances.get(wallet_id, 0.0) + (total if transaction_type == 'income' else -total)
+        return balances
+
+def enabled() -> bool:
+    return ledger_cache.maxsize > 0
+
+# user id -> UserLedger; entries are validated against data_versions, not expired
+ledger_cache = LRUCache(Config.LEDGER_CACHE_USERS, float('inf'))
+metrics.register_cache('ledgers', ledger_cache)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Maintenance commands for Finance Manager Bot
+
+    python manage.py init-db
+    python manage.py rebuild-rollups [--telegram-id ID]
+    python manage.py import-transactions --telegram-id ID FILE [--format csv|ndjson]
+    python manage.py load-fx-rates FILE
+    python manage.py slow-queries [--top N] [--sort total|mean|max|count] [--since YYYY-MM-DD] [--plans]
+    python manage.py notify (--all | --telegram-id ID ...) [--kind KIND] [--key KEY] TEXT
+"""
+
+import argparse
+import sys
+import time
+
+from models import SessionLocal
+from database import DatabaseManager
+from migrate_db import init_database
+from importer import import_transactions, detect_format, FORMATS
+import fx
+import slowlog
+
+def init_db(args):
+    """Create missing tables and apply pending migrations (once per deploy, before the workers start)"""
+    return 0 if init_database() else 1
+
+def rebuild_rollups(args):
+    """Recompute the daily rollup table from the transaction history"""
+    db = SessionLocal()
+    try:
+        db_manager = DatabaseManager(db)
+        user_id = None
+        if args.telegram_id:
+            user = db_manager.get_user(args.telegram_id)
+            if not user:
+                print(f"❌ User {args.telegram_id} not found")
+                return 1
+            user_id = user.id
+
+        print("🔄 Rebuilding daily rollups...")
+        rows = db_manager.rebuild_daily_rollups(user_id)
+        print(f"✅ Wrote {rows} rollup rows")
+        return 0
+    finally:
+        db.close()
+
+def import_file(args):
+    """Bulk import transactions from a CSV or JSON lines file ('-' for stdin)"""
+    db = SessionLocal()
+    try:
+        db_manager = DatabaseManager(db)
+        user = db_manager.get_user(args.telegram_id)
+        if not user:
+            print(f"❌ User {args.telegram_id} not found")
+            return 1
+
+        fmt = args.format or detect_format(args.file)
+        stream = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+        print(f"📥 Importing {args.file} ({fmt})...")
+        started = time.perf_counter()
+        try:
+            report = import_transactions(db_manager, user.id, stream,
+                                         fmt, batch_size=args.batch_size)
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+        elapsed = time.perf_counter() - started
+
+        for error in report['errors']:
+            print(f"⚠️  line {error['line']}: {error['error']}")
+        if 'error' in report:
+            print(f"❌ Stopped: {report['error']}; imported {report['imported']} rows before it")
+            return 1
+        print(f"✅ Imported {report['imported']} rows in {elapsed:.2f}s, {report['failed']} failed")
+        return 0 if not report['failed'] else 2
+    finally:
+        db.close()
+
+def load_fx_rates(args):
+    """Load dated FX rates from a date,currency,rate CSV file ('-' for stdin)"""
+    stream = sys.stdin if args.file == '-' else open(args.file, newline='', encoding='utf-8-sig')
+    try:
+        rates = fx.read_rates_csv(stream)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    db = SessionLocal()
+    try:
+        loaded = DatabaseManager(db).upsert_fx_rates(rates)
+        print(f"✅ Loaded {loaded} FX rates")
+        return 0
+    finally:
+        db.close()
+
+def slow_queries(args):
+    """Top statements of the slow query log, grouped by fingerprint"""
+    rows = slowlog.report(slowlog.read_log(args.log), top=args.top, sort=args.sort, since=args.since)
+    if not rows:
+        print("✅ No slow queries logged")
+        return 0
+
+    for n, row in enumerate(rows, start=1):
+        trend = row['recent_ms'] / row['early_ms'] if row['early_ms'] else 1.0
+        print(f"🐢 {n}. [{row['fingerprint']}] {row['count']} × {row['mean_ms']:.1f} ms "
+              f"(total {row['total_ms'] / 1000:.2f}s, max {row['max_ms']:.1f} ms, "
+              f"early {row['early_ms']:.1f} → recent {row['recent_ms']:.1f} ms, ×{trend:.2f})")
+        print(f"   {row['statement'][:300]}")
+        if row['callers']:
+            print(f"   from {', '.join(f'{name} ({count})' for name, count in row['callers'].items())}")
+        print(f"   via {', '.join(f'{name} ({count})' for name, count in row['sources'].items())}")
+        if args.plans and row['plan']:
+            print(f"   plan ({row['plan_at']}):")
+            for line in row['plan']:
+                print(f"     {line}")
+    return 0
+
+def notify(args):
+    """Queue a message for the bot's notification dispatcher ('-' reads the text from stdin)"""
+    text = sys.stdin.read() if args.text == '-' else args.text
+    if not text.strip():
+        print("❌ Empty message")
+        return 1
+
+    db = SessionLocal()
+    try:
+        db_manager = DatabaseManager(db)
+        queued = db_manager.enqueue_broadcast(text, kind=args.kind, dedup_key=args.key,
+                                              telegram_ids=None if args.all else args.telegram_id)
+        counts = db_manager.get_notification_counts()
+        print(f"📨 Queued {queued} notifications; the bot sends them within NOTIFY_RATE")
+        print(f"   queue: {', '.join(f'{status} {count}' for status, count in sorted(counts.items()))}")
+        return 0
+    finally:
+        db.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Finance Manager Bot maintenance commands')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    init = subparsers.add_parser('init-db', help='create missing tables and apply pending migrations')
+    init.set_defaults(func=init_db)
+
+    rebuild = subparsers.add_parser('rebuild-rollups', help='recompute daily rollups from the transaction history')
+    rebuild.add_argument('--telegram-id', type=int, help='only rebuild this user')
+    rebuild.set_defaults(func=rebuild_rollups)
+
+    load = subparsers.add_parser('import-transactions', help='bulk import transactions from CSV or JSON lines')
+    load.add_argument('--telegram-id', type=int, required=True, help='owner of the imported transactions')
+    load.add_argument('--format', choices=FORMATS, help='input format (guessed from the file name by default)')
+    load.add_argument('--batch-size', type=int, default=5000, help='rows per insert batch')
+    load.add_argument('file', help="input file, or '-' for stdin")
+    load.set_defaults(func=import_file)
+
+    rates = subparsers.add_parser('load-fx-rates', help='load dated FX rates from a date,currency,rate CSV file')
+    rates.add_argument('file', help="rates file, or '-' for stdin")
+    rates.set_defaults(func=load_fx_rates)
+
+    slow = subparsers.add_parser('slow-queries', help='top statements of the slow query log')
+    slow.add_argument('--top', type=int, default=20, help='statements to show')
+    slow.add_argument('--sort', choices=slowlog.SORT_KEYS, default='total', help='order by total, mean or max time, or count')
+    slow.add_argument('--since', help='only entries logged on or after this date (UTC)')
+    slow.add_argument('--plans', action='store_true', help='print the latest captured plan of each statement')
+    slow.add_argument('--log', help='log file (SLOW_QUERY_LOG by default)')
+    slow.set_defaults(func=slow_queries)
+
+    send = subparsers.add_parser('notify', help='queue a message to users for the bot to send')
+    recipients = send.add_mutually_exclusive_group(required=True)
+    recipients.add_argument('--all', action='store_true', help='every user')
+    recipients.add_argument('--telegram-id', type=int, action='append', help='a recipient (repeatable)')
+    send.add_argument('--kind', default='broadcast', help='label for metrics, e.g. budget_alert or monthly_report')
+    send.add_argument('--key', help='broadcast id: running the command again with it skips users already queued')
+    send.add_argument('text', help="HTML message text, or '-' for stdin")
+    send.set_defaults(func=notify)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
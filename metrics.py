@@ -0,0 +1,356 @@
+"""
+Prometheus metrics for the web app and the bot
+
+A small in-process registry rendered in the Prometheus text format by
+GET /metrics (and by serve() in a bot-only process). What is recorded:
+
+- HTTP requests: count by route and status, latency histogram, SQL
+  statements and database time per request
+- every SQL statement through SQLAlchemy engine events, and the
+  connection pool and cache counters at scrape time
+- bot updates by type, and handler latency, errors and SQL statements
+- outbound notifications by outcome, Bot API send latency, delivery delay
+  and time spent waiting for the rate limits
+
+Routes are labelled by their URL rule, never the raw path, so user ids do
+not multiply the series. METRICS_ENABLED=false turns all recording off.
+"""
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Tuple
+
+from sqlalchemy import event
+
+from config import Config
+
+# Seconds; requests and handlers
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds; single SQL statements
+STATEMENT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# Statements per request or handler
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Seconds; from queueing a notification to its delivery
+DELAY_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+enabled = Config.METRICS_ENABLED
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """(name suffix, formatted labels, value) of every sample"""
+        return []
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines += [f'{self.name}{suffix}{labels} {_format_value(value)}' for suffix, labels, value in self.samples()]
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [('', _format_labels(self.labelnames, labels), value) for labels, value in items]
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, labels: tuple = ()) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, ([*counts], total, count)) for labels, (counts, total, count) in self._series.items())
+        samples = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"'),
+                                cumulative))
+            samples.append(('_sum', _format_labels(self.labelnames, labels), total))
+            samples.append(('_count', _format_labels(self.labelnames, labels), count))
+        return samples
+
+class Collected(Metric):
+    """Metric read at scrape time from collect() -> [(label values, value)]"""
+
+    def __init__(self, name, documentation, labelnames, collect: Callable, kind: str = 'gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self):
+        return [('', _format_labels(self.labelnames, labels), value) for labels, value in self.collect()]
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    'finance_http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status')))
+http_latency = registry.register(Histogram(
+    'finance_http_request_duration_seconds', 'Time to the response headers', ('method', 'route')))
+http_sql_statements = registry.register(Histogram(
+    'finance_http_request_sql_statements', 'SQL statements per request', ('method', 'route'), COUNT_BUCKETS))
+http_db_time = registry.register(Histogram(
+    'finance_http_request_db_seconds', 'Time spent in SQL per request', ('method', 'route')))
+sql_statements = registry.register(Counter(
+    'finance_db_statements_total', 'SQL statements executed'))
+sql_latency = registry.register(Histogram(
+    'finance_db_statement_duration_seconds', 'Duration of single SQL statements', (), STATEMENT_BUCKETS))
+bot_updates = registry.register(Counter(
+    'finance_bot_updates_total', 'Telegram updates received, by type', ('type',)))
+bot_latency = registry.register(Histogram(
+    'finance_bot_handler_duration_seconds', 'Bot handler run time', ('handler',)))
+bot_errors = registry.register(Counter(
+    'finance_bot_handler_errors_total', 'Bot handlers that raised', ('handler',)))
+bot_sql_statements = registry.register(Histogram(
+    'finance_bot_handler_sql_statements', 'SQL statements per bot handler run', ('handler',), COUNT_BUCKETS))
+notifications = registry.register(Counter(
+    'finance_notifications_total', 'Notification send attempts by kind and outcome (sent, retried, rate_limited, failed)',
+    ('kind', 'outcome')))
+notification_send_latency = registry.register(Histogram(
+    'finance_notification_send_seconds', 'Bot API sendMessage round trip for notifications'))
+notification_delay = registry.register(Histogram(
+    'finance_notification_delay_seconds', 'Time from queueing a notification to its delivery', ('kind',), DELAY_BUCKETS))
+notification_throttled = registry.register(Counter(
+    'finance_notification_throttled_seconds_total', 'Time notifications waited for a rate limit', ('limit',)))
+
+# SQL statements and time of the request or handler running in this context
+_tally = contextvars.ContextVar('metrics_sql_tally', default=None)
+
+class Timer:
+    """Start time and SQL tally of one request or handler run; source names it ("GET <rule>", "bot <handler>")"""
+
+    __slots__ = ('source', 'started', 'statements', 'db_seconds', '_token')
+
+    def __init__(self, source: str = None):
+        self.source = source
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self._token = _tally.set(self)
+
+    def stop(self) -> float:
+        """Elapsed seconds; later statements in this context are no longer counted"""
+        try:
+            _tally.reset(self._token)
+        except ValueError:
+            # Stopped from another context (e.g. a generator finished elsewhere)
+            _tally.set(None)
+        return time.perf_counter() - self.started
+
+def current_source() -> str:
+    """Route or bot handler running in this context, if any"""
+    timer = _tally.get()
+    return timer.source if timer is not None else None
+
+def start_request(method: str, route: str) -> Timer:
+    return Timer(f'{method} {route}')
+
+def finish_request(timer: Timer, method: str, route: str, status: int):
+    elapsed = timer.stop()
+    if not enabled:
+        return
+    labels = (method, route)
+    http_requests.inc((method, route, str(status)))
+    http_latency.observe(elapsed, labels)
+    http_sql_statements.observe(timer.statements, labels)
+    http_db_time.observe(timer.db_seconds, labels)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context, which a failing statement takes with it
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+# Callbacks run after every statement with (conn, cursor, statement, parameters, executemany, elapsed)
+statement_hooks = []
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    for hook in statement_hooks:
+        hook(conn, cursor, statement, parameters, executemany, elapsed)
+    if not enabled:
+        return
+    sql_statements.inc()
+    sql_latency.observe(elapsed)
+    timer = _tally.get()
+    if timer is not None:
+        timer.statements += 1
+        timer.db_seconds += elapsed
+
+def instrument_engine(engine):
+    """Count and time every statement run on engine"""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+_pool_stats = None
+_caches = {}
+_outbox_stats = None
+
+def register_pool(stats: Callable[[], dict]):
+    """Export the connection pool counters returned by stats() at scrape time"""
+    global _pool_stats
+    _pool_stats = stats
+
+def register_outbox(stats: Callable[[], dict]):
+    """Export the notification dispatcher's {'in_flight': n} at scrape time"""
+    global _outbox_stats
+    _outbox_stats = stats
+
+def register_cache(name: str, cache):
+    """Export hits, misses and size of a cache with a stats() method"""
+    _caches[name] = cache
+
+def _collect_pool():
+    stats = _pool_stats() if _pool_stats else {}
+    return [((state,), stats[state]) for state in ('size', 'checkedin', 'checkedout', 'overflow') if state in stats]
+
+def _collect_outbox():
+    stats = _outbox_stats() if _outbox_stats else {}
+    return [((), stats['in_flight'])] if 'in_flight' in stats else []
+
+def _collect_caches(field: str):
+    def collect():
+        samples = []
+        for name, cache in sorted(_caches.items()):
+            stats = cache.stats()
+            if field in stats:
+                samples.append(((name,), stats[field]))
+        return samples
+    return collect
+
+registry.register(Collected(
+    'finance_db_pool_connections', 'Connection pool state', ('state',), _collect_pool))
+registry.register(Collected(
+    'finance_notifications_in_flight', 'Notifications claimed by this process and not yet finished', (),
+    _collect_outbox))
+registry.register(Collected(
+    'finance_cache_hits_total', 'Cache hits', ('cache',), _collect_caches('hits'), 'counter'))
+registry.register(Collected(
+    'finance_cache_misses_total', 'Cache misses', ('cache',), _collect_caches('misses'), 'counter'))
+registry.register(Collected(
+    'finance_cache_entries', 'Entries held by in-process caches', ('cache',), _collect_caches('size')))
+
+def update_type(update) -> str:
+    """The first field set on a Telegram update (message, callback_query, ...)"""
+    for field in ('message', 'edited_message', 'callback_query', 'inline_query', 'channel_post',
+                  'my_chat_member', 'chat_member', 'pre_checkout_query', 'shipping_query', 'poll'):
+        if getattr(update, field, None) is not None:
+            return field
+    return 'other'
+
+def count_update(update):
+    if enabled:
+        bot_updates.inc((update_type(update),))
+
+def instrument_handler(name: str, callback):
+    """Wrap an async bot handler to record its latency, errors and SQL statements"""
+    async def wrapper(*args, **kwargs):
+        timer = Timer(f'bot {name}')
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            if enabled:
+                bot_errors.inc((name,))
+            raise
+        finally:
+            elapsed = timer.stop()
+            if enabled:
+                bot_latency.observe(elapsed, (name,))
+                bot_sql_statements.observe(timer.statements, (name,))
+    wrapper.__name__ = getattr(callback, '__name__', name)
+    wrapper.__doc__ = getattr(callback, '__doc__', None)
+    return wrapper
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def serve(port: int, host: str = '0.0.0.0'):
+    """Serve /metrics from a daemon thread, for processes without the web app"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics').start()
+    return server
@@ -1,74 +1,172 @@
 #!/usr/bin/env python3
 """
-Database migration script for Render deployment
+Versioned database migrations
+
+Migrations are applied in order and recorded in the schema_version table,
+so each one runs exactly once per database. Every migration receives an
+open connection inside a transaction and must work on SQLite and PostgreSQL.
 """
 
-import os
-from sqlalchemy import create_engine, text
-from config import Config
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+
+# (version, description, function) tuples, kept sorted by version
+MIGRATIONS = []
+
+def migration(version, description):
+    """Register a migration function under the given version number"""
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+def _table_exists(conn, table_name):
+    if conn.dialect.name == 'postgresql':
+        result = conn.execute(text("""
+            SELECT table_name
+            FROM information_schema.tables
+            WHERE table_schema = 'public'
+            AND table_name = :table_name
+        """), {'table_name': table_name})
+    else:
+        result = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = :table_name"
+        ), {'table_name': table_name})
+    return result.fetchone() is not None
+
+def _column_exists(conn, table_name, column_name):
+    return any(column['name'] == column_name for column in inspect(conn).get_columns(table_name))
+
+def _create_index(conn, name, table, columns, active_only=False):
+    where = ''
+    if active_only:
+        where = ' WHERE is_active' if conn.dialect.name == 'postgresql' else ' WHERE is_active = 1'
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns}){where}"))
+
+@migration(1, 'Widen telegram_id and user_id columns to BIGINT')
+def widen_user_ids(conn):
+    # SQLite integers are already 64-bit
+    if conn.dialect.name != 'postgresql' or not _table_exists(conn, 'users'):
+        return
+
+    result = conn.execute(text("""
+        SELECT data_type
+        FROM information_schema.columns
+        WHERE table_name = 'users'
+        AND column_name = 'telegram_id'
+    """))
+    column_type = result.fetchone()
+    if not column_type or column_type[0] != 'integer':
+        return
+
+    print("⚠️  telegram_id is INTEGER, migrating to BIGINT...")
+    conn.execute(text("ALTER TABLE users ALTER COLUMN telegram_id TYPE BIGINT"))
+    for table in ['wallets', 'income_sources', 'expense_categories', 'transactions']:
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN user_id TYPE BIGINT"))
+        print(f"✅ Migrated {table}.user_id to BIGINT")
+
+@migration(2, 'Add per-user ledger indexes')
+def add_ledger_indexes(conn):
+    _create_index(conn, 'ix_transactions_user_date', 'transactions', 'user_id, date')
+    _create_index(conn, 'ix_wallets_user_active', 'wallets', 'user_id', active_only=True)
+    _create_index(conn, 'ix_income_sources_user_active', 'income_sources', 'user_id', active_only=True)
+    _create_index(conn, 'ix_expense_categories_user_active', 'expense_categories', 'user_id', active_only=True)
+
+@migration(3, 'Extend the transactions date index with id for keyset pagination')
+def extend_transactions_date_index(conn):
+    _create_index(conn, 'ix_transactions_user_date_id', 'transactions', 'user_id, date, id')
+    conn.execute(text("DROP INDEX IF EXISTS ix_transactions_user_date"))
+
+@migration(4, 'Add daily_rollups and backfill it from the ledger')
+def add_daily_rollups(conn):
+    from sqlalchemy.orm import Session
+    from models import DailyRollup
+    from database import DatabaseManager
+
+    DailyRollup.__table__.create(conn, checkfirst=True)
+    rows = DatabaseManager(Session(bind=conn)).rebuild_daily_rollups()
+    print(f"✅ Backfilled {rows} daily rollup rows")
+
+@migration(5, 'Add data_versions for conditional GETs of reference lists')
+def add_data_versions(conn):
+    from models import DataVersion
+
+    DataVersion.__table__.create(conn, checkfirst=True)
+
+@migration(6, 'Add fx_rates for currency conversion')
+def add_fx_rates(conn):
+    from models import FxRate
+
+    FxRate.__table__.create(conn, checkfirst=True)
+
+@migration(7, 'Add notification_jobs for the outbound message queue')
+def add_notification_jobs(conn):
+    from models import NotificationJob
+
+    NotificationJob.__table__.create(conn, checkfirst=True)
+
+@migration(8, 'Add notification_jobs.claimed_at to expire claims of dead dispatchers')
+def add_notification_claimed_at(conn):
+    if not _column_exists(conn, 'notification_jobs', 'claimed_at'):
+        conn.execute(text("ALTER TABLE notification_jobs ADD COLUMN claimed_at TIMESTAMP"))
+
+def _ensure_version_table(conn):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """))
+
+def get_schema_version(conn):
+    """Return the highest applied migration version (0 for a fresh database)"""
+    _ensure_version_table(conn)
+    version = conn.execute(text(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}")).scalar()
+    return version or 0
+
+def migrate_database(engine=None, create_tables=False):
+    """Apply all pending migrations in order, after creating missing tables with create_tables"""
+    if engine is None:
+        from models import engine
+
+    print("🔄 Checking database migrations...")
 
-def migrate_database():
-    """Migrate database to support BigInteger telegram_id"""
-    print("🔄 Starting database migration...")
-    
     try:
-        # Create engine
-        engine = create_engine(Config.DATABASE_URL)
-        
-        with engine.connect() as conn:
-            # Check if tables exist
-            result = conn.execute(text("""
-                SELECT table_name 
-                FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'users'
-            """))
-            
-            if result.fetchone():
-                print("✅ Users table exists, checking column type...")
-                
-                # Check telegram_id column type
-                result = conn.execute(text("""
-                    SELECT data_type 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'users' 
-                    AND column_name = 'telegram_id'
-                """))
-                
-                column_type = result.fetchone()
-                if column_type and column_type[0] == 'integer':
-                    print("⚠️  telegram_id is INTEGER, migrating to BIGINT...")
-                    
-                    # Migrate telegram_id to BIGINT
-                    conn.execute(text("""
-                        ALTER TABLE users 
-                        ALTER COLUMN telegram_id TYPE BIGINT
-                    """))
-                    
-                    # Migrate user_id in related tables
-                    tables = ['wallets', 'income_sources', 'expense_categories', 'transactions']
-                    for table in tables:
-                        try:
-                            conn.execute(text(f"""
-                                ALTER TABLE {table} 
-                                ALTER COLUMN user_id TYPE BIGINT
-                            """))
-                            print(f"✅ Migrated {table}.user_id to BIGINT")
-                        except Exception as e:
-                            print(f"⚠️  Could not migrate {table}.user_id: {e}")
-                    
-                    conn.commit()
-                    print("✅ Database migration completed successfully!")
-                else:
-                    print("✅ telegram_id is already BIGINT or doesn't exist")
-            else:
-                print("ℹ️  Users table doesn't exist, will be created with correct types")
-                
+        with engine.begin() as conn:
+            if conn.dialect.name == 'postgresql':
+                # Serialize concurrent runners (several workers starting at once)
+                conn.execute(text("SELECT pg_advisory_xact_lock(72853001)"))
+            if create_tables:
+                from models import Base
+                Base.metadata.create_all(bind=conn)
+
+            current = get_schema_version(conn)
+            for version, description, func in MIGRATIONS:
+                if version <= current:
+                    continue
+                print(f"⏩ Applying migration {version}: {description}")
+                func(conn)
+                conn.execute(text(f"""
+                    INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at)
+                    VALUES (:version, :description, :applied_at)
+                """), {'version': version, 'description': description, 'applied_at': datetime.utcnow()})
+                current = version
+
+        print(f"✅ Database schema is at version {current}")
     except Exception as e:
         print(f"❌ Migration error: {e}")
         return False
-    
+
     return True
 
+def init_database(engine=None):
+    """One-time schema setup for a deploy: create missing tables, then apply pending migrations"""
+    # Under the migration lock: services starting together must not race on CREATE TABLE
+    return migrate_database(engine, create_tables=True)
+
 if __name__ == '__main__':
-    migrate_database() 
\ No newline at end of file
+    migrate_database()
@@ -1,8 +1,11 @@
-from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import create_engine, make_url, Column, Integer, BigInteger, String, Float, Date, DateTime, ForeignKey, Text, Boolean, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+import threading
 from config import Config
+import metrics
+import slowlog
 
 Base = declarative_base()
 
@@ -26,6 +29,11 @@ class User(Base):
 
 class Wallet(Base):
     __tablename__ = 'wallets'
+    __table_args__ = (
+        # List queries only ever ask for active rows
+        Index('ix_wallets_user_active', 'user_id',
+              postgresql_where=text('is_active'), sqlite_where=text('is_active = 1')),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(BigInteger, ForeignKey('users.id'), nullable=False)
@@ -42,6 +50,10 @@ class Wallet(Base):
 
 class IncomeSource(Base):
     __tablename__ = 'income_sources'
+    __table_args__ = (
+        Index('ix_income_sources_user_active', 'user_id',
+              postgresql_where=text('is_active'), sqlite_where=text('is_active = 1')),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(BigInteger, ForeignKey('users.id'), nullable=False)
@@ -57,6 +69,10 @@ class IncomeSource(Base):
 
 class ExpenseCategory(Base):
     __tablename__ = 'expense_categories'
+    __table_args__ = (
+        Index('ix_expense_categories_user_active', 'user_id',
+              postgresql_where=text('is_active'), sqlite_where=text('is_active = 1')),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(BigInteger, ForeignKey('users.id'), nullable=False)
@@ -74,6 +90,10 @@ class ExpenseCategory(Base):
 
 class Transaction(Base):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Serves period filters and keyset pagination on (date, id)
+        Index('ix_transactions_user_date_id', 'user_id', 'date', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(BigInteger, ForeignKey('users.id'), nullable=False)
@@ -96,8 +116,78 @@ class Transaction(Base):
     income_source = relationship("IncomeSource", back_populates="transactions")
     expense_category = relationship("ExpenseCategory", back_populates="transactions")
 
+class DailyRollup(Base):
+    """Per-day totals of the ledger, maintained alongside every transaction write"""
+    __tablename__ = 'daily_rollups'
+    
+    # Primary key order (user, day, ...) makes period scans an index range
+    user_id = Column(BigInteger, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    wallet_id = Column(Integer, ForeignKey('wallets.id'), primary_key=True)
+    transaction_type = Column(String(10), primary_key=True)
+    ref_id = Column(Integer, primary_key=True, default=0)  # expense_category_id or income_source_id, 0 if unset
+    currency = Column(String(3), primary_key=True)
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
+
+class DataVersion(Base):
+    """Per-user change counter of a reference list, used as its ETag"""
+    __tablename__ = 'data_versions'
+    
+    user_id = Column(BigInteger, ForeignKey('users.id'), primary_key=True)
+    scope = Column(String(32), primary_key=True)  # wallets, expense_categories, income_sources
+    version = Column(Integer, nullable=False, default=0)
+
+class FxRate(Base):
+    """Price of one unit of a currency in Config.FX_BASE_CURRENCY, from a day on"""
+    __tablename__ = 'fx_rates'
+    
+    currency = Column(String(3), primary_key=True)
+    day = Column(Date, primary_key=True)
+    rate = Column(Float, nullable=False)
+
+class NotificationJob(Base):
+    """Outbound bot message; the dispatcher in the bot process delivers pending ones (see notifications.py)"""
+    __tablename__ = 'notification_jobs'
+    __table_args__ = (
+        # The dispatcher's claim query: pending jobs that are due, oldest first
+        Index('ix_notification_jobs_status_due', 'status', 'next_attempt_at'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    parse_mode = Column(String(16))
+    kind = Column(String(32), nullable=False, default='message')  # budget_alert, monthly_report, broadcast, ...
+    # Enqueueing the same key twice (a re-run broadcast) keeps one job; NULL keys never collide
+    dedup_key = Column(String(128), unique=True)
+    status = Column(String(10), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = Column(String(32))
+    # Refreshed while the dispatcher holds the job; a claim left this old belongs to a dead one
+    claimed_at = Column(DateTime)
+    message_id = Column(BigInteger)
+    last_error = Column(String(300))
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
 # Database setup
-engine = create_engine(Config.DATABASE_URL)
+def engine_options(url: str) -> dict:
+    """Pool settings from Config for an engine on the given URL"""
+    options = {
+        'pool_pre_ping': Config.DB_POOL_PRE_PING,
+        'pool_recycle': Config.DB_POOL_RECYCLE
+    }
+    if not url.startswith('sqlite'):
+        options.update(
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT
+        )
+    return options
+
+engine = create_engine(Config.DATABASE_URL, **engine_options(Config.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def create_tables():
@@ -108,4 +198,63 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def pool_stats(bind=None) -> dict:
+    """Connection pool counters (size, checked in/out, overflow) where the pool has them"""
+    pool = (bind or engine).pool
+    stats = {'pool': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        counter = getattr(pool, name, None)
+        if callable(counter):
+            stats[name] = counter()
+    return stats
+
+metrics.instrument_engine(engine)
+metrics.register_pool(pool_stats)
+slow_query_log = slowlog.attach(engine)
+
+# Async drivers by backend; the async engine is optional and made on first use
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+def async_url(url: str):
+    """DATABASE_URL with its async driver (aiosqlite, asyncpg)"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for {backend}")
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if 'sslmode' in url.query:
+        # libpq spelling; asyncpg takes ssl=
+        url = url.update_query_dict({'ssl': url.query['sslmode']}).difference_update_query(['sslmode'])
+    return url
+
+_async_engine = None
+_async_engine_lock = threading.Lock()
+
+def get_async_engine():
+    """AsyncEngine on DATABASE_URL, instrumented like engine; raises RuntimeError without the driver"""
+    global _async_engine
+    with _async_engine_lock:
+        if _async_engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+            url = async_url(Config.DATABASE_URL)
+            try:
+                _async_engine = create_async_engine(url, **engine_options(Config.DATABASE_URL))
+            except ImportError as e:
+                raise RuntimeError(f"{url.drivername} needs its driver: pip install aiosqlite asyncpg ({e})")
+            metrics.instrument_engine(_async_engine.sync_engine)
+        return _async_engine
+
+async def dispose_async_engine():
+    """Close the async engine's connections; they belong to the event loop that opened them"""
+    global _async_engine
+    with _async_engine_lock:
+        async_engine, _async_engine = _async_engine, None
+    if async_engine is not None:
+        await async_engine.dispose()
+
+def AsyncSessionLocal():
+    """New AsyncSession; loaded attributes stay usable after commit, lazy loads are not possible"""
+    from sqlalchemy.ext.asyncio import AsyncSession
+    return AsyncSession(get_async_engine(), autoflush=False, expire_on_commit=False)
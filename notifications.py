@@ -0,0 +1,304 @@
+"""
+Outbound notification queue of the bot
+
+Messages to users (budget alerts, monthly reports, broadcasts) are rows
+of notification_jobs, queued from any process with
+DatabaseManager.enqueue_notifications (or Dispatcher.enqueue in the bot).
+The Dispatcher runs on the bot's event loop and delivers them:
+
+- jobs are claimed in batches (status 'sending', committed before the
+  first send), so a restart neither loses nor repeats them: a graceful
+  stop finishes the sends in flight and returns the rest to 'pending'.
+  A dispatcher refreshes the claimed_at of the jobs it holds, and claims
+  left unrefreshed for NOTIFY_CLAIM_TIMEOUT (a crashed replica's) are
+  released by any dispatcher; only a message whose send was in flight at
+  the moment of the crash can go out twice. A message Telegram accepted
+  is never requeued: if recording it as sent fails, the dispatcher keeps
+  the claim and retries the record until it succeeds;
+- a global token bucket (NOTIFY_RATE per second) and one per chat
+  (NOTIFY_CHAT_RATE) keep within Telegram's limits, messages to a chat go
+  out in queue order, and at most NOTIFY_CONCURRENCY requests are open;
+- a 429 pauses all sending for its retry_after and requeues the job
+  without counting an attempt; network errors are retried with
+  exponential backoff up to NOTIFY_MAX_ATTEMPTS, as are unexpected errors
+  (a failed database write) so no job is left 'sending'; blocked bots,
+  unknown chats and bad markup fail at once.
+
+Outcomes, send latency, delivery delay and rate limit waits are exported
+through metrics.
+"""
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+import metrics
+from config import Config
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+# Per-chat buckets kept; idle chats beyond this are forgotten (a fresh bucket is full anyway)
+CHAT_BUCKETS = 10000
+
+class TokenBucket:
+    """rate tokens per second up to capacity; acquire() waits for one, in arrival order"""
+
+    def __init__(self, rate: float, capacity: float = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.paused_until = 0.0
+
+    def reserve(self) -> float:
+        """Take a token, possibly one not refilled yet; returns the seconds to wait for it"""
+        now = self.clock()
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        self.tokens -= 1
+        # updated is in the future during a pause: tokens count from its end
+        return max(self.updated - now + max(-self.tokens, 0.0) / self.rate, 0.0)
+
+    async def acquire(self) -> float:
+        """Wait for a token; returns the seconds waited"""
+        waited = 0.0
+        while True:
+            wait = self.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                waited += wait
+            if self.clock() >= self.paused_until:
+                return waited
+            # Paused while we slept: queue again behind the pause
+
+    def pause(self, seconds: float):
+        """Hand out nothing for seconds, then resume at rate without a burst"""
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.updated = self.paused_until
+        self.tokens = 1.0
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+class Dispatcher:
+    def __init__(self, bot, call_db: Callable[..., Awaitable], rate: float = None, chat_rate: float = None,
+                 concurrency: int = None, batch_size: int = None, max_attempts: int = None,
+                 poll_interval: float = None, claim_timeout: float = None):
+        """bot: telegram.Bot; call_db(DatabaseManager.operation, *args) awaits a database operation
+        (FinanceBot.call_db). The other arguments default to the NOTIFY_* settings."""
+        self.bot = bot
+        self.call_db = call_db
+        self.rate = rate or Config.NOTIFY_RATE
+        self.chat_rate = chat_rate or Config.NOTIFY_CHAT_RATE
+        self.concurrency = concurrency or Config.NOTIFY_CONCURRENCY
+        self.batch_size = batch_size or Config.NOTIFY_BATCH_SIZE
+        self.max_attempts = max_attempts or Config.NOTIFY_MAX_ATTEMPTS
+        self.poll_interval = poll_interval or Config.NOTIFY_POLL_INTERVAL
+        self.claim_timeout = claim_timeout or Config.NOTIFY_CLAIM_TIMEOUT
+        # Claims of this dispatcher, refreshed while held and released on stop
+        self.token = uuid.uuid4().hex
+        self._held = set()
+        # Jobs sent but not yet recorded as sent: job id -> message id
+        self._unrecorded = {}
+        self.limit = TokenBucket(self.rate)
+        self._chat_limits = OrderedDict()
+        self._chat_locks = {}
+        self._tasks = set()
+        self._sending = set()
+        self._task = None
+        self._stopping = False
+        metrics.register_outbox(lambda: {'in_flight': len(self._tasks)})
+
+    def start(self):
+        """Start delivering on the running loop"""
+        self._wake = asyncio.Event()
+        self._connections = asyncio.Semaphore(self.concurrency)
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Finish the sends in flight and return every other claimed job to the queue"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    def wake(self):
+        """New jobs were queued by this process; look now instead of at the next poll"""
+        if self._task is not None:
+            self._wake.set()
+
+    async def enqueue(self, chat_id: int, text: str, kind: str = 'message', parse_mode: str = 'HTML',
+                      dedup_key: str = None) -> int:
+        queued = await self.call_db(DatabaseManager.enqueue_notifications, [{
+            'chat_id': chat_id, 'text': text, 'kind': kind, 'parse_mode': parse_mode, 'dedup_key': dedup_key
+        }])
+        self.wake()
+        return queued
+
+    async def maintain_claims(self):
+        """Keep our claims fresh and requeue the ones dead dispatchers left behind"""
+        await self.record_unrecorded()
+        try:
+            await self.call_db(DatabaseManager.refresh_notification_claims, list(self._held), self.token)
+            released = await self.call_db(DatabaseManager.release_notifications, None, self.claim_timeout)
+        except Exception:
+            logger.exception("Could not maintain notification claims")
+            return
+        if released:
+            logger.warning(f"Requeued {released} notifications of a dispatcher that stopped refreshing them")
+
+    async def run(self):
+        maintained = 0.0
+        try:
+            while not self._stopping:
+                # Well within the timeout, so a slow loop does not let our own claims expire
+                if time.monotonic() - maintained >= self.claim_timeout / 3:
+                    await self.maintain_claims()
+                    maintained = time.monotonic()
+                self._wake.clear()
+                free = self.batch_size - len(self._tasks)
+                jobs = []
+                if free > 0:
+                    try:
+                        jobs = await self.call_db(DatabaseManager.claim_notifications, free, self.token)
+                    except Exception:
+                        logger.exception("Could not claim notifications")
+                for job in jobs:
+                    self._held.add(job.id)
+                    task = asyncio.get_running_loop().create_task(self.deliver(job))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._finished)
+                if len(jobs) < free or free <= 0:
+                    # Queue drained or pipeline full: wait for new jobs, a free slot or the next poll
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            # Jobs still waiting for a rate limit go back to the queue; sends in flight finish
+            for task in self._tasks - self._sending:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self.record_unrecorded()
+            if self._unrecorded:
+                logger.error(f"Stopping with {len(self._unrecorded)} sent notifications not recorded as sent")
+            await self.call_db(DatabaseManager.release_notifications, self.token)
+
+    def _finished(self, task):
+        self._tasks.discard(task)
+        self._sending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Notification delivery failed: {task.exception()!r}")
+        self._wake.set()
+
+    def _chat_limit(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_limits.pop(chat_id, None) or TokenBucket(self.chat_rate, 1.0)
+        self._chat_limits[chat_id] = bucket
+        if len(self._chat_limits) > CHAT_BUCKETS:
+            self._chat_limits.popitem(last=False)
+        return bucket
+
+    async def deliver(self, job):
+        # One send at a time per chat, in claim order (asyncio.Lock wakes waiters first come, first served);
+        # the lock lives while some job of the chat holds or waits for it
+        entry = self._chat_locks.get(job.chat_id)
+        if entry is None:
+            entry = self._chat_locks[job.chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                throttled = await self._chat_limit(job.chat_id).acquire()
+                if throttled and metrics.enabled:
+                    metrics.notification_throttled.inc(('chat',), throttled)
+                async with self._connections:
+                    throttled = await self.limit.acquire()
+                    if throttled and metrics.enabled:
+                        metrics.notification_throttled.inc(('global',), throttled)
+                    # From here on the send and its bookkeeping are not cancelled by stop()
+                    self._sending.add(asyncio.current_task())
+                    try:
+                        await self.send(job)
+                    except Exception as e:
+                        # Not an answer of the Bot API (say, the database failed to record one)
+                        logger.exception(f"Notification {job.id} to {job.chat_id} could not be processed")
+                        await self.retry_or_fail(job, repr(e))
+        finally:
+            if job.id not in self._unrecorded:
+                self._held.discard(job.id)
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[job.chat_id]
+
+    async def send(self, job):
+        started = time.perf_counter()
+        try:
+            message = await self.bot.send_message(chat_id=job.chat_id, text=job.text, parse_mode=job.parse_mode)
+        except RetryAfter as e:
+            # Flood control applies to the whole bot: everyone waits, the job keeps its attempts
+            delay = retry_after_seconds(e)
+            self.limit.pause(delay)
+            self._count(job, 'rate_limited')
+            logger.warning(f"Bot API rate limit, pausing notifications for {delay:.0f}s")
+            await self.call_db(DatabaseManager.retry_notification, job.id, delay, str(e), False)
+        except (Forbidden, BadRequest) as e:
+            # Blocked bot, deleted chat, malformed markup: retrying will not help
+            self._count(job, 'failed')
+            logger.info(f"Notification {job.id} to {job.chat_id} failed: {e}")
+            await self.call_db(DatabaseManager.fail_notification, job.id, str(e))
+        except TelegramError as e:
+            await self.retry_or_fail(job, str(e))
+        else:
+            # The message is out: from here on the job is only ever recorded as sent, never requeued
+            self._unrecorded[job.id] = message.message_id
+            if metrics.enabled:
+                metrics.notification_send_latency.observe(time.perf_counter() - started)
+                metrics.notification_delay.observe((datetime.utcnow() - job.created_at).total_seconds(), (job.kind,))
+            self._count(job, 'sent')
+            await self.record_unrecorded(job.id)
+
+    async def record_unrecorded(self, *job_ids):
+        """complete_notification for sent jobs (job_ids, or all) whose record has not been written yet.
+
+        A failure leaves the job claimed and in _held, so its claim stays fresh and the record
+        is tried again by maintain_claims."""
+        for job_id in job_ids or list(self._unrecorded):
+            if job_id not in self._unrecorded:
+                # Recorded meanwhile by another caller
+                continue
+            try:
+                await self.call_db(DatabaseManager.complete_notification, job_id, self._unrecorded[job_id])
+            except Exception:
+                logger.exception(f"Could not record notification {job_id} as sent, will retry")
+                continue
+            self._unrecorded.pop(job_id, None)
+            self._held.discard(job_id)
+
+    async def retry_or_fail(self, job, error: str):
+        """Back off and retry, or fail the job once it used up its attempts"""
+        attempts = job.attempts + 1
+        if attempts >= self.max_attempts:
+            self._count(job, 'failed')
+            logger.error(f"Notification {job.id} to {job.chat_id} failed after {attempts} attempts: {error}")
+            await self.call_db(DatabaseManager.fail_notification, job.id, error)
+        else:
+            self._count(job, 'retried')
+            delay = min(2 ** attempts, 300) * random.uniform(0.5, 1.0)
+            await self.call_db(DatabaseManager.retry_notification, job.id, delay, error)
+
+    def _count(self, job, outcome: str):
+        if metrics.enabled:
+            metrics.notifications.inc((job.kind, outcome))
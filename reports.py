@@ -0,0 +1,137 @@
+"""
+Time-series reports built from bucketed ledger totals
+
+DatabaseManager.get_timeseries_groups does the bucketing in SQL; the
+helpers here lay the groups out as dense per-bucket series and derive
+rolling averages, period-over-period deltas and a run-rate forecast.
+Every statistic is a single pass over the series (rolling windows use
+prefix sums), so the cost is linear in the number of buckets.
+"""
+
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+BUCKETS = ('day', 'week', 'month')
+
+def bucket_start(day: date, bucket: str) -> date:
+    """First day of the bucket containing day (weeks start on Monday)"""
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"Unsupported bucket: {bucket}")
+
+def next_bucket(start: date, bucket: str) -> date:
+    if bucket == 'day':
+        return start + timedelta(days=1)
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    raise ValueError(f"Unsupported bucket: {bucket}")
+
+def bucket_range(start: date, end: date, bucket: str) -> List[date]:
+    """Starts of every bucket overlapping [start, end]"""
+    current = bucket_start(start, bucket)
+    buckets = []
+    while current <= end:
+        buckets.append(current)
+        current = next_bucket(current, bucket)
+    return buckets
+
+def bucket_count(start: date, end: date, bucket: str) -> int:
+    """len(bucket_range(start, end, bucket)), without building the list"""
+    first, last = bucket_start(start, bucket), bucket_start(end, bucket)
+    if last < first:
+        return 0
+    if bucket == 'day':
+        return (last - first).days + 1
+    if bucket == 'week':
+        return (last - first).days // 7 + 1
+    return (last.year - first.year) * 12 + last.month - first.month + 1
+
+def rolling_mean(values: List[float], window: int) -> List[Optional[float]]:
+    """Trailing mean over window buckets; None until the window is full"""
+    prefix = [0.0]
+    for value in values:
+        prefix.append(prefix[-1] + value)
+    return [
+        (prefix[i + 1] - prefix[i + 1 - window]) / window if i + 1 >= window else None
+        for i in range(len(values))
+    ]
+
+def deltas(values: List[float]) -> List[Optional[float]]:
+    """Change against the previous bucket; None for the first"""
+    return [None] + [current - previous for previous, current in zip(values, values[1:])]
+
+def percent_changes(values: List[float]) -> List[Optional[float]]:
+    """Relative change against the previous bucket; None where it is undefined"""
+    return [None] + [
+        (current - previous) / previous * 100 if previous else None
+        for previous, current in zip(values, values[1:])
+    ]
+
+def run_rate(actual: float, period_start: date, today: date, bucket: str) -> dict:
+    """Project the current bucket's total from its pace so far"""
+    total_days = (next_bucket(period_start, bucket) - period_start).days
+    elapsed_days = min(max((today - period_start).days + 1, 1), total_days)
+    return {
+        'period': period_start.isoformat(),
+        'actual': actual,
+        'projected': actual / elapsed_days * total_days,
+        'elapsed_days': elapsed_days,
+        'total_days': total_days
+    }
+
+def build_timeseries(groups, start: date, end: date, bucket: str, window: int = 3,
+                     by_category: bool = False, today: date = None) -> dict:
+    """Dense series and statistics from (bucket start, type, name, total, count) groups"""
+    periods = bucket_range(start, end, bucket)
+    position = {period: i for i, period in enumerate(periods)}
+    series = {'income': [0.0] * len(periods), 'expense': [0.0] * len(periods)}
+    counts = [0] * len(periods)
+    breakdown: Dict[str, Dict[str, List[float]]] = {'income': {}, 'expense': {}}
+
+    for period, transaction_type, name, total, count in groups:
+        i = position[period]
+        series[transaction_type][i] += total
+        counts[i] += count
+        if name is not None:
+            values = breakdown[transaction_type].setdefault(name, [0.0] * len(periods))
+            values[i] += total
+
+    income, expense = series['income'], series['expense']
+    net = [i - e for i, e in zip(income, expense)]
+    result = {
+        'bucket': bucket,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'window': window,
+        'periods': [period.isoformat() for period in periods],
+        'income': income,
+        'expense': expense,
+        'net': net,
+        'transaction_count': counts,
+        'income_rolling': rolling_mean(income, window),
+        'expense_rolling': rolling_mean(expense, window),
+        'net_rolling': rolling_mean(net, window),
+        'income_delta': deltas(income),
+        'expense_delta': deltas(expense),
+        'expense_delta_pct': percent_changes(expense),
+        'forecast': None
+    }
+    if by_category:
+        result['expenses_by_category'] = breakdown['expense']
+        result['income_by_source'] = breakdown['income']
+
+    today = today or end
+    current = bucket_start(today, bucket)
+    if current in position:
+        i = position[current]
+        result['forecast'] = {
+            'income': run_rate(income[i], current, today, bucket),
+            'expense': run_rate(expense[i], current, today, bucket)
+        }
+    return result
@@ -1,34 +1,30 @@
 #!/usr/bin/env python3
 """
 Finance Manager Bot - Main Runner
-Runs both the Telegram bot and Flask web application
+Runs the Flask web application and the Telegram bot as separate supervised processes
 """
 
 import os
 import sys
-import threading
-import time
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-def run_webapp():
-    """Run Flask web application"""
-    from webapp import app
-    print("🌐 Starting Flask web application...")
-    app.run(debug=False, host='0.0.0.0', port=5000)
-
-def run_bot():
-    """Run Telegram bot"""
-    from bot import main as bot_main
-    print("🤖 Starting Telegram bot...")
-    bot_main()
-
 def main():
     """Main function to run both services"""
     print("🚀 Starting Finance Manager Bot...")
     
+    # One-time schema setup; production deploys run `python manage.py init-db` instead
+    from migrate_db import init_database
+    from models import engine
+    if not init_database():
+        sys.exit(1)
+    # The services open their own pools; the supervisor keeps no connections
+    engine.dispose()
+    
+    import supervisor
+    
     # Check required environment variables
     required_vars = ['TELEGRAM_TOKEN']
     missing_vars = [var for var in required_vars if not os.getenv(var)]
@@ -38,8 +34,7 @@ def main():
         print("To run the full bot, set TELEGRAM_TOKEN environment variable")
         
         # Run only web app
-        run_webapp()
-        return
+        sys.exit(supervisor.main(with_bot=False))
     
     # Set default values for optional variables
     if not os.getenv('WEBAPP_URL'):
@@ -50,21 +45,9 @@ def main():
         os.environ['SECRET_KEY'] = 'your-secret-key-change-this-in-production'
         print("⚠️  SECRET_KEY not set, using default (change in production)")
     
-    # Start web application in a separate thread
-    webapp_thread = threading.Thread(target=run_webapp, daemon=True)
-    webapp_thread.start()
-    
-    # Wait a moment for webapp to start
-    time.sleep(2)
-    
-    # Start bot in main thread
-    try:
-        run_bot()
-    except KeyboardInterrupt:
-        print("\n🛑 Shutting down...")
-    except Exception as e:
-        print(f"❌ Error running bot: {e}")
-        sys.exit(1)
+    # Web app first, then the bot once /healthz answers; both restarted if they crash
+    print("🌐 Starting web app and 🤖 Telegram bot processes...")
+    sys.exit(supervisor.main())
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
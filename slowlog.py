@@ -0,0 +1,223 @@
+"""
+Slow query log with plans
+
+Statements slower than Config.SLOW_QUERY_MS (off unless set) are appended
+to Config.SLOW_QUERY_LOG as JSON lines, or logged through the slowlog
+logger when no file is configured: their fingerprint (the statement with
+literals and placeholders replaced by ?), duration, the route or bot
+handler that issued it, the DatabaseManager method it came from and, once
+per fingerprint every EXPLAIN_EVERY seconds, its plan (EXPLAIN on
+PostgreSQL, EXPLAIN QUERY PLAN on SQLite). The plan is asked for on the
+same connection without executing the statement again, inside a savepoint
+so that a failing EXPLAIN does not abort the caller's transaction.
+
+report() aggregates the log by fingerprint into a top-N list with early
+and recent mean durations, so queries that slow down as tables grow
+stand out. The log is shared by all workers on a host and rotated to
+<file>.1 past MAX_LOG_BYTES.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List
+
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Plans are refreshed at most this often per fingerprint and process
+EXPLAIN_EVERY = 600
+MAX_LOG_BYTES = 10 * 1024 * 1024
+# Occurrences averaged for the early and recent durations in the report
+TREND_WINDOW = 10
+
+EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete')
+SORT_KEYS = ('total', 'mean', 'max', 'count')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+|\?")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ROWS = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+
+def normalize(statement: str) -> str:
+    """Statement text with literals and bound parameters as ?, lists as (...)"""
+    text = _STRING.sub('?', statement)
+    text = _PLACEHOLDER.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _LIST.sub('(...)', text)
+    text = _ROWS.sub(r'\1', text)
+    return _SPACE.sub(' ', text).strip()
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+def caller() -> str:
+    """Outermost DatabaseManager method on the stack, if any"""
+    frame = sys._getframe(1)
+    found = None
+    while frame is not None:
+        if frame.f_globals.get('__name__') == 'database' and 'self' in frame.f_locals:
+            found = f'{type(frame.f_locals["self"]).__name__}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return found
+
+def explain(conn, statement: str, parameters) -> List[str]:
+    """Plan of statement on conn's DBAPI connection, one line per row"""
+    sqlite = conn.dialect.name == 'sqlite'
+    prefix = 'EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN '
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        # An error inside a PostgreSQL transaction fails every later statement of it: fence the
+        # EXPLAIN off with a savepoint. Raw SQL, since we run inside conn's own cursor events
+        # (SQLite errors leave the transaction usable)
+        if not sqlite:
+            cursor.execute('SAVEPOINT slowlog_explain')
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = [' '.join(str(value) for value in row) if sqlite else str(row[0]) for row in cursor.fetchall()]
+        except Exception:
+            if not sqlite:
+                cursor.execute('ROLLBACK TO SAVEPOINT slowlog_explain')
+            raise
+        finally:
+            if not sqlite:
+                cursor.execute('RELEASE SAVEPOINT slowlog_explain')
+        return plan
+    finally:
+        cursor.close()
+
+class SlowQueryLog:
+    """Writes slow statements to a JSON lines file (to the logger when path is empty)"""
+
+    def __init__(self, path: str, threshold_ms: float, clock=time.monotonic):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._explained = {}
+
+    def __call__(self, conn, cursor, statement, parameters, executemany, elapsed):
+        """metrics statement hook"""
+        if elapsed < self.threshold:
+            return
+        normalized = normalize(statement)
+        key = fingerprint(normalized)
+        record = {
+            'at': datetime.utcnow().isoformat(timespec='seconds'),
+            'fingerprint': key,
+            'statement': normalized,
+            'ms': round(elapsed * 1000, 3),
+            'source': metrics.current_source(),
+            'caller': caller(),
+            'rows': cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        }
+        if not executemany and self._plan_due(key) and normalized.split(' ', 1)[0].lower() in EXPLAINABLE:
+            try:
+                record['plan'] = explain(conn, statement, parameters)
+            except Exception as e:
+                record['plan_error'] = str(e)
+        self.write(record)
+
+    def _plan_due(self, key: str) -> bool:
+        now = self.clock()
+        with self._lock:
+            if now - self._explained.get(key, -EXPLAIN_EVERY) < EXPLAIN_EVERY:
+                return False
+            self._explained[key] = now
+            return True
+
+    def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        if not self.path:
+            logger.warning(f"Slow query: {line.rstrip()}")
+            return
+        with self._lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > MAX_LOG_BYTES:
+                    os.replace(self.path, self.path + '.1')
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                # Never fail the query because the log is not writable
+                logger.warning(f"Slow query log {self.path}: {e}")
+
+def attach(engine, path: str = None, threshold_ms: float = None) -> SlowQueryLog:
+    """Log engine's slow statements; None when the threshold is 0"""
+    threshold_ms = Config.SLOW_QUERY_MS if threshold_ms is None else threshold_ms
+    if threshold_ms <= 0:
+        return None
+    log = SlowQueryLog(Config.SLOW_QUERY_LOG if path is None else path, threshold_ms)
+    metrics.instrument_engine(engine)
+    metrics.statement_hooks.append(log)
+    return log
+
+def detach(log: SlowQueryLog):
+    if log in metrics.statement_hooks:
+        metrics.statement_hooks.remove(log)
+
+def read_log(path: str = None):
+    """Records of the log and its rotated predecessor, oldest first; bad lines are skipped"""
+    path = path or Config.SLOW_QUERY_LOG
+    if not path:
+        return
+    for name in (path + '.1', path):
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+def report(records, top: int = 20, sort: str = 'total', since: str = None) -> List[dict]:
+    """Slow statements grouped by fingerprint, largest first by total, mean, max or count"""
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+    groups = {}
+    for record in records:
+        if since and record['at'] < since:
+            continue
+        group = groups.get(record['fingerprint'])
+        if group is None:
+            group = groups[record['fingerprint']] = {
+                'fingerprint': record['fingerprint'], 'statement': record['statement'],
+                'durations': [], 'sources': Counter(), 'callers': Counter(),
+                'first_seen': record['at'], 'plan': None, 'plan_at': None
+            }
+        group['durations'].append(record['ms'])
+        group['last_seen'] = record['at']
+        group['sources'][record.get('source') or 'other'] += 1
+        if record.get('caller'):
+            group['callers'][record['caller']] += 1
+        if record.get('plan') is not None:
+            group['plan'], group['plan_at'] = record['plan'], record['at']
+
+    rows = []
+    for group in groups.values():
+        durations = group.pop('durations')
+        group.update(
+            count=len(durations),
+            total_ms=round(sum(durations), 3),
+            mean_ms=round(sum(durations) / len(durations), 3),
+            max_ms=max(durations),
+            early_ms=round(sum(durations[:TREND_WINDOW]) / len(durations[:TREND_WINDOW]), 3),
+            recent_ms=round(sum(durations[-TREND_WINDOW:]) / len(durations[-TREND_WINDOW:]), 3),
+            sources=dict(group['sources'].most_common(5)),
+            callers=dict(group['callers'].most_common(5))
+        )
+        rows.append(group)
+    field = {'total': 'total_ms', 'mean': 'mean_ms', 'max': 'max_ms', 'count': 'count'}[sort]
+    rows.sort(key=lambda row: row[field], reverse=True)
+    return rows[:top]
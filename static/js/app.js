@@ -6,6 +6,12 @@ class FinanceManager {
         this.userData = null;
         this.currentPage = 'dashboard-page';
         this.charts = {};
+        // Lists shared by the pages and the transaction form; filled by /bootstrap
+        this.wallets = null;
+        this.categories = null;
+        this.incomeSources = null;
+        // path -> { etag, data } for conditional GETs of the lists
+        this.listCache = {};
         
         this.init();
     }
@@ -19,14 +25,15 @@ class FinanceManager {
             return;
         }
 
-        // Initialize user data
-        await this.loadUserData();
+        // One request for the user, dashboard and form lists
+        const data = await this.loadBootstrap();
         
         // Initialize UI
         this.initUI();
         
-        // Load initial data
-        await this.loadDashboardData();
+        if (data) {
+            this.updateDashboard(data, data.recent_transactions);
+        }
         
         // Hide loading screen
         document.getElementById('loading').classList.add('hidden');
@@ -44,19 +51,32 @@ class FinanceManager {
         return urlParams.get('user_id') || urlParams.get('userId');
     }
 
-    async loadUserData() {
+    async loadBootstrap() {
         try {
-            const response = await fetch(`/api/user/${this.userId}`);
-            if (response.ok) {
-                this.userData = await response.json();
-                document.getElementById('user-name').textContent = this.userData.first_name || 'Пользователь';
-            } else {
-                // Create user if not exists
+            let response = await fetch(`/api/user/${this.userId}/bootstrap`);
+            if (response.status === 404) {
                 await this.createUser();
+                response = await fetch(`/api/user/${this.userId}/bootstrap`);
+            }
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
             }
+            const data = await response.json();
+            this.userData = data.user;
+            this.wallets = data.wallets;
+            this.categories = data.expense_categories;
+            this.incomeSources = data.income_sources;
+            this.listCache = {
+                'wallets': { etag: data.etags.wallets, data: data.wallets },
+                'expense-categories': { etag: data.etags.expense_categories, data: data.expense_categories },
+                'income-sources': { etag: data.etags.income_sources, data: data.income_sources }
+            };
+            document.getElementById('user-name').textContent = this.userData.first_name || 'Пользователь';
+            return data;
         } catch (error) {
-            console.error('Error loading user data:', error);
+            console.error('Error loading bootstrap data:', error);
             this.showError('Failed to load user data');
+            return null;
         }
     }
 
@@ -225,20 +245,23 @@ class FinanceManager {
         }
     }
 
-    updateDashboard(data) {
-        const { summary, wallet_balances } = data;
+    updateDashboard(data, recentTransactions = null) {
+        const { summary, net_worth } = data;
+        // Amounts come converted into the user's default currency
+        const currency = summary.currency || 'BYN';
 
         // Update summary cards
-        document.getElementById('total-balance').textContent = this.formatCurrency(
-            wallet_balances.reduce((sum, wallet) => sum + wallet.balance, 0),
-            'BYN'
-        );
-        document.getElementById('monthly-income').textContent = this.formatCurrency(summary.total_income, 'BYN');
-        document.getElementById('monthly-expenses').textContent = this.formatCurrency(summary.total_expense, 'BYN');
-        document.getElementById('net-income').textContent = this.formatCurrency(summary.net_income, 'BYN');
+        document.getElementById('total-balance').textContent = this.formatCurrency(net_worth.total, net_worth.currency);
+        document.getElementById('monthly-income').textContent = this.formatCurrency(summary.total_income, currency);
+        document.getElementById('monthly-expenses').textContent = this.formatCurrency(summary.total_expense, currency);
+        document.getElementById('net-income').textContent = this.formatCurrency(summary.net_income, currency);
 
         // Load recent transactions
-        this.loadRecentTransactions();
+        if (recentTransactions) {
+            this.renderRecentTransactions(recentTransactions);
+        } else {
+            this.loadRecentTransactions();
+        }
     }
 
     async loadRecentTransactions() {
@@ -348,11 +371,9 @@ class FinanceManager {
 
     async loadWallets() {
         try {
-            const response = await fetch(`/api/user/${this.userId}/wallets`);
-            if (response.ok) {
-                const wallets = await response.json();
-                this.renderWallets(wallets);
-            }
+            const wallets = await this.fetchList('wallets');
+            this.wallets = wallets;
+            this.renderWallets(wallets);
         } catch (error) {
             console.error('Error loading wallets:', error);
         }
@@ -391,11 +412,9 @@ class FinanceManager {
 
     async loadCategories() {
         try {
-            const response = await fetch(`/api/user/${this.userId}/expense-categories`);
-            if (response.ok) {
-                const categories = await response.json();
-                this.renderCategories(categories);
-            }
+            const categories = await this.fetchList('expense-categories');
+            this.categories = categories;
+            this.renderCategories(categories);
         } catch (error) {
             console.error('Error loading categories:', error);
         }
@@ -432,11 +451,9 @@ class FinanceManager {
 
     async loadIncomeSources() {
         try {
-            const response = await fetch(`/api/user/${this.userId}/income-sources`);
-            if (response.ok) {
-                const sources = await response.json();
-                this.renderIncomeSources(sources);
-            }
+            const sources = await this.fetchList('income-sources');
+            this.incomeSources = sources;
+            this.renderIncomeSources(sources);
         } catch (error) {
             console.error('Error loading income sources:', error);
         }
@@ -470,16 +487,68 @@ class FinanceManager {
 
     async loadReports() {
         try {
-            const response = await fetch(`/api/user/${this.userId}/summary?period=30`);
-            if (response.ok) {
-                const data = await response.json();
+            const [summaryResponse, trendResponse] = await Promise.all([
+                fetch(`/api/user/${this.userId}/summary?period=30`),
+                fetch(`/api/user/${this.userId}/timeseries?bucket=month`)
+            ]);
+            if (summaryResponse.ok) {
+                const data = await summaryResponse.json();
                 this.renderReports(data.summary);
             }
+            if (trendResponse.ok) {
+                this.renderTrend(await trendResponse.json());
+            }
         } catch (error) {
             console.error('Error loading reports:', error);
         }
     }
 
+    renderTrend(series) {
+        const ctx = document.getElementById('trend-chart').getContext('2d');
+        if (this.charts.trend) {
+            this.charts.trend.destroy();
+        }
+
+        const labels = series.periods.map(period => new Date(period).toLocaleDateString('ru-RU', { month: 'short', year: '2-digit' }));
+        this.charts.trend = new Chart(ctx, {
+            type: 'bar',
+            data: {
+                labels,
+                datasets: [
+                    { label: 'Доходы', data: series.income, backgroundColor: '#10B981' },
+                    { label: 'Расходы', data: series.expense, backgroundColor: '#EF4444' },
+                    {
+                        label: `Расходы, среднее за ${series.window} мес.`,
+                        data: series.expense_rolling,
+                        type: 'line',
+                        borderColor: '#6366F1',
+                        pointRadius: 0,
+                        spanGaps: false
+                    }
+                ]
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                plugins: {
+                    legend: {
+                        position: 'bottom',
+                        labels: {
+                            font: {
+                                size: 12
+                            }
+                        }
+                    }
+                }
+            }
+        });
+
+        const forecast = document.getElementById('trend-forecast');
+        forecast.textContent = series.forecast
+            ? `Прогноз расходов за текущий месяц: ${this.formatCurrency(series.forecast.expense.projected, series.currency)}`
+            : '';
+    }
+
     renderReports(summary) {
         // Expense by category chart
         const expenseCtx = document.getElementById('expense-chart').getContext('2d');
@@ -747,6 +816,7 @@ class FinanceManager {
                 this.closeAllModals();
                 this.showSuccess('Настройки сохранены');
                 this.userData.default_currency = currency;
+                this.loadDashboardData();
             } else {
                 this.showError('Ошибка при сохранении настроек');
             }
@@ -756,17 +826,35 @@ class FinanceManager {
         }
     }
 
-    // Load data for select fields
+    // GET a list, revalidating the copy we hold with its ETag
+    async fetchList(path) {
+        const cached = this.listCache[path];
+        const headers = cached ? { 'If-None-Match': cached.etag } : {};
+        const response = await fetch(`/api/user/${this.userId}/${path}`, { headers, cache: 'no-store' });
+        if (response.status === 304 && cached) {
+            return cached.data;
+        }
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (etag) {
+            this.listCache[path] = { etag, data };
+        }
+        return data;
+    }
+
+    // Load data for select fields: lists already loaded by /bootstrap or the list pages are
+    // revalidated with their ETag, so changes made from the bot or another device show up
+
     async loadWalletsForSelect() {
         try {
-            const response = await fetch(`/api/user/${this.userId}/wallets`);
-            if (response.ok) {
-                const wallets = await response.json();
-                const select = document.getElementById('transaction-wallet');
-                select.innerHTML = wallets.map(wallet => 
-                    `<option value="${wallet.id}">${wallet.name} (${wallet.currency})</option>`
-                ).join('');
-            }
+            this.wallets = await this.fetchList('wallets');
+            const select = document.getElementById('transaction-wallet');
+            select.innerHTML = this.wallets.map(wallet => 
+                `<option value="${wallet.id}">${wallet.name} (${wallet.currency})</option>`
+            ).join('');
         } catch (error) {
             console.error('Error loading wallets for select:', error);
         }
@@ -774,15 +862,12 @@ class FinanceManager {
 
     async loadIncomeSourcesForSelect() {
         try {
-            const response = await fetch(`/api/user/${this.userId}/income-sources`);
-            if (response.ok) {
-                const sources = await response.json();
-                const select = document.getElementById('transaction-income-source');
-                select.innerHTML = '<option value="">Выберите источник</option>' + 
-                    sources.map(source => 
-                        `<option value="${source.id}">${source.name}</option>`
-                    ).join('');
-            }
+            this.incomeSources = await this.fetchList('income-sources');
+            const select = document.getElementById('transaction-income-source');
+            select.innerHTML = '<option value="">Выберите источник</option>' + 
+                this.incomeSources.map(source => 
+                    `<option value="${source.id}">${source.name}</option>`
+                ).join('');
         } catch (error) {
             console.error('Error loading income sources for select:', error);
         }
@@ -790,15 +875,12 @@ class FinanceManager {
 
     async loadCategoriesForSelect() {
         try {
-            const response = await fetch(`/api/user/${this.userId}/expense-categories`);
-            if (response.ok) {
-                const categories = await response.json();
-                const select = document.getElementById('transaction-expense-category');
-                select.innerHTML = '<option value="">Выберите категорию</option>' + 
-                    categories.map(category => 
-                        `<option value="${category.id}">${category.name}</option>`
-                    ).join('');
-            }
+            this.categories = await this.fetchList('expense-categories');
+            const select = document.getElementById('transaction-expense-category');
+            select.innerHTML = '<option value="">Выберите категорию</option>' + 
+                this.categories.map(category => 
+                    `<option value="${category.id}">${category.name}</option>`
+                ).join('');
         } catch (error) {
             console.error('Error loading categories for select:', error);
         }
@@ -0,0 +1,218 @@
+"""
+Runs the web app and the bot as separate processes
+
+run.py used to serve Flask from a thread of the bot's interpreter: both
+competed for one GIL, shared one engine, and a crash on either side took
+the other down. The supervisor starts each service as its own process
+(gunicorn with gunicorn.conf.py for the web app, bot.py for the bot), so
+each has its own interpreter and connection pool, and:
+
+- starts them in order, each once the previous one passes its readiness
+  check (GET /healthz for the web app, BOT_READY_FILE for the bot);
+- restarts a process that exits or does not become ready within
+  SUPERVISOR_READY_TIMEOUT, pausing 1, 2, 4... up to
+  SUPERVISOR_MAX_BACKOFF seconds between attempts of a crash loop;
+- on SIGTERM/SIGINT stops them in reverse order with SIGTERM, and kills
+  whatever is left after SUPERVISOR_STOP_TIMEOUT.
+
+Children run in their own process groups, so Ctrl+C reaches only the
+supervisor, which then shuts them down in order.
+"""
+
+import importlib.util
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# A process that stays up this long is healthy again; its next crash restarts at once
+STABLE_SECONDS = 60.0
+
+def http_ready(url: str) -> Callable[[], bool]:
+    """Readiness check: url answers 200"""
+    def check() -> bool:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                return response.status == 200
+        except (OSError, urllib.error.URLError):
+            return False
+    return check
+
+def file_ready(path: str) -> Callable[[], bool]:
+    """Readiness check: the process has created path"""
+    return lambda: os.path.exists(path)
+
+class Service:
+    """One supervised process: how to start it and how to tell that it serves"""
+
+    def __init__(self, name: str, command: List[str], ready: Callable[[], bool] = None,
+                 env: dict = None, reset: Callable[[], None] = None):
+        self.name = name
+        self.command = command
+        self.ready = ready or (lambda: True)
+        self.env = env or {}
+        # Called before every start, e.g. to remove a stale ready file
+        self.reset = reset
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.is_ready = False
+        self.restarts = 0
+        self.backoff = 0.0
+        self.restart_at = None
+
+    def start(self):
+        if self.reset is not None:
+            self.reset()
+        self.process = subprocess.Popen(self.command, cwd=ROOT, env=dict(os.environ, **self.env),
+                                        start_new_session=os.name == 'posix')
+        self.started_at = time.monotonic()
+        self.is_ready = False
+        self.restart_at = None
+        logger.info(f"▶️  {self.name} started (pid {self.process.pid})")
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def signal(self, signum: int):
+        if self.running:
+            try:
+                self.process.send_signal(signum)
+            except ProcessLookupError:
+                pass
+
+class Supervisor:
+    def __init__(self, services: List[Service], ready_timeout: float = None, stop_timeout: float = None,
+                 max_backoff: float = None, poll_interval: float = 0.2):
+        self.services = services
+        self.ready_timeout = Config.SUPERVISOR_READY_TIMEOUT if ready_timeout is None else ready_timeout
+        self.stop_timeout = Config.SUPERVISOR_STOP_TIMEOUT if stop_timeout is None else stop_timeout
+        self.max_backoff = Config.SUPERVISOR_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+
+    def wait_ready(self, service: Service) -> bool:
+        """Block until service passes its check; False if it exits, times out or we are stopping"""
+        deadline = service.started_at + self.ready_timeout
+        while not self.stopping.is_set() and time.monotonic() < deadline:
+            if not service.running:
+                return False
+            if service.ready():
+                service.is_ready = True
+                logger.info(f"✅ {service.name} ready in {time.monotonic() - service.started_at:.1f}s")
+                return True
+            self.stopping.wait(self.poll_interval)
+        return False
+
+    def start(self):
+        """Start the services in order, each after the previous one is ready (or given up on for now)"""
+        for service in self.services:
+            if self.stopping.is_set():
+                return
+            service.start()
+            if not self.wait_ready(service) and not self.stopping.is_set():
+                reason = f"exited with code {service.process.returncode}" if not service.running \
+                    else f"not ready after {self.ready_timeout:.0f}s"
+                self.terminate([service])
+                self.schedule_restart(service, reason)
+
+    def schedule_restart(self, service: Service, reason: str):
+        now = time.monotonic()
+        if service.is_ready and now - service.started_at >= STABLE_SECONDS:
+            service.backoff = 0.0
+        else:
+            service.backoff = min(max(service.backoff * 2, 1.0), self.max_backoff)
+        service.restart_at = now + service.backoff
+        logger.warning(f"⚠️  {service.name} {reason}; restarting in {service.backoff:.0f}s")
+
+    def check(self, service: Service):
+        """One supervision step for service: notice crashes and hangs, restart when due"""
+        now = time.monotonic()
+        if service.restart_at is not None:
+            if now >= service.restart_at:
+                service.restarts += 1
+                service.start()
+            return
+        if not service.running:
+            self.schedule_restart(service, f"exited with code {service.process.returncode}")
+        elif not service.is_ready:
+            if service.ready():
+                service.is_ready = True
+                logger.info(f"✅ {service.name} ready again after {now - service.started_at:.1f}s")
+            elif now - service.started_at > self.ready_timeout:
+                self.terminate([service])
+                self.schedule_restart(service, f"not ready after {self.ready_timeout:.0f}s")
+
+    def run(self) -> int:
+        """Start and supervise until stop(); returns the exit code for the supervisor"""
+        try:
+            self.start()
+            while not self.stopping.wait(self.poll_interval):
+                for service in self.services:
+                    self.check(service)
+            return 0
+        finally:
+            self.terminate(list(reversed(self.services)))
+
+    def stop(self, *args):
+        """Signal handler and test hook: leave run() and shut everything down"""
+        self.stopping.set()
+
+    def terminate(self, services: List[Service]):
+        """SIGTERM services one by one, SIGKILL any still running after stop_timeout"""
+        for service in services:
+            if not service.running:
+                continue
+            logger.info(f"🛑 Stopping {service.name} (pid {service.process.pid})")
+            service.signal(signal.SIGTERM)
+            try:
+                service.process.wait(self.stop_timeout)
+            except subprocess.TimeoutExpired:
+                logger.warning(f"⚠️  {service.name} ignored SIGTERM for {self.stop_timeout:.0f}s, killing it")
+                service.process.kill()
+                service.process.wait()
+
+def web_service(port: int) -> Service:
+    """gunicorn with gunicorn.conf.py, or the development server where gunicorn is unavailable"""
+    if importlib.util.find_spec('gunicorn') is not None:
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+    else:
+        command = [sys.executable, 'webapp_only.py']
+    return Service('web', command, http_ready(f'http://127.0.0.1:{port}/healthz'), env={'PORT': str(port)})
+
+def bot_service() -> Service:
+    ready_file = os.path.join(tempfile.mkdtemp(prefix='finance-bot-'), 'bot.ready')
+
+    def reset():
+        if os.path.exists(ready_file):
+            os.remove(ready_file)
+    return Service('bot', [sys.executable, 'bot.py'], file_ready(ready_file),
+                   env={'BOT_READY_FILE': ready_file}, reset=reset)
+
+def main(with_bot: bool = True, port: int = None) -> int:
+    """Run the web app (and the bot) until SIGTERM/SIGINT"""
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    port = port or int(os.getenv('PORT', '5000'))
+    services = [web_service(port)]
+    if with_bot:
+        services.append(bot_service())
+    supervisor = Supervisor(services)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    return supervisor.run()
+
+if __name__ == '__main__':
+    sys.exit(main())
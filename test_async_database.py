@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Shared tests for DatabaseManager and AsyncDatabaseManager
+
+Every scenario awaits its operations through call(), so the same test runs
+against the synchronous manager on SessionLocal and the async one on
+AsyncSessionLocal (aiosqlite on the scratch database).
+"""
+
+import asyncio
+import inspect
+import itertools
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from async_database import AsyncDatabaseManager, OPERATIONS
+from database import DatabaseManager
+from models import SessionLocal, AsyncSessionLocal, dispose_async_engine
+
+telegram_ids = itertools.count(9_000_000_000)
+
+
+async def call(result):
+    """An operation's result, awaited when it comes from the async manager"""
+    return await result if inspect.isawaitable(result) else result
+
+
+@pytest.fixture(params=['sync', 'async'])
+def run(request):
+    """run(scenario) calls the coroutine function scenario(db_manager) with either manager"""
+    async def sync_scenario(scenario):
+        with SessionLocal() as db:
+            return await scenario(DatabaseManager(db))
+
+    async def async_scenario(scenario):
+        try:
+            async with AsyncSessionLocal() as session:
+                return await scenario(AsyncDatabaseManager(session))
+        finally:
+            await dispose_async_engine()
+
+    def run(scenario):
+        return asyncio.run((sync_scenario if request.param == 'sync' else async_scenario)(scenario))
+    return run
+
+
+async def new_user(db_manager):
+    return await call(db_manager.get_or_create_user(next(telegram_ids), username='shared', first_name='Shared'))
+
+
+def test_async_manager_offers_every_operation():
+    for name in OPERATIONS:
+        assert inspect.iscoroutinefunction(getattr(AsyncDatabaseManager, name)), name
+    assert 'iter_transactions_by_period' not in OPERATIONS
+    assert {'get_or_create_user', 'create_transaction', 'get_user_summary', 'get_wallet_balances'} <= set(OPERATIONS)
+
+
+def test_users(run):
+    async def scenario(db_manager):
+        user = await new_user(db_manager)
+        again = await call(db_manager.get_or_create_user(user.telegram_id, username='other'))
+        assert again.id == user.id and again.username == 'shared'
+
+        assert (await call(db_manager.get_user(user.telegram_id))).first_name == 'Shared'
+        assert await call(db_manager.get_user(next(telegram_ids))) is None
+        assert await call(db_manager.update_user_currency(user.telegram_id, 'USD'))
+        assert not await call(db_manager.update_user_currency(next(telegram_ids), 'USD'))
+        resolved = await call(db_manager.resolve_user(user.telegram_id))
+        assert (resolved.id, resolved.default_currency) == (user.id, 'USD')
+    run(scenario)
+
+
+def test_reference_lists(run):
+    async def scenario(db_manager):
+        user = await new_user(db_manager)
+        versions = await call(db_manager.get_versions(user.id))
+
+        wallet = await call(db_manager.create_wallet(user.id, 'Cash', 'BYN'))
+        source = await call(db_manager.create_income_source(user.id, 'Salary'))
+        category = await call(db_manager.create_expense_category(user.id, 'Food', icon='🍔'))
+        assert [w.name for w in await call(db_manager.get_user_wallets(user.id))] == ['Cash']
+        assert [s.name for s in await call(db_manager.get_user_income_sources(user.id))] == ['Salary']
+        assert [(c.name, c.icon) for c in await call(db_manager.get_user_expense_categories(user.id))] == [('Food', '🍔')]
+
+        changed = await call(db_manager.get_versions(user.id))
+        assert all(changed[scope] > versions[scope] for scope in ('wallets', 'income_sources', 'expense_categories'))
+
+        assert await call(db_manager.delete_wallet(wallet.id, user.id))
+        assert await call(db_manager.delete_income_source(source.id, user.id))
+        assert await call(db_manager.delete_expense_category(category.id, user.id))
+        assert not await call(db_manager.delete_wallet(wallet.id + 10_000, user.id))
+        assert await call(db_manager.get_user_wallets(user.id)) == []
+        assert await call(db_manager.get_user_income_sources(user.id)) == []
+        assert await call(db_manager.get_user_expense_categories(user.id)) == []
+    run(scenario)
+
+
+def test_transactions_balances_and_summary(run):
+    async def scenario(db_manager):
+        user = await new_user(db_manager)
+        wallet = await call(db_manager.create_wallet(user.id, 'Card', 'USD'))
+        source = await call(db_manager.create_income_source(user.id, 'Salary'))
+        category = await call(db_manager.create_expense_category(user.id, 'Rent'))
+        now = datetime.utcnow()
+
+        await call(db_manager.create_transaction(user.id, wallet.id, 'income', 1000.0, 'USD',
+                                                 date=now - timedelta(days=3), income_source_id=source.id))
+        expense = await call(db_manager.create_transaction(user.id, wallet.id, 'expense', 400.0, 'USD',
+                                                           date=now - timedelta(days=1), expense_category_id=category.id))
+        assert await call(db_manager.get_wallet_balances(user.id)) == [
+            {'id': wallet.id, 'name': 'Card', 'currency': 'USD', 'balance': 600.0}]
+
+        summary = await call(db_manager.get_user_summary(user.id, 30))
+        assert (summary['total_income'], summary['total_expense'], summary['transaction_count']) == (1000.0, 400.0, 2)
+        assert summary['expenses_by_category'] == {'Rent': 400.0}
+        assert summary['income_by_source'] == {'Salary': 1000.0}
+        assert await call(db_manager.get_balances_at(user.id, now - timedelta(days=2))) == {wallet.id: 1000.0}
+
+        # Relations come loaded with the page, so they can be read after the call
+        transactions = await call(db_manager.get_user_transactions(user.id))
+        assert [(t.id, t.wallet.name) for t in transactions][0] == (expense.id, 'Card')
+        assert transactions[0].expense_category.name == 'Rent'
+        assert transactions[1].income_source.name == 'Salary'
+
+        assert await call(db_manager.delete_transaction(expense.id, user.id))
+        assert (await call(db_manager.get_wallet_balances(user.id)))[0]['balance'] == 1000.0
+        assert (await call(db_manager.get_user_summary(user.id, 30)))['total_expense'] == 0.0
+    run(scenario)
+
+
+def test_bulk_import_and_pagination(run):
+    async def scenario(db_manager):
+        user = await new_user(db_manager)
+        wallet = await call(db_manager.create_wallet(user.id, 'Cash', 'BYN'))
+        start = datetime(2024, 1, 1, 12)
+        rows = [{'wallet_id': wallet.id, 'transaction_type': 'expense', 'amount': float(n + 1), 'currency': 'BYN',
+                 'description': f'#{n}', 'date': start + timedelta(hours=n)} for n in range(25)]
+        assert await call(db_manager.bulk_create_transactions(user.id, rows)) == 25
+        assert (await call(db_manager.get_wallet_balances(user.id)))[0]['balance'] == -325.0
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = await call(db_manager.get_user_transactions_page(user.id, limit=10, cursor=cursor))
+            seen.extend(t.description for t in page)
+            if cursor is None:
+                break
+        assert seen == [f'#{n}' for n in reversed(range(25))]
+
+        in_period = await call(db_manager.get_transactions_by_period(
+            user.id, start + timedelta(hours=5), start + timedelta(hours=9)))
+        assert sorted(t.amount for t in in_period) == [6.0, 7.0, 8.0, 9.0, 10.0]
+        with pytest.raises(ValueError):
+            await call(db_manager.get_user_transactions_page(user.id, cursor='not-a-cursor'))
+    run(scenario)
+
+
+def test_run_passes_the_synchronous_manager():
+    async def scenario():
+        try:
+            async with AsyncSessionLocal() as session:
+                manager = AsyncDatabaseManager(session)
+                user = await manager.get_or_create_user(next(telegram_ids))
+                return await manager.run(lambda db_manager, user_id: (type(db_manager), db_manager.get_versions(user_id)),
+                                         user.id)
+        finally:
+            await dispose_async_engine()
+
+    manager_type, versions = asyncio.run(scenario())
+    assert manager_type is DatabaseManager
+    assert set(versions) >= {'wallets'}
+
+
+def test_concurrent_rate_reloads_do_not_block_the_event_loop():
+    import fx
+
+    async def net_worth(user_id):
+        async with AsyncSessionLocal() as session:
+            return await AsyncDatabaseManager(session).get_net_worth(user_id, 'BYN')
+
+    async def scenario():
+        try:
+            async with AsyncSessionLocal() as session:
+                manager = AsyncDatabaseManager(session)
+                user = await manager.get_or_create_user(next(telegram_ids))
+                await manager.create_wallet(user.id, 'Cash', 'BYN')
+            # Every handler finds the snapshot stale and loads it while the others wait
+            fx.invalidate_rates()
+            return await asyncio.gather(*(net_worth(user.id) for _ in range(4)))
+        finally:
+            await dispose_async_engine()
+
+    # A deadlock blocks the loop thread itself, so wait for it from outside
+    results = []
+    thread = threading.Thread(target=lambda: results.append(asyncio.run(scenario())), daemon=True)
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive(), 'event loop blocked'
+    assert [worth['total'] for worth in results[0]] == [0.0] * 4
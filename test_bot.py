@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Tests for the Telegram bot against a stubbed Bot API
+"""
+
+import asyncio
+import json
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+import pytest
+from telegram import Update
+from telegram.ext import Application
+
+import metrics
+from benchmarks.bench_server import free_port
+from benchmarks.fake_bot_api import FakeBotAPI, TOKEN, make_command_update
+from bot import FinanceBot, parse_period
+from config import Config
+from database import DatabaseManager
+from models import SessionLocal
+
+
+async def started_bot(api):
+    bot = FinanceBot(Application.builder().token(TOKEN).base_url(api.base_url))
+    await bot.application.initialize()
+    await bot.application.start()
+    return bot
+
+
+async def stopped(bot):
+    await bot.application.stop()
+    await bot.application.shutdown()
+
+
+@pytest.mark.parametrize('layer', ['async', 'threads'])
+def test_updates_are_handled_concurrently(monkeypatch, layer):
+    monkeypatch.setattr(Config, 'BOT_DB_LAYER', layer)
+    monkeypatch.setattr(Config, 'BOT_CONCURRENT_UPDATES', 8)
+    monkeypatch.setattr(Config, 'BOT_DB_THREADS', 2)
+    user_ids = [8_000_000_000 + n + (100 if layer == 'async' else 0) for n in range(10)]
+
+    async def scenario(api):
+        bot = await started_bot(api)
+        try:
+            for n in range(30):
+                data = make_command_update(n + 1, user_ids[n % len(user_ids)])
+                await bot.application.update_queue.put(Update.de_json(data, bot.application.bot))
+            assert await asyncio.get_running_loop().run_in_executor(None, api.wait_for, 'sendMessage', 30, 30)
+        finally:
+            await stopped(bot)
+
+    with FakeBotAPI(latency=0.05) as api:
+        asyncio.run(scenario(api))
+        assert api.max_in_flight > 1
+
+    with SessionLocal() as db:
+        db_manager = DatabaseManager(db)
+        assert all(db_manager.get_user(telegram_id) is not None for telegram_id in user_ids)
+
+
+@pytest.mark.parametrize('layer', ['async', 'threads'])
+def test_database_calls_keep_the_handler_context(monkeypatch, layer):
+    monkeypatch.setattr(Config, 'BOT_DB_LAYER', layer)
+    monkeypatch.setattr(Config, 'BOT_DB_THREADS', 1)
+
+    async def scenario(api):
+        bot = FinanceBot(Application.builder().token(TOKEN).base_url(api.base_url))
+        timer = metrics.Timer('bot start')
+        try:
+            return await bot.call_db(lambda db_manager: metrics.current_source())
+        finally:
+            timer.stop()
+            await bot.shutdown_db(bot.application)
+
+    with FakeBotAPI() as api:
+        assert asyncio.run(scenario(api)) == 'bot start'
+
+
+def test_webhook_checks_the_secret_token():
+    port = free_port()
+
+    def post(update, secret):
+        request = urllib.request.Request(
+            f'http://127.0.0.1:{port}/telegram', data=json.dumps(update).encode(),
+            headers={'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+
+    async def scenario(api):
+        bot = await started_bot(api)
+        await bot.application.updater.start_webhook(
+            listen='127.0.0.1', port=port, url_path='telegram', secret_token='s3cret',
+            webhook_url='https://example.invalid/telegram')
+        loop = asyncio.get_running_loop()
+        try:
+            assert await loop.run_in_executor(None, post, make_command_update(1, 8_100_000_000), 's3cret') == 200
+            with pytest.raises(urllib.error.HTTPError) as denied:
+                await loop.run_in_executor(None, post, make_command_update(2, 8_100_000_001), 'wrong')
+            assert denied.value.code == 403
+            assert await loop.run_in_executor(None, api.wait_for, 'sendMessage', 1, 10)
+        finally:
+            await bot.application.updater.stop()
+            await stopped(bot)
+
+    with FakeBotAPI() as api:
+        asyncio.run(scenario(api))
+        assert api.count('setWebhook') == 1
+        assert api.count('sendMessage') == 1
+
+
+def test_parse_period():
+    assert parse_period([]) == 30
+    assert parse_period(['7']) == 7
+    assert parse_period(['Month']) == 30
+    assert parse_period(['год']) == 365
+    assert parse_period(['0']) is None
+    assert parse_period(['soon']) is None
+    # isdigit() digits int() rejects
+    assert parse_period(['²']) is None
+    assert parse_period(['①']) is None
+
+
+@pytest.mark.parametrize('layer', ['async', 'threads'])
+def test_balance_and_report_commands(monkeypatch, layer):
+    monkeypatch.setattr(Config, 'BOT_DB_LAYER', layer)
+    telegram_id, stranger = (8_200_000_000, 8_200_000_001) if layer == 'async' else (8_200_000_010, 8_200_000_011)
+    with SessionLocal() as db:
+        db_manager = DatabaseManager(db)
+        user = db_manager.get_or_create_user(telegram_id, first_name='Report')
+        wallet = db_manager.create_wallet(user.id, 'Cash <main>', 'BYN')
+        food = db_manager.create_expense_category(user.id, 'Food')
+        salary = db_manager.create_income_source(user.id, 'Salary')
+        now = datetime.utcnow()
+        db_manager.create_transaction(user.id, wallet.id, 'income', 1500.0, 'BYN', date=now - timedelta(days=3),
+                                      income_source_id=salary.id)
+        db_manager.create_transaction(user.id, wallet.id, 'expense', 20.5, 'BYN', date=now,
+                                      expense_category_id=food.id)
+
+    async def scenario(api):
+        bot = await started_bot(api)
+        replies = []
+        try:
+            for n, (user_id, command) in enumerate([
+                (telegram_id, '/balance'), (telegram_id, '/today'), (telegram_id, '/report 7'),
+                (telegram_id, '/report soon'), (stranger, '/balance')
+            ]):
+                await bot.application.update_queue.put(
+                    Update.de_json(make_command_update(n + 1, user_id, command), bot.application.bot))
+                assert await asyncio.get_running_loop().run_in_executor(None, api.wait_for, 'sendMessage', n + 1, 10)
+                replies.append(api.sent[-1][1])
+        finally:
+            await stopped(bot)
+        return replies
+
+    with FakeBotAPI() as api:
+        balance, today, report, bad_period, unknown = asyncio.run(scenario(api))
+
+    assert 'Cash &lt;main&gt;: 1 479.50 BYN' in balance
+    assert 'Всего:</b> 1 479.50 BYN' in balance
+    assert 'Расходы: 20.50 BYN' in today and 'Доходы: 0.00 BYN' in today
+    assert 'Отчёт за 7 дн.' in report and 'Доходы: 1 500.00 BYN' in report
+    assert '• Food: 20.50 BYN' in report and '• Salary: 1 500.00 BYN' in report
+    assert 'Укажите период' in bad_period
+    assert '/start' in unknown
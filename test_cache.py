@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-process caches
+"""
+
+import fnmatch
+import time
+
+from cache import LRUCache, RedisBackend, ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    assert cache.get(1) == 'a'
+    cache.set(3, 'c')
+
+    assert cache.get(2) is None
+    assert cache.get(1) == 'a'
+    assert cache.get(3) == 'c'
+    assert cache.stats()['size'] == 2
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+    cache.set('user', 42)
+
+    clock.now = 4.9
+    assert cache.get('user') == 42
+    clock.now = 5.0
+    assert cache.get('user') is None
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 0)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_zero_size_disables_cache():
+    cache = LRUCache(maxsize=0)
+    cache.set(1, 'a')
+    assert cache.get(1) is None
+
+
+class FakeRedis:
+    """The part of the redis client RedisBackend uses"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires = self.data.get(key, (None, 0))
+        return value if expires > time.monotonic() else None
+
+    def set(self, key, value, px):
+        self.data[key] = (value.encode(), time.monotonic() + px / 1000)
+
+    def scan_iter(self, match):
+        return [key for key in self.data if fnmatch.fnmatch(key, match)]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+def test_result_cache_counts_hits_and_misses():
+    clock = FakeClock()
+    cache = ResultCache(LRUCache(maxsize=10, ttl=60), clock=clock)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        clock.now += 0.010
+        return {'total': 1.5}
+
+    assert cache.get_or_compute('1:a', compute) == {'total': 1.5}
+    assert cache.get_or_compute('1:a', compute) == {'total': 1.5}
+    assert len(calls) == 1
+
+    stats = cache.stats()
+    assert (stats['backend'], stats['hits'], stats['misses'], stats['hit_rate']) == ('LRUCache', 1, 1, 0.5)
+    assert stats['avg_miss_ms'] == 10.0 and stats['avg_hit_ms'] == 0.0
+    assert stats['backend_size'] == 1
+
+    cache.clear()
+    cache.get_or_compute('1:a', compute)
+    assert len(calls) == 2 and cache.stats()['misses'] == 2
+
+
+def test_redis_backend_shares_entries_between_caches():
+    client = FakeRedis()
+    worker_a = ResultCache(RedisBackend(client, ttl=60))
+    worker_b = ResultCache(RedisBackend(client, ttl=60))
+
+    worker_a.get_or_compute('7:summary', lambda: {'by_category': {'Food': 3.0}, 'count': 2})
+    assert worker_b.get_or_compute('7:summary', lambda: None) == {'by_category': {'Food': 3.0}, 'count': 2}
+    assert worker_b.stats()['hits'] == 1
+
+    client.data['unrelated'] = (b'1', float('inf'))
+    worker_a.clear()
+    assert list(client.data) == ['unrelated']
+
+
+def test_disabled_result_cache_always_computes():
+    cache = ResultCache(LRUCache(maxsize=0))
+    assert not cache.enabled
+    assert cache.get_or_compute('k', lambda: 1) == 1
+    assert cache.stats()['misses'] == 0
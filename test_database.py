@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Tests for DatabaseManager against an in-memory SQLite database
+"""
+
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Transaction, DailyRollup
+from database import DatabaseManager
+
+
+@pytest.fixture
+def db():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def populate(db_manager, telegram_id=1, transactions=500, seed=42):
+    """Create a user with a few wallets, categories, sources and random transactions"""
+    rng = random.Random(seed)
+    user = db_manager.get_or_create_user(telegram_id, first_name='Test')
+    wallets = [db_manager.create_wallet(user.id, name, currency)
+               for name, currency in [('Cash', 'BYN'), ('Card', 'USD'), ('Savings', 'RUB')]]
+    categories = [db_manager.create_expense_category(user.id, name)
+                  for name in ['Food', 'Transport', 'Rent', 'Fun']]
+    sources = [db_manager.create_income_source(user.id, name)
+               for name in ['Salary', 'Freelance']]
+    # Two categories sharing a name are reported as one bucket
+    categories.append(db_manager.create_expense_category(user.id, 'Food'))
+
+    now = datetime.utcnow()
+    for _ in range(transactions):
+        transaction_type = rng.choice(['income', 'expense', 'expense'])
+        wallet = rng.choice(wallets)
+        db_manager.db.add(Transaction(
+            user_id=user.id,
+            wallet_id=wallet.id,
+            transaction_type=transaction_type,
+            amount=round(rng.uniform(1, 500), 2),
+            currency=wallet.currency,
+            date=now - timedelta(days=rng.uniform(0, 400)),
+            income_source_id=rng.choice(sources).id if transaction_type == 'income' and rng.random() < 0.9 else None,
+            expense_category_id=rng.choice(categories).id if transaction_type == 'expense' and rng.random() < 0.9 else None
+        ))
+    db_manager.db.commit()
+    db_manager.rebuild_daily_rollups()
+    return user
+
+
+def python_summary(db_manager, user_id, period_days):
+    """Reference implementation: aggregate ORM objects in Python"""
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=period_days)
+    transactions = db_manager.get_transactions_by_period(user_id, start_date, end_date)
+
+    expenses_by_category = {}
+    income_by_source = {}
+    for t in transactions:
+        if t.transaction_type == 'expense' and t.expense_category:
+            name = t.expense_category.name
+            expenses_by_category[name] = expenses_by_category.get(name, 0) + t.amount
+        if t.transaction_type == 'income' and t.income_source:
+            name = t.income_source.name
+            income_by_source[name] = income_by_source.get(name, 0) + t.amount
+
+    total_income = sum(t.amount for t in transactions if t.transaction_type == 'income')
+    total_expense = sum(t.amount for t in transactions if t.transaction_type == 'expense')
+    return {
+        'total_income': total_income,
+        'total_expense': total_expense,
+        'net_income': total_income - total_expense,
+        'expenses_by_category': expenses_by_category,
+        'income_by_source': income_by_source,
+        'transaction_count': len(transactions)
+    }
+
+
+def assert_summaries_equal(actual, expected):
+    assert set(actual) == set(expected)
+    for key in ('total_income', 'total_expense', 'net_income'):
+        assert actual[key] == pytest.approx(expected[key])
+    assert actual['transaction_count'] == expected['transaction_count']
+    for key in ('expenses_by_category', 'income_by_source'):
+        assert actual[key].keys() == expected[key].keys()
+        for name, amount in expected[key].items():
+            assert actual[key][name] == pytest.approx(amount)
+
+
+@pytest.mark.parametrize('period_days', [1, 7, 30, 365, 1000])
+def test_summary_matches_python_implementation(db, period_days):
+    db_manager = DatabaseManager(db)
+    user = populate(db_manager)
+
+    assert_summaries_equal(
+        db_manager.get_user_summary(user.id, period_days),
+        python_summary(db_manager, user.id, period_days)
+    )
+
+
+def test_summary_of_empty_period(db):
+    db_manager = DatabaseManager(db)
+    user = db_manager.get_or_create_user(1)
+
+    assert db_manager.get_user_summary(user.id, 30) == {
+        'total_income': 0,
+        'total_expense': 0,
+        'net_income': 0,
+        'expenses_by_category': {},
+        'income_by_source': {},
+        'transaction_count': 0
+    }
+
+
+@pytest.mark.parametrize('limit', [0, -1])
+def test_transactions_page_rejects_limits_below_one(db, limit):
+    db_manager = DatabaseManager(db)
+    user = populate(db_manager, transactions=5)
+    with pytest.raises(ValueError):
+        db_manager.get_user_transactions_page(user.id, limit=limit)
+
+
+def rollup_rows(db):
+    return sorted(
+        (r.user_id, r.day, r.wallet_id, r.transaction_type, r.ref_id, r.currency, round(r.total, 6), r.count)
+        for r in db.query(DailyRollup)
+    )
+
+
+def test_rollups_follow_creates_and_deletes(db):
+    db_manager = DatabaseManager(db)
+    user = populate(db_manager, transactions=50)
+    wallet = db_manager.get_user_wallets(user.id)[0]
+    category = db_manager.get_user_expense_categories(user.id)[0]
+    source = db_manager.get_user_income_sources(user.id)[0]
+
+    now = datetime.utcnow()
+    created = [
+        db_manager.create_transaction(user.id, wallet.id, 'expense', 12.5, 'BYN', date=now - timedelta(days=3),
+                                      expense_category_id=category.id),
+        db_manager.create_transaction(user.id, wallet.id, 'expense', 7.5, 'BYN', date=now - timedelta(days=3),
+                                      expense_category_id=category.id),
+        db_manager.create_transaction(user.id, wallet.id, 'income', 100.0, 'BYN', date=now - timedelta(days=40),
+                                      income_source_id=source.id),
+        db_manager.create_transaction(user.id, wallet.id, 'expense', 3.0, 'USD'),
+    ]
+    db_manager.delete_transaction(created[0].id, user.id)
+    db_manager.delete_transaction(created[3].id, user.id)
+    db_manager.delete_transaction(db.query(Transaction).first().id, user.id)
+
+    maintained = rollup_rows(db)
+    db_manager.rebuild_daily_rollups()
+    assert maintained == rollup_rows(db)
+
+
+def test_concurrent_transactions_keep_the_wallet_balance(tmp_path):
+    # Threads need a database they can share: a file, with writers waiting on each other's locks
+    engine = create_engine(f"sqlite:///{tmp_path / 'concurrent.db'}", connect_args={'timeout': 30})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with Session() as db:
+        db_manager = DatabaseManager(db)
+        user_id = db_manager.get_or_create_user(1, first_name='Test').id
+        wallet_id = db_manager.create_wallet(user_id, 'Cash', 'BYN').id
+
+    def write(worker):
+        with Session() as db:
+            db_manager = DatabaseManager(db)
+            for n in range(25):
+                transaction_type = 'income' if (worker + n) % 3 == 0 else 'expense'
+                db_manager.create_transaction(user_id, wallet_id, transaction_type, 0.25 * (n + 1), 'BYN')
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(write, range(8)))
+
+        with Session() as db:
+            transactions = db.query(Transaction).filter(Transaction.wallet_id == wallet_id).all()
+            assert len(transactions) == 200
+            expected = sum(t.amount if t.transaction_type == 'income' else -t.amount for t in transactions)
+            assert DatabaseManager(db).get_user_wallets(user_id)[0].balance == pytest.approx(expected)
+    finally:
+        engine.dispose()
+
+
+def python_converted_totals(db_manager, user_id, period_days, currency, rates):
+    """Reference conversion: every transaction at the rate of its own day"""
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=period_days)
+    totals = {'income': 0.0, 'expense': 0.0}
+    for t in db_manager.get_transactions_by_period(user_id, start_date, end_date):
+        totals[t.transaction_type] += rates.convert(t.amount, t.currency, currency, t.date.date())
+    return totals
+
+
+@pytest.mark.parametrize('period_days', [1, 30, 365])
+@pytest.mark.parametrize('currency', ['BYN', 'USD'])
+def test_summary_converts_at_daily_rates(db, period_days, currency):
+    import fx
+    db_manager = DatabaseManager(db)
+    user = populate(db_manager)
+
+    # A new USD and RUB rate every 10 days, starting before any transaction
+    start = datetime.utcnow().date() - timedelta(days=500)
+    db_manager.upsert_fx_rates([
+        {'day': start + timedelta(days=n), 'currency': currency_, 'rate': base * (1 + n / 1000)}
+        for n in range(0, 510, 10)
+        for currency_, base in (('USD', 3.2), ('RUB', 0.035))
+    ])
+
+    summary = db_manager.get_user_summary(user.id, period_days, currency)
+    expected = python_converted_totals(db_manager, user.id, period_days, currency, fx.get_rates(db_manager))
+
+    assert summary['currency'] == currency
+    assert summary['unconverted_currencies'] == []
+    assert summary['total_income'] == pytest.approx(expected['income'])
+    assert summary['total_expense'] == pytest.approx(expected['expense'])
+    assert sum(summary['expenses_by_category'].values()) <= summary['total_expense'] + 1e-6
+
+
+def test_missing_rates_fall_back_to_unconverted_amounts(db):
+    db_manager = DatabaseManager(db)
+    user = populate(db_manager)
+
+    unconverted = db_manager.get_user_summary(user.id, 365)
+    summary = db_manager.get_user_summary(user.id, 365, 'BYN')
+    assert summary['unconverted_currencies'] == ['RUB', 'USD']
+    assert summary['total_income'] == pytest.approx(unconverted['total_income'])
+
+    balances = [dict(wallet, balance=10.0) for wallet in db_manager.get_wallet_balances(user.id)]
+    db_manager.upsert_fx_rates([{'day': datetime.utcnow().date(), 'currency': 'USD', 'rate': 3.0}])
+    assert db_manager.get_net_worth(user.id, 'BYN', balances) == {
+        'currency': 'BYN', 'total': pytest.approx(10 + 30 + 10), 'unconverted_currencies': ['RUB']
+    }
+
+
+@pytest.mark.parametrize('bucket', ['day', 'week', 'month'])
+@pytest.mark.parametrize('by_category', [False, True])
+def test_timeseries_buckets_match_python(db, bucket, by_category):
+    from reports import bucket_start
+    db_manager = DatabaseManager(db)
+    user = populate(db_manager)
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=200)
+
+    expected = {}
+    for t in db_manager.get_transactions_by_period(user.id, None, None):
+        if not start <= t.date.date() <= end:
+            continue
+        name = None
+        if by_category:
+            owner = t.expense_category if t.transaction_type == 'expense' else t.income_source
+            name = owner.name if owner else None
+        key = (bucket_start(t.date.date(), bucket), t.transaction_type, name)
+        total, count = expected.get(key, (0.0, 0))
+        expected[key] = (total + t.amount, count + 1)
+
+    groups, unconverted = db_manager.get_timeseries_groups(user.id, start, end, bucket, by_category)
+    actual = {(period, kind, name): (total, count) for period, kind, name, total, count in groups}
+    assert unconverted == []
+    assert actual.keys() == expected.keys()
+    for key, (total, count) in expected.items():
+        assert actual[key][0] == pytest.approx(total)
+        assert actual[key][1] == count
+
+
+@pytest.fixture
+def ledger_on(monkeypatch):
+    """Serve summaries from the in-memory ledger; setting maxsize to 0 switches back to SQL"""
+    from cache import result_cache
+    from ledger import ledger_cache
+    monkeypatch.setattr(ledger_cache, 'maxsize', 16)
+    monkeypatch.setattr(result_cache, 'backend', None)
+    return ledger_cache
+
+
+def sql_and_ledger(ledger_cache, compute):
+    maxsize = ledger_cache.maxsize
+    ledger_cache.maxsize = 0
+    try:
+        expected = compute()
+    finally:
+        ledger_cache.maxsize = maxsize
+    return compute(), expected
+
+
+def assert_balances_equal(actual, expected):
+    assert actual.keys() == expected.keys()
+    for wallet_id, balance in expected.items():
+        # SQL SUM rounds row by row, the ledger once per span: they may differ in the last bits only
+        assert actual[wallet_id] == pytest.approx(balance, rel=1e-12, abs=1e-9)
+
+
+@pytest.mark.parametrize('currency', [None, 'BYN', 'USD'])
+def test_ledger_summaries_match_sql(db, ledger_on, currency):
+    db_manager = DatabaseManager(db)
+    user = populate(db_manager)
+    start = datetime.utcnow().date() - timedelta(days=500)
+    db_manager.upsert_fx_rates([
+        {'day': start + timedelta(days=n), 'currency': 'USD', 'rate': 3.2 * (1 + n / 1000)}
+        for n in range(0, 510, 10)
+    ])
+
+    now = datetime.utcnow()
+    for days in (1, 7, 30, 365, 1000):
+        actual, expected = sql_and_ledger(
+            ledger_on, lambda: db_manager.get_period_summary(user.id, now - timedelta(days=days), now, currency))
+        assert_summaries_equal(actual, expected)
+        if currency is not None:
+            assert actual['unconverted_currencies'] == expected['unconverted_currencies']
+    assert len(ledger_on.get(user.id)) == db.query(Transaction).count()
+
+    for days in (0, 3, 200, 1000):
+        actual, expected = sql_and_ledger(
+            ledger_on, lambda: db_manager.get_balances_at(user.id, now - timedelta(days=days)))
+        assert_balances_equal(actual, expected)
+
+
+def test_ledger_follows_writes(db, ledger_on):
+    db_manager = DatabaseManager(db)
+    user = populate(db_manager, transactions=100)
+    wallet = db_manager.get_user_wallets(user.id)[0]
+    category = db_manager.get_user_expense_categories(user.id)[0]
+    now = datetime.utcnow()
+    db_manager.get_user_summary(user.id, 30)
+    cached = ledger_on.get(user.id)
+
+    created = [
+        db_manager.create_transaction(user.id, wallet.id, 'expense', 12.5, wallet.currency,
+                                      date=now - timedelta(days=3), expense_category_id=category.id),
+        db_manager.create_transaction(user.id, wallet.id, 'income', 40.0, wallet.currency)
+    ]
+    db_manager.delete_transaction(created[0].id, user.id)
+    db_manager.delete_transaction(db.query(Transaction).first().id, user.id)
+    db_manager.create_wallet(user.id, 'New', 'BYN')
+    db_manager.create_expense_category(user.id, 'Gifts')
+    # Applied in place: the same ledger object is still cached and current
+    assert db_manager.get_ledger(user.id) is cached
+    assert len(cached) == db.query(Transaction).count()
+
+    # A write this process did not see (another worker, the bot) forces a reload
+    db.add(Transaction(user_id=user.id, wallet_id=wallet.id, transaction_type='income', amount=5.0,
+                       currency=wallet.currency, date=now - timedelta(hours=1)))
+    db_manager.bump_version(user.id, 'wallets')
+    db.commit()
+    db_manager.rebuild_daily_rollups(user.id)
+    assert db_manager.get_ledger(user.id) is not cached
+
+    for days in (1, 30, 1000):
+        actual, expected = sql_and_ledger(ledger_on, lambda: db_manager.get_user_summary(user.id, days))
+        assert_summaries_equal(actual, expected)
+    actual, expected = sql_and_ledger(ledger_on, lambda: db_manager.get_balances_at(user.id, now))
+    assert_balances_equal(actual, expected)
+
+
+def test_ledger_load_racing_a_write_is_not_cached_stale(db, ledger_on, monkeypatch):
+    db_manager = DatabaseManager(db)
+    user = populate(db_manager, transactions=50)
+    wallet = db_manager.get_user_wallets(user.id)[0]
+    load = DatabaseManager._load_ledger
+    raced = []
+
+    def racing_load(self, user_id, versions):
+        # Another writer commits after the versions were read but before the rows are
+        if not raced:
+            raced.append(True)
+            db.add(Transaction(user_id=user.id, wallet_id=wallet.id, transaction_type='income', amount=5.0,
+                               currency=wallet.currency, date=datetime.utcnow()))
+            self.bump_version(user_id, 'wallets')
+            db.commit()
+        return load(self, user_id, versions)
+
+    monkeypatch.setattr(DatabaseManager, '_load_ledger', racing_load)
+    cached = db_manager.get_ledger(user.id)
+    assert ledger_on.get(user.id) is cached
+    assert cached.versions == db_manager.get_versions(user.id)
+
+    # The next write of this process is applied once
+    db_manager.create_transaction(user.id, wallet.id, 'income', 7.0, wallet.currency)
+    assert db_manager.get_ledger(user.id) is cached
+    assert len(cached) == db.query(Transaction).count()
+
+
+def test_cached_summaries_are_invalidated_by_writes(db):
+    from cache import result_cache
+    db_manager = DatabaseManager(db)
+    user = populate(db_manager, transactions=100)
+    other = populate(db_manager, telegram_id=2, transactions=20)
+    wallet = db_manager.get_user_wallets(user.id)[0]
+
+    summary = db_manager.get_user_summary(user.id, 30)
+    balances = db_manager.get_wallet_balances(user.id)
+    db_manager.get_user_summary(other.id, 30)
+    assert db_manager.get_user_summary(user.id, 30) is summary
+    assert db_manager.get_wallet_balances(user.id) is balances
+    assert result_cache.stats()['hits'] == 2
+
+    db_manager.create_transaction(user.id, wallet.id, 'expense', 25.0, wallet.currency)
+    updated = db_manager.get_user_summary(user.id, 30)
+    assert updated['total_expense'] == pytest.approx(summary['total_expense'] + 25.0)
+    assert updated['transaction_count'] == summary['transaction_count'] + 1
+    assert db_manager.get_wallet_balances(user.id)[0]['balance'] == pytest.approx(balances[0]['balance'] - 25.0)
+
+    category = db_manager.create_expense_category(user.id, 'Gifts')
+    assert db_manager.get_user_summary(user.id, 30) is not updated
+    db_manager.delete_expense_category(category.id, user.id)
+    db_manager.delete_transaction(db_manager.get_user_transactions(user.id, limit=1)[0].id, user.id)
+    assert db_manager.get_user_summary(user.id, 30)['transaction_count'] == summary['transaction_count']
+
+    # Writes of one user leave the other's entries alone
+    hits = result_cache.stats()['hits']
+    db_manager.get_user_summary(other.id, 30)
+    assert result_cache.stats()['hits'] == hits + 1
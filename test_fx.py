@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for dated FX rate lookups
+"""
+
+import io
+from datetime import date
+
+import pytest
+
+from fx import FxRates, MissingRateError, parse_rates, read_rates_csv
+
+RATES = [
+    (date(2024, 1, 1), 'USD', 3.0),
+    (date(2024, 1, 10), 'USD', 3.3),
+    (date(2024, 1, 1), 'RUB', 0.035),
+]
+
+
+def test_rate_is_the_latest_published_on_or_before_the_day():
+    rates = FxRates(RATES, base='BYN')
+    assert rates.rate('USD', date(2024, 1, 1)) == 3.0
+    assert rates.rate('USD', date(2024, 1, 9)) == 3.0
+    assert rates.rate('USD', date(2024, 1, 10)) == 3.3
+    assert rates.rate('USD', date(2030, 1, 1)) == 3.3
+    assert rates.rate('BYN', date(1990, 1, 1)) == 1.0
+
+
+def test_cross_conversion_goes_through_the_base():
+    rates = FxRates(RATES, base='BYN')
+    assert rates.convert(10, 'USD', 'BYN', date(2024, 1, 5)) == pytest.approx(30)
+    assert rates.convert(30, 'BYN', 'USD', date(2024, 1, 5)) == pytest.approx(10)
+    assert rates.convert(100, 'USD', 'RUB', date(2024, 1, 10)) == pytest.approx(100 * 3.3 / 0.035)
+    assert rates.convert(7, 'RUB', 'RUB', date(2000, 1, 1)) == 7
+
+
+def test_missing_rate_raises():
+    rates = FxRates(RATES, base='BYN')
+    with pytest.raises(MissingRateError):
+        rates.rate('USD', date(2023, 12, 31))
+    with pytest.raises(MissingRateError):
+        rates.factor('EUR', 'BYN', date(2024, 1, 5))
+
+
+def test_rates_file_is_validated():
+    text = 'date,currency,rate\n2024-01-02,usd,"3,27"\n'
+    assert read_rates_csv(io.StringIO(text)) == [{'day': date(2024, 1, 2), 'currency': 'USD', 'rate': 3.27}]
+
+    for bad in ({'date': 'soon', 'currency': 'USD', 'rate': 1},
+                {'date': '2024-01-02', 'currency': 'EUR', 'rate': 1},
+                {'date': '2024-01-02', 'currency': 'BYN', 'rate': 1},
+                {'date': '2024-01-02', 'currency': 'USD', 'rate': 0},
+                {'date': '2024-01-02', 'currency': 'USD'}):
+        with pytest.raises(ValueError):
+            parse_rates([bad])
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the columnar in-memory ledger
+"""
+
+import math
+import random
+from datetime import datetime, timedelta
+
+from ledger import Partition, UserLedger
+
+NOW = datetime(2024, 5, 10, 12, 30)
+
+
+def make_ledger(rows=()):
+    return UserLedger(rows, {'wallets': 1}, {'expense': {7: 'Food'}, 'income': {3: 'Salary'}})
+
+
+def test_partitions_stay_ordered_by_date_and_id():
+    ledger = make_ledger([(1, NOW, 'expense', 10.0, 'BYN', 1, 7)])
+    ledger.add(5, NOW + timedelta(days=1), 'expense', 100.0, 'BYN', 1, 7)
+    ledger.add(4, NOW, 'expense', 2.0, 'BYN', 1, 7)
+    ledger.add(3, NOW - timedelta(days=1), 'expense', 1.0, 'BYN', 1, 7)
+    ledger.add(0, NOW.isoformat(' '), 'expense', 3.0, 'BYN', 1, 7)
+    ledger.add(6, NOW, 'income', 50.0, 'USD', 2, 3)
+
+    partition = ledger.partitions[(1, 'expense', 7, 'BYN')]
+    assert list(partition.ids) == [3, 0, 1, 4, 5]
+    assert list(partition.running) == [1.0, 4.0, 14.0, 16.0, 116.0]
+
+    assert ledger.remove(1, NOW, 'expense', 'BYN', 1, 7)
+    assert not ledger.remove(5, NOW, 'expense', 'BYN', 1, 7)
+    assert not ledger.remove(6, NOW, 'income', 'BYN', 2, 3)
+    assert list(partition.ids) == [3, 0, 4, 5]
+    assert list(partition.running) == [1.0, 4.0, 6.0, 106.0]
+    assert len(ledger) == 5
+    assert ledger.nbytes() == 5 * 40
+
+
+
+def test_totals_are_correctly_rounded_sums_of_the_span():
+    assert Partition([1, 2, 3], [1, 2, 3], [0.1, 0.2, 0.3]).total(1, 3) == 0.5
+
+    # A long history: spans late in it sit on a large running total
+    rng = random.Random(7)
+    amounts = [round(rng.uniform(0.01, 5000), 2) for _ in range(20000)]
+    partition = Partition(range(len(amounts)), range(len(amounts)), amounts)
+    for _ in range(500):
+        lo = rng.randrange(len(amounts))
+        hi = rng.randrange(lo, len(amounts) + 1)
+        assert partition.total(lo, hi) == math.fsum(amounts[lo:hi])
+
+    # Inserts and removals rerun the sums as a fresh load would
+    partition.insert(10, 10**6, 0.07)
+    assert partition.remove(500, 500)
+    amounts.insert(11, 0.07)
+    del amounts[501]
+    assert partition.total(5, 15000) == math.fsum(amounts[5:15000])
+
+def test_period_groups_and_balances():
+    ledger = make_ledger([
+        (1, NOW - timedelta(days=2), 'expense', 10.0, 'BYN', 1, 7),
+        (2, NOW - timedelta(days=1), 'expense', 5.0, 'USD', 2, 7),
+        (3, NOW, 'income', 100.0, 'BYN', 1, 3),
+        (4, NOW, 'expense', 1.5, 'BYN', 1, 0),
+    ])
+
+    groups = ledger.period_groups(NOW - timedelta(days=1), NOW)
+    assert sorted(groups, key=str) == sorted([
+        ('expense', 'Food', 5.0, 1, None, None),
+        ('expense', None, 1.5, 1, None, None),
+        ('income', 'Salary', 100.0, 1, None, None),
+    ], key=str)
+
+    converted = ledger.period_groups(NOW - timedelta(days=3), NOW, 'BYN')
+    assert ('expense', 'Food', 5.0, 1, 'USD', (NOW - timedelta(days=1)).date()) in converted
+    assert ('expense', 'Food', 10.0, 1, 'BYN', None) in converted
+
+    assert ledger.balances_at(NOW - timedelta(days=3)) == {}
+    assert ledger.balances_at(NOW - timedelta(days=1)) == {1: -10.0, 2: -5.0}
+    ledger.add(9, NOW + timedelta(hours=1), 'expense', 20.0, 'BYN', 1, 7)
+    assert ledger.balances_at(NOW + timedelta(days=1)) == {1: 68.5, 2: -5.0}
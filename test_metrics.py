@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus metrics registry and instrumentation
+"""
+
+import asyncio
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+import metrics
+from metrics import Counter, Histogram, Registry
+from models import engine
+
+
+def test_counter_renders_labels_escaped():
+    registry = Registry()
+    counter = registry.register(Counter('jobs_total', 'Jobs', ('queue',)))
+    counter.inc(('a"b',))
+    counter.inc(('a"b',), 2)
+    counter.inc(('plain',))
+
+    assert registry.render() == (
+        '# HELP jobs_total Jobs\n'
+        '# TYPE jobs_total counter\n'
+        'jobs_total{queue="a\\"b"} 3\n'
+        'jobs_total{queue="plain"} 1\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, ('/x',))
+
+    lines = histogram.render().splitlines()[2:]
+    assert lines == [
+        'latency_seconds_bucket{route="/x",le="0.1"} 2',
+        'latency_seconds_bucket{route="/x",le="1.0"} 3',
+        'latency_seconds_bucket{route="/x",le="+Inf"} 4',
+        'latency_seconds_sum{route="/x"} 3.65',
+        'latency_seconds_count{route="/x"} 4',
+    ]
+
+
+def test_sql_statements_are_tallied_per_context():
+    before = metrics.sql_statements.value()
+    timer = metrics.Timer()
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        conn.execute(text('SELECT 2'))
+    timer.stop()
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 3'))
+
+    assert timer.statements == 2
+    assert timer.db_seconds > 0
+    assert metrics.sql_statements.value() - before == 3
+
+
+def test_failing_statement_leaves_no_timing_behind(monkeypatch):
+    seen = []
+    monkeypatch.setattr(metrics, 'statement_hooks', [lambda *args: seen.append(args)])
+    with engine.connect() as conn:
+        with pytest.raises(Exception):
+            conn.execute(text('SELECT * FROM no_such_table'))
+        conn.rollback()
+        conn.execute(text('SELECT 1'))
+        info = dict(conn.info)
+
+    assert [args[2] for args in seen] == ['SELECT 1']
+    assert 0 < seen[0][-1] < 1
+    assert not any('metrics' in key for key in info)
+
+
+def test_instrumented_handler_records_latency_and_errors():
+    async def ok(update, context):
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+        return 'done'
+
+    async def broken(update, context):
+        raise RuntimeError('boom')
+
+    calls = metrics.bot_latency.count(('test_ok',))
+    assert asyncio.run(metrics.instrument_handler('test_ok', ok)(None, None)) == 'done'
+    with pytest.raises(RuntimeError):
+        asyncio.run(metrics.instrument_handler('test_broken', broken)(None, None))
+
+    assert metrics.bot_latency.count(('test_ok',)) == calls + 1
+    assert metrics.bot_errors.value(('test_broken',)) >= 1
+    assert 'finance_bot_handler_sql_statements_count{handler="test_ok"}' in metrics.registry.render()
+
+
+def test_updates_are_counted_by_type():
+    before = metrics.bot_updates.value(('callback_query',))
+    metrics.count_update(SimpleNamespace(message=None, callback_query=object()))
+
+    assert metrics.bot_updates.value(('callback_query',)) == before + 1
+    assert metrics.update_type(SimpleNamespace()) == 'other'
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, 'enabled', False)
+    before = metrics.sql_statements.value()
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+
+    assert metrics.sql_statements.value() == before
+
+
+def test_serve_exposes_registry():
+    server = metrics.serve(0, host='127.0.0.1')
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+            body = response.read().decode()
+            assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+    finally:
+        server.shutdown()
+
+    assert '# TYPE finance_db_statements_total counter' in body
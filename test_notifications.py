@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Tests for the notification queue and its dispatcher against a stubbed Bot API
+"""
+
+import asyncio
+import itertools
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from telegram import Bot
+
+import manage
+import metrics
+from benchmarks.fake_bot_api import FakeBotAPI, TOKEN
+from database import DatabaseManager
+from models import SessionLocal, NotificationJob
+from notifications import Dispatcher, TokenBucket
+
+chat_ids = itertools.count(6_000_000_000)
+
+
+async def call_db(operation, *args):
+    with SessionLocal() as db:
+        return operation(DatabaseManager(db), *args)
+
+
+def db_call(operation, *args):
+    with SessionLocal() as db:
+        return operation(DatabaseManager(db), *args)
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    """The dispatcher claims every due job; start each test with none"""
+    with SessionLocal() as db:
+        db.query(NotificationJob).delete()
+        db.commit()
+    yield
+
+
+def jobs(**filters) -> list:
+    with SessionLocal() as db:
+        return db.query(NotificationJob).filter_by(**filters).order_by(NotificationJob.id).all()
+
+
+async def wait_until(condition, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.02)
+    return condition()
+
+
+async def deliver(api, scenario, **options):
+    """Run scenario(dispatcher) with a started dispatcher, stopping it afterwards"""
+    options = dict({'rate': 200, 'chat_rate': 100, 'poll_interval': 0.1}, **options)
+    async with Bot(TOKEN, base_url=api.base_url) as bot:
+        dispatcher = Dispatcher(bot, call_db, **options)
+        dispatcher.start()
+        try:
+            return await scenario(dispatcher)
+        finally:
+            await dispatcher.stop()
+
+
+def queued(count: int) -> callable:
+    return lambda: len(jobs(status='sent')) + len(jobs(status='failed')) >= count
+
+
+def test_token_bucket_spaces_tokens_and_pauses():
+    now = [0.0]
+    bucket = TokenBucket(2, 2, clock=lambda: now[0])
+    assert (bucket.reserve(), bucket.reserve()) == (0.0, 0.0)
+    assert bucket.reserve() == pytest.approx(0.5)
+    now[0] = 2.0
+    bucket.pause(3)
+    assert bucket.reserve() == pytest.approx(3.0)
+    now[0] = 5.0
+    # No burst after a pause: tokens refill from empty
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_every_job_is_sent_once_in_chat_order():
+    chats = [next(chat_ids) for _ in range(3)]
+    rows = [{'chat_id': chat, 'text': f'{chat}:{n}', 'dedup_key': f'test:{chat}:{n}'}
+            for n in range(5) for chat in chats]
+    assert db_call(DatabaseManager.enqueue_notifications, rows) == 15
+    # Same keys again: nothing new is queued
+    assert db_call(DatabaseManager.enqueue_notifications, rows[:4]) == 0
+
+    async def scenario(dispatcher):
+        assert await dispatcher.enqueue(chats[0], 'late', dedup_key='test:late') == 1
+        assert await dispatcher.enqueue(chats[0], 'late', dedup_key='test:late') == 0
+        assert await wait_until(queued(16))
+
+    with FakeBotAPI() as api:
+        asyncio.run(deliver(api, scenario))
+        sent = [(chat, text) for chat, text, at in api.sent]
+
+    assert len(sent) == len(set(sent)) == 16
+    for chat in chats:
+        assert [text for to, text in sent if to == chat and text != 'late'] == [f'{chat}:{n}' for n in range(5)]
+    assert all(job.message_id and job.sent_at and job.attempts == 1 for job in jobs(status='sent'))
+
+
+def test_rate_limits_space_the_sends():
+    chat, others = next(chat_ids), [next(chat_ids) for _ in range(20)]
+    db_call(DatabaseManager.enqueue_notifications,
+            [{'chat_id': chat, 'text': str(n)} for n in range(4)] + [{'chat_id': c, 'text': 'x'} for c in others])
+
+    async def scenario(dispatcher):
+        assert await wait_until(queued(24))
+
+    with FakeBotAPI() as api:
+        asyncio.run(deliver(api, scenario, rate=10, chat_rate=5))
+        to_chat = [at for to, text, at in api.sent if to == chat]
+        everything = sorted(at for to, text, at in api.sent)
+
+    # 5/s to the chat: its four messages take 0.6s
+    assert to_chat[-1] - to_chat[0] >= 0.55
+    # 10/s overall after a burst of 10: 24 sends take 1.4s
+    assert len(everything) == 24
+    assert everything[-1] - everything[0] >= 1.3
+
+
+def test_rate_limit_pauses_sending_and_keeps_the_attempt(monkeypatch):
+    monkeypatch.setattr(metrics, 'enabled', True)
+    chats = [next(chat_ids) for _ in range(3)]
+    db_call(DatabaseManager.enqueue_notifications, [{'chat_id': chat, 'text': 'hi', 'kind': 'test'} for chat in chats])
+    limited = metrics.notifications.value(('test', 'rate_limited'))
+    sent = metrics.notifications.value(('test', 'sent'))
+
+    async def scenario(dispatcher):
+        assert await wait_until(queued(3))
+
+    with FakeBotAPI() as api:
+        api.fail(429, 'Too Many Requests: retry after 1', chat_id=chats[0], retry_after=1)
+        started = time.perf_counter()
+        asyncio.run(deliver(api, scenario))
+        first = min(at for to, text, at in api.sent if to == chats[0])
+
+    assert first - started >= 1.0
+    assert [job.attempts for job in jobs(status='sent')] == [1, 1, 1]
+    assert jobs(chat_id=chats[0])[0].last_error.startswith('Flood control')
+    assert metrics.notifications.value(('test', 'rate_limited')) - limited == 1
+    assert metrics.notifications.value(('test', 'sent')) - sent == 3
+
+
+def test_blocked_chats_fail_and_network_errors_retry():
+    blocked, flaky = next(chat_ids), next(chat_ids)
+    db_call(DatabaseManager.enqueue_notifications,
+            [{'chat_id': blocked, 'text': 'hi'}, {'chat_id': flaky, 'text': 'hi'}])
+
+    async def scenario(dispatcher):
+        assert await wait_until(queued(1))
+        # The flaky chat's job waits for its backoff; make it due now
+        with SessionLocal() as db:
+            db.query(NotificationJob).filter_by(chat_id=flaky).update({NotificationJob.next_attempt_at: NotificationJob.created_at})
+            db.commit()
+        assert await wait_until(queued(2))
+
+    with FakeBotAPI() as api:
+        api.fail(403, 'Forbidden: bot was blocked by the user', chat_id=blocked, times=5)
+        api.fail(502, 'Bad Gateway', chat_id=flaky)
+        asyncio.run(deliver(api, scenario))
+        assert [to for to, text, at in api.sent] == [flaky]
+
+    failed, = jobs(chat_id=blocked)
+    assert (failed.status, failed.attempts) == ('failed', 1)
+    assert 'blocked' in failed.last_error
+    retried, = jobs(chat_id=flaky)
+    assert (retried.status, retried.attempts) == ('sent', 2)
+
+
+def test_restart_neither_resends_nor_loses_messages():
+    chat, other = next(chat_ids), next(chat_ids)
+    # A replica that is alive and sending
+    db_call(DatabaseManager.enqueue_notifications, [{'chat_id': other, 'text': 'live'}])
+    assert len(db_call(DatabaseManager.claim_notifications, 1, 'live')) == 1
+    # and a dispatcher that crashed holding claims long ago
+    db_call(DatabaseManager.enqueue_notifications, [{'chat_id': chat, 'text': str(n)} for n in range(6)])
+    assert len(db_call(DatabaseManager.claim_notifications, 2, 'crashed')) == 2
+    with SessionLocal() as db:
+        db.query(NotificationJob).filter_by(claim_token='crashed')\
+            .update({NotificationJob.claimed_at: datetime.utcnow() - timedelta(minutes=10)})
+        db.commit()
+
+    async def stop_early(dispatcher):
+        assert await wait_until(lambda: len(jobs(status='sent')) >= 2)
+
+    async def finish(dispatcher):
+        assert await wait_until(queued(6))
+
+    with FakeBotAPI() as api:
+        # One message per second to the chat: the first run stops with most of the queue unsent
+        asyncio.run(deliver(api, stop_early, chat_rate=1))
+        counts = db_call(DatabaseManager.get_notification_counts)
+        # Only the live replica's claim is left
+        assert counts['sending'] == 1
+        assert counts['sent'] + counts['pending'] == 6
+
+        asyncio.run(deliver(api, finish))
+        texts = [text for to, text, at in api.sent]
+
+    assert texts == [str(n) for n in range(6)]
+    live, = jobs(chat_id=other)
+    assert (live.status, live.claim_token) == ('sending', 'live')
+
+
+def test_a_sent_message_is_recorded_not_resent_when_the_database_fails(monkeypatch):
+    chat = next(chat_ids)
+    db_call(DatabaseManager.enqueue_notifications, [{'chat_id': chat, 'text': 'hi'}])
+    complete = DatabaseManager.complete_notification
+    failures = [RuntimeError('database is gone')] * 3
+
+    def flaky(self, job_id, message_id=None):
+        if failures:
+            raise failures.pop()
+        return complete(self, job_id, message_id)
+
+    async def scenario(dispatcher):
+        assert await wait_until(lambda: jobs(chat_id=chat)[0].status == 'sent')
+
+    monkeypatch.setattr(DatabaseManager, 'complete_notification', flaky)
+    with FakeBotAPI() as api:
+        # Claims are maintained (and the record retried) every 0.1s
+        asyncio.run(deliver(api, scenario, claim_timeout=0.3))
+        assert [to for to, text, at in api.sent] == [chat]
+
+    job, = jobs(chat_id=chat)
+    assert (job.status, job.attempts, job.claim_token) == ('sent', 1, None)
+    assert job.message_id
+
+
+
+def test_notify_command_queues_a_broadcast(capsys):
+    recipients = [next(chat_ids) for _ in range(3)]
+    argv = ['notify', '--key', 'news-1'] + [arg for chat in recipients for arg in ('--telegram-id', str(chat))]
+    assert manage.main(argv + ['<b>News</b>']) == 0
+    assert 'Queued 3 notifications' in capsys.readouterr().out
+    assert manage.main(argv + ['<b>News</b>']) == 0
+    assert 'Queued 0 notifications' in capsys.readouterr().out
+
+    queue = jobs(status='pending')
+    assert [(job.chat_id, job.kind, job.dedup_key) for job in queue] == \
+        [(chat, 'broadcast', f'news-1:{chat}') for chat in recipients]
+    assert manage.main(['notify', '--all', ' ']) == 1
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the time-series report helpers
+"""
+
+from datetime import date
+
+import pytest
+
+from reports import bucket_start, bucket_range, bucket_count, rolling_mean, deltas, percent_changes, run_rate, build_timeseries
+
+
+def test_buckets_start_on_mondays_and_first_days():
+    assert bucket_start(date(2024, 3, 17), 'week') == date(2024, 3, 11)  # Sunday
+    assert bucket_start(date(2024, 3, 11), 'week') == date(2024, 3, 11)  # Monday
+    assert bucket_start(date(2024, 2, 29), 'month') == date(2024, 2, 1)
+    assert bucket_range(date(2023, 12, 15), date(2024, 2, 1), 'month') == \
+        [date(2023, 12, 1), date(2024, 1, 1), date(2024, 2, 1)]
+    assert len(bucket_range(date(2024, 1, 1), date(2024, 12, 31), 'day')) == 366
+
+
+@pytest.mark.parametrize('bucket', ['day', 'week', 'month'])
+@pytest.mark.parametrize('start, end', [
+    (date(2024, 1, 1), date(2024, 1, 1)),
+    (date(2023, 12, 15), date(2024, 2, 1)),
+    (date(2024, 3, 17), date(2024, 3, 18)),
+    (date(2020, 2, 29), date(2024, 11, 30)),
+    (date(2024, 2, 1), date(2024, 1, 1)),
+])
+def test_bucket_count_matches_bucket_range(bucket, start, end):
+    assert bucket_count(start, end, bucket) == len(bucket_range(start, end, bucket))
+
+
+def test_rolling_mean_and_deltas():
+    values = [1.0, 2.0, 3.0, 4.0, 10.0]
+    assert rolling_mean(values, 3) == [None, None, 2.0, 3.0, pytest.approx(17 / 3)]
+    assert rolling_mean(values, 1) == values
+    assert deltas(values) == [None, 1.0, 1.0, 1.0, 6.0]
+    assert percent_changes([0.0, 5.0, 10.0]) == [None, None, 100.0]
+
+
+def test_run_rate_projects_the_current_bucket():
+    forecast = run_rate(100.0, date(2024, 4, 1), date(2024, 4, 10), 'month')
+    assert (forecast['elapsed_days'], forecast['total_days']) == (10, 30)
+    assert forecast['projected'] == pytest.approx(300)
+
+
+def test_build_timeseries_fills_empty_buckets():
+    groups = [
+        (date(2024, 1, 1), 'expense', 'Food', 30.0, 3),
+        (date(2024, 3, 1), 'expense', None, 10.0, 1),
+        (date(2024, 3, 1), 'income', 'Salary', 100.0, 1),
+    ]
+    result = build_timeseries(groups, date(2024, 1, 1), date(2024, 3, 15), 'month', window=2,
+                              by_category=True, today=date(2024, 3, 15))
+
+    assert result['periods'] == ['2024-01-01', '2024-02-01', '2024-03-01']
+    assert result['expense'] == [30.0, 0.0, 10.0]
+    assert result['net'] == [-30.0, 0.0, 90.0]
+    assert result['expense_rolling'] == [None, 15.0, 5.0]
+    assert result['expenses_by_category'] == {'Food': [30.0, 0.0, 0.0]}
+    assert result['income_by_source'] == {'Salary': [0.0, 0.0, 100.0]}
+    assert result['forecast']['expense']['projected'] == pytest.approx(10 / 15 * 31)
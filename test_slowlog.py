@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests for the slow query log
+"""
+
+import itertools
+import json
+
+import pytest
+
+import manage
+import metrics
+import slowlog
+from database import DatabaseManager
+from models import SessionLocal, engine
+
+_telegram_ids = itertools.count(7_000_000_000)
+
+
+def test_normalize_replaces_literals_and_parameters():
+    assert slowlog.normalize("SELECT * FROM t WHERE a = 'x''y' AND b = 42 AND c IN (?, ?, ?)") == \
+        'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)'
+    assert slowlog.normalize('SELECT  x::text\n FROM t WHERE id = %(id_1)s LIMIT :limit') == \
+        'SELECT x::text FROM t WHERE id = ? LIMIT ?'
+    assert slowlog.normalize('INSERT INTO t (a, b) VALUES (?, ?), (?, ?)') == 'INSERT INTO t (a, b) VALUES (...)'
+    assert slowlog.fingerprint(slowlog.normalize('SELECT 1 WHERE x IN (1, 2)')) == \
+        slowlog.fingerprint(slowlog.normalize('SELECT 7 WHERE x IN (3, 4, 5)'))
+
+
+@pytest.fixture
+def capture(tmp_path):
+    """Log every statement for the duration of a test"""
+    log = slowlog.attach(engine, path=str(tmp_path / 'slow.jsonl'), threshold_ms=1e-9)
+    yield log
+    slowlog.detach(log)
+
+
+def records(log):
+    return list(slowlog.read_log(log.path))
+
+
+def test_slow_statements_carry_source_caller_and_plan(capture):
+    db = SessionLocal()
+    try:
+        db_manager = DatabaseManager(db)
+        user = db_manager.get_or_create_user(next(_telegram_ids), first_name='Slow')
+        timer = metrics.Timer('GET /api/user/<int:telegram_id>/wallets')
+        db_manager.get_user_wallets(user.id)
+        db_manager.get_user_wallets(user.id)
+        timer.stop()
+    finally:
+        db.close()
+
+    wallets = [r for r in records(capture) if r['caller'] == 'DatabaseManager.get_user_wallets']
+    assert len(wallets) == 2
+    first, second = wallets
+    assert first['fingerprint'] == second['fingerprint']
+    assert first['source'] == 'GET /api/user/<int:telegram_id>/wallets'
+    assert first['statement'].startswith('SELECT') and '?' in first['statement']
+    assert any('wallets' in line for line in first['plan'])
+    # The plan is captured once per fingerprint, not on every occurrence
+    assert 'plan' not in second
+
+
+class RecordingCursor:
+    """DBAPI cursor that fails the EXPLAIN and remembers what it ran"""
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    def execute(self, statement, parameters=None):
+        self.executed.append(statement)
+        if statement.startswith('EXPLAIN'):
+            raise RuntimeError('cannot explain')
+
+    def close(self):
+        pass
+
+
+def test_failed_explain_is_rolled_back_to_a_savepoint():
+    executed = []
+    conn = type('Conn', (), {})()
+    conn.dialect = type('Dialect', (), {'name': 'postgresql'})()
+    conn.connection = type('Fairy', (), {})()
+    conn.connection.dbapi_connection = type('DBAPI', (), {'cursor': lambda self: RecordingCursor(executed)})()
+
+    with pytest.raises(RuntimeError):
+        slowlog.explain(conn, 'SELECT 1', {})
+    assert executed == ['SAVEPOINT slowlog_explain', 'EXPLAIN SELECT 1',
+                        'ROLLBACK TO SAVEPOINT slowlog_explain', 'RELEASE SAVEPOINT slowlog_explain']
+
+
+def test_without_a_file_records_go_to_the_logger(caplog):
+    log = slowlog.attach(engine, path='', threshold_ms=1e-9)
+    try:
+        with caplog.at_level('WARNING', logger=slowlog.logger.name):
+            with SessionLocal() as db:
+                DatabaseManager(db).get_user(next(_telegram_ids))
+    finally:
+        slowlog.detach(log)
+
+    lines = [r.getMessage() for r in caplog.records if r.name == slowlog.logger.name]
+    assert any('DatabaseManager.get_user' in line for line in lines)
+
+
+def test_report_groups_and_sorts(tmp_path):
+    rows = [
+        {'at': f'2024-01-0{day}T00:00:00', 'fingerprint': fp, 'statement': fp.upper(), 'ms': ms,
+         'source': 'GET /x', 'caller': 'DatabaseManager.get_x', 'plan': ['SCAN t'] if day == 1 else None}
+        for day, fp, ms in [(1, 'a', 100), (2, 'a', 300), (3, 'b', 250), (4, 'a', 500)]
+    ]
+
+    by_total = slowlog.report(rows)
+    assert [row['fingerprint'] for row in by_total] == ['a', 'b']
+    a = by_total[0]
+    assert (a['count'], a['total_ms'], a['max_ms']) == (3, 900, 500)
+    assert a['plan'] == ['SCAN t'] and a['plan_at'] == '2024-01-01T00:00:00'
+    assert a['sources'] == {'GET /x': 3}
+    assert [row['fingerprint'] for row in slowlog.report(rows, sort='count', top=1)] == ['a']
+    assert [row['fingerprint'] for row in slowlog.report(rows, since='2024-01-03')] == ['a', 'b']
+    with pytest.raises(ValueError):
+        slowlog.report(rows, sort='nope')
+
+    path = tmp_path / 'slow.jsonl'
+    path.write_text('\n'.join(json.dumps(row) for row in rows) + '\nnot json\n')
+    assert len(list(slowlog.read_log(str(path)))) == 4
+
+
+def test_cli_prints_top_statements(tmp_path, capsys):
+    path = tmp_path / 'slow.jsonl'
+    path.write_text(json.dumps({'at': '2024-01-01T00:00:00', 'fingerprint': 'abc', 'statement': 'SELECT ?',
+                                'ms': 250.0, 'source': 'bot start', 'caller': None, 'plan': ['SCAN t']}) + '\n')
+
+    assert manage.main(['slow-queries', '--log', str(path), '--plans']) == 0
+    output = capsys.readouterr().out
+    assert '[abc] 1 × 250.0 ms' in output
+    assert 'bot start (1)' in output
+    assert 'SCAN t' in output
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for the process supervisor with small stand-in processes and the real bot
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from benchmarks.fake_bot_api import FakeBotAPI, TOKEN, make_command_update
+from supervisor import Service, Supervisor, bot_service, file_ready
+
+
+def script(code: str) -> list:
+    return [sys.executable, '-c', code]
+
+
+def wait_until(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@contextmanager
+def supervising(supervisor):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(supervisor.run()))
+    thread.start()
+    try:
+        yield supervisor
+    finally:
+        supervisor.stop()
+        thread.join(30)
+        assert not thread.is_alive() and result == [0]
+
+
+def test_services_start_in_order_once_ready(tmp_path):
+    first_ready, second_ready = str(tmp_path / 'first'), str(tmp_path / 'second')
+    first = Service('first', script(f"import time; time.sleep(0.5); open({first_ready!r}, 'w').close(); time.sleep(60)"),
+                    file_ready(first_ready))
+    # The second one records whether the first was ready when it started
+    second = Service('second', script(f"import os, time; open({second_ready!r}, 'w').write(str(os.path.exists({first_ready!r}))); "
+                                      f"time.sleep(60)"),
+                     file_ready(second_ready))
+
+    with supervising(Supervisor([first, second], poll_interval=0.05)):
+        assert wait_until(lambda: second.is_ready)
+        assert open(second_ready).read() == 'True'
+    assert not first.running and not second.running
+
+
+def test_crashed_and_hung_processes_are_restarted(tmp_path):
+    starts, ready = str(tmp_path / 'starts'), str(tmp_path / 'ready')
+    # First run crashes, second hangs without becoming ready, third serves
+    code = (f"import sys, time\n"
+            f"with open({starts!r}, 'a') as f: f.write('x')\n"
+            f"n = len(open({starts!r}).read())\n"
+            f"if n == 1: sys.exit(3)\n"
+            f"if n == 3: open({ready!r}, 'w').close()\n"
+            f"time.sleep(60)\n")
+    flaky = Service('flaky', script(code), file_ready(ready))
+
+    with supervising(Supervisor([flaky], ready_timeout=1.0, stop_timeout=5, poll_interval=0.05)):
+        assert wait_until(lambda: flaky.is_ready, timeout=30)
+        assert flaky.restarts == 2
+        assert flaky.backoff == 2.0
+        # Once up it is left alone
+        time.sleep(0.3)
+        assert flaky.restarts == 2
+
+
+def test_shutdown_terminates_then_kills(tmp_path):
+    stopped = str(tmp_path / 'stopped')
+    graceful = Service('graceful', script(
+        "import signal, sys, time\n"
+        f"signal.signal(signal.SIGTERM, lambda *a: (open({stopped!r}, 'w').close(), sys.exit(0)))\n"
+        "time.sleep(60)\n"))
+    stubborn = Service('stubborn', script(
+        "import signal, time\n"
+        "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+        "time.sleep(60)\n"))
+
+    started = time.monotonic()
+    with supervising(Supervisor([graceful, stubborn], stop_timeout=0.5, poll_interval=0.05)):
+        # Give the children time to install their handlers
+        time.sleep(0.5)
+    assert time.monotonic() - started < 10
+    assert graceful.process.returncode == 0 and os.path.exists(stopped)
+    assert stubborn.process.returncode < 0
+
+
+def test_bot_process_reports_ready_and_serves(monkeypatch):
+    with FakeBotAPI() as api:
+        monkeypatch.setenv('TELEGRAM_TOKEN', TOKEN)
+        monkeypatch.setenv('BOT_API_URL', api.base_url)
+        bot = bot_service()
+        with supervising(Supervisor([bot], ready_timeout=30, poll_interval=0.05)):
+            assert wait_until(lambda: bot.is_ready, timeout=30)
+            assert api.count('getMe') >= 1
+            api.push_updates([make_command_update(1, 8_200_000_000)])
+            assert api.wait_for('sendMessage', 1, 20)
+        assert bot.process.returncode == 0
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+Tests for the Flask API using the test client
+"""
+
+import gc
+import io
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from models import engine, pool_stats, SessionLocal, Transaction
+from database import DatabaseManager
+from importer import import_transactions
+from webapp import app
+
+_telegram_ids = itertools.count(5_000_000_000)
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    return app.test_client()
+
+
+@pytest.fixture
+def user(client):
+    """A fresh user with a wallet, a category and an income source"""
+    telegram_id = next(_telegram_ids)
+    user_id = client.post(f'/api/user/{telegram_id}', json={'first_name': 'Test'}).get_json()['id']
+    db = SessionLocal()
+    try:
+        db_manager = DatabaseManager(db)
+        wallet = db_manager.create_wallet(user_id, 'Cash', 'BYN')
+        category = db_manager.create_expense_category(user_id, 'Food')
+        source = db_manager.create_income_source(user_id, 'Salary')
+        return {'telegram_id': telegram_id, 'id': user_id, 'wallet_id': wallet.id,
+                'category_id': category.id, 'source_id': source.id}
+    finally:
+        db.close()
+
+
+def add_transactions(user, count):
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        for n in range(count):
+            income = n % 3 == 0
+            db.add(Transaction(
+                user_id=user['id'],
+                wallet_id=user['wallet_id'],
+                transaction_type='income' if income else 'expense',
+                amount=10.0 + n,
+                currency='BYN',
+                date=now - timedelta(hours=n),
+                income_source_id=user['source_id'] if income else None,
+                expense_category_id=None if income else user['category_id']
+            ))
+        db.commit()
+        DatabaseManager(db).rebuild_daily_rollups(user['id'])
+    finally:
+        db.close()
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_transactions_query_count_is_constant(client, user):
+    add_transactions(user, 60)
+
+    counts = {}
+    for limit in (1, 5, 50):
+        with count_queries() as statements:
+            response = client.get(f"/api/user/{user['telegram_id']}/transactions?limit={limit}")
+        assert response.status_code == 200
+        assert len(response.get_json()) == limit
+        counts[limit] = len(statements)
+
+    assert len(set(counts.values())) == 1, counts
+
+
+def test_transactions_serialize_related_names(client, user):
+    add_transactions(user, 2)
+
+    income, expense = client.get(f"/api/user/{user['telegram_id']}/transactions").get_json()
+    assert income['wallet_name'] == expense['wallet_name'] == 'Cash'
+    assert income['income_source_name'] == 'Salary'
+    assert income['expense_category_name'] is None
+    assert expense['expense_category_name'] == 'Food'
+    assert expense['expense_category_icon'] == '💰'
+
+
+def test_keyset_pagination_walks_every_transaction_once(client, user):
+    add_transactions(user, 23)
+    url = f"/api/user/{user['telegram_id']}/transactions?limit=5&cursor="
+
+    seen = []
+    page = client.get(url).get_json()
+    while True:
+        seen.extend(t['id'] for t in page['transactions'])
+        if page['next_cursor'] is None:
+            break
+        # Rows inserted while paging land on top and do not shift later pages
+        add_transactions(user, 1)
+        page = client.get(url + page['next_cursor']).get_json()
+
+    assert len(seen) == len(set(seen)) == 23
+    offset_ids = [t['id'] for t in client.get(
+        f"/api/user/{user['telegram_id']}/transactions?limit=100"
+    ).get_json()]
+    assert offset_ids[len(offset_ids) - 23:] == seen
+
+
+def test_invalid_cursor_is_rejected(client, user):
+    response = client.get(f"/api/user/{user['telegram_id']}/transactions?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('query', ['cursor=&limit=0', 'cursor=&limit=-1', 'limit=0', 'limit=-5'])
+def test_limit_below_one_is_rejected(client, user, query):
+    add_transactions(user, 2)
+    response = client.get(f"/api/user/{user['telegram_id']}/transactions?{query}")
+    assert response.status_code == 400
+
+
+def test_oversized_limit_is_capped(client, user, monkeypatch):
+    monkeypatch.setattr('webapp.TRANSACTIONS_MAX_LIMIT', 3)
+    add_transactions(user, 5)
+    base = f"/api/user/{user['telegram_id']}/transactions?limit=1000"
+    assert len(client.get(base).get_json()) == 3
+    page = client.get(base + '&cursor=').get_json()
+    assert len(page['transactions']) == 3 and page['next_cursor'] is not None
+
+
+def test_bulk_import_reports_bad_rows_and_updates_balance(client, user):
+    body = '\n'.join([
+        'date,type,amount,currency,wallet,category,source,description',
+        '2024-01-05,expense,12.50,,Cash,Food,,Lunch',
+        '2024-01-06T10:00:00Z,income,1000,BYN,cash,,Salary,',
+        '2024-01-07,expense,-3,,Cash,,,negative',
+        '2024-01-08,transfer,3,,Cash,,,bad type',
+        '2024-01-09,expense,7.5,,Nowhere,,,unknown wallet',
+        'yesterday,expense,1,,Cash,,,bad date',
+        '0001-01-01T00:00:00+05:00,expense,1,,Cash,,,before year 1 in UTC',
+        f"2024-01-10,expense,2.5,BYN,{user['wallet_id']},,,by id",
+    ])
+    response = client.post(f"/api/user/{user['telegram_id']}/transactions/import",
+                           data=body, content_type='text/csv')
+    report = response.get_json()
+
+    assert report['imported'] == 3
+    assert report['failed'] == 5
+    assert [error['line'] for error in report['errors']] == [4, 5, 6, 7, 8]
+    assert 'out of range' in report['errors'][-1]['error']
+
+    wallets = client.get(f"/api/user/{user['telegram_id']}/wallets").get_json()
+    assert wallets[0]['balance'] == pytest.approx(1000 - 12.5 - 2.5)
+
+    db = SessionLocal()
+    try:
+        db_manager = DatabaseManager(db)
+        summary = db_manager.get_user_summary(user['id'], period_days=100000)
+        assert summary['transaction_count'] == 3
+        assert summary['expenses_by_category'] == {'Food': 12.5}
+        assert summary['income_by_source'] == {'Salary': 1000}
+    finally:
+        db.close()
+
+
+def test_bulk_import_rejects_non_utf8_input(client, user):
+    body = 'date,type,amount,currency,wallet,category,source,description\n' \
+           '2024-01-05,expense,12.50,,Cash,Food,,Обед\n'
+    response = client.post(f"/api/user/{user['telegram_id']}/transactions/import",
+                           data=body.encode('cp1251'), content_type='text/csv')
+
+    assert response.status_code == 400
+    report = response.get_json()
+    assert report['imported'] == 0
+    assert 'UTF-8' in report['error']
+    assert client.get(f"/api/user/{user['telegram_id']}/wallets").get_json()[0]['balance'] == 0
+
+
+def test_unreadable_input_keeps_the_rows_before_it(user):
+    header = 'date,type,amount,currency,wallet,category,source,description\n'
+    # Well past the decoder's first read, so the bad bytes come after committed batches
+    rows = ''.join(f'2024-01-05,expense,1,,Cash,,,row {n:05d}\n' for n in range(1000))
+    body = (header + rows).encode() + 'Обед\n'.encode('cp1251')
+    db = SessionLocal()
+    try:
+        report = import_transactions(DatabaseManager(db), user['id'], io.BytesIO(body), batch_size=100)
+    finally:
+        db.close()
+
+    assert 'UTF-8' in report['error']
+    assert 0 < report['imported'] <= 1000 and report['failed'] == 0
+    assert report['imported'] == int(report['error'].split('after line ')[1].split(':')[0]) - 1
+
+
+def test_bulk_import_json_lines(client, user):
+    body = '\n'.join([
+        '{"type": "expense", "amount": 5, "wallet_id": %d, "expense_category_id": %d}' % (user['wallet_id'], user['category_id']),
+        '{not json',
+        '',
+        '{"type": "income", "amount": "20.5", "wallet": "Cash", "date": "2024-02-01"}',
+    ])
+    response = client.post(f"/api/user/{user['telegram_id']}/transactions/import?format=ndjson", data=body)
+    report = response.get_json()
+
+    assert report['imported'] == 2
+    assert report['errors'][0]['line'] == 2
+
+
+def test_export_streams_ledger_with_names(client, user):
+    add_transactions(user, 6)
+    url = f"/api/user/{user['telegram_id']}/export"
+
+    response = client.get(url)
+    assert response.mimetype == 'text/csv'
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == 'id,date,type,amount,currency,wallet,category,source,description'
+    assert len(lines) == 7
+    assert ',Cash,Food,,' in lines[1] or ',Cash,,Salary,' in lines[1]
+
+    records = [json.loads(line) for line in client.get(url + '?format=ndjson').get_data(as_text=True).splitlines()]
+    assert [r['date'] for r in records] == sorted(r['date'] for r in records)
+    assert {r['wallet'] for r in records} == {'Cash'}
+    assert {r['source'] for r in records if r['type'] == 'income'} == {'Salary'}
+
+    start = (datetime.utcnow() - timedelta(hours=2, minutes=30)).isoformat()
+    recent = client.get(f'{url}?format=ndjson&start={start}').get_data(as_text=True).splitlines()
+    assert len(recent) == 3
+
+    assert client.get(url + '?format=xml').status_code == 400
+
+
+def test_concurrent_requests_return_every_connection(client, user):
+    add_transactions(user, 20)
+    telegram_id = user['telegram_id']
+    paths = [
+        f'/api/user/{telegram_id}',
+        f'/api/user/{telegram_id}/wallets',
+        f'/api/user/{telegram_id}/transactions?limit=10',
+        f'/api/user/{telegram_id}/summary',
+        f'/api/user/{telegram_id}/export',
+        f'/api/user/{telegram_id}/wallets/999999',
+    ]
+    checkouts = []
+    checkins = []
+    on_checkout = lambda *args: checkouts.append(1)
+    on_checkin = lambda *args: checkins.append(1)
+    event.listen(engine, 'checkout', on_checkout)
+    event.listen(engine, 'checkin', on_checkin)
+
+    def worker(n):
+        thread_client = app.test_client()
+        statuses = []
+        for path in paths * 5:
+            method = thread_client.delete if path.endswith('999999') else thread_client.get
+            response = method(path)
+            response.get_data()
+            response.close()
+            statuses.append(response.status_code)
+        return statuses
+
+    # Connections must come back on teardown, not whenever the GC runs
+    gc.disable()
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = [status for result in pool.map(worker, range(16)) for status in result]
+    finally:
+        gc.enable()
+        event.remove(engine, 'checkout', on_checkout)
+        event.remove(engine, 'checkin', on_checkin)
+
+    assert set(statuses) == {200, 404}
+    assert len(checkouts) == len(checkins) > 0
+    assert pool_stats()['checkedout'] == 0
+
+
+def test_user_lookup_is_cached_and_invalidated(client, user):
+    from cache import user_cache
+    telegram_id = user['telegram_id']
+    client.get(f'/api/user/{telegram_id}/wallets')
+
+    with count_queries() as statements:
+        client.get(f'/api/user/{telegram_id}/wallets')
+    assert not any('FROM users' in statement for statement in statements)
+    assert user_cache.stats()['hits'] >= 1
+
+    assert client.put(f'/api/user/{telegram_id}/currency', json={'currency': 'USD'}).status_code == 200
+    assert user_cache.get(telegram_id) is None
+    db = SessionLocal()
+    try:
+        assert DatabaseManager(db).resolve_user(telegram_id).default_currency == 'USD'
+    finally:
+        db.close()
+
+    assert client.get('/api/user/4999999999/wallets').status_code == 404
+    assert user_cache.get(4999999999) is None
+
+
+def test_bootstrap_matches_individual_endpoints(client, user):
+    add_transactions(user, 12)
+    base = f"/api/user/{user['telegram_id']}"
+
+    data = client.get(base + '/bootstrap').get_json()
+    assert data['user'] == client.get(base).get_json()
+    assert data['wallets'] == client.get(base + '/wallets').get_json()
+    assert data['expense_categories'] == client.get(base + '/expense-categories').get_json()
+    assert data['income_sources'] == client.get(base + '/income-sources').get_json()
+    assert data['recent_transactions'] == client.get(base + '/transactions?limit=5').get_json()
+    summary = client.get(base + '/summary').get_json()
+    assert data['summary'] == summary['summary']
+    assert data['wallet_balances'] == summary['wallet_balances']
+
+    assert client.get('/api/user/4999999998/bootstrap').status_code == 404
+
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=-1', 'period=0', 'period=-30'])
+def test_bootstrap_rejects_non_positive_limit_and_period(client, user, query):
+    response = client.get(f"/api/user/{user['telegram_id']}/bootstrap?{query}")
+    assert response.status_code == 400
+    assert 'at least 1' in response.get_json()['error']
+
+
+def test_bootstrap_query_count_is_constant(client, user):
+    url = f"/api/user/{user['telegram_id']}/bootstrap"
+    add_transactions(user, 3)
+    client.get(url)  # loads the FX rate table
+    with count_queries() as few:
+        client.get(url)
+    add_transactions(user, 40)
+    with count_queries() as many:
+        client.get(url)
+    assert len(few) == len(many) <= 8
+
+
+def test_reference_lists_answer_conditional_gets(client, user):
+    base = f"/api/user/{user['telegram_id']}"
+    client.get(base + '/wallets')  # warms the user cache
+
+    for path in ('/wallets', '/expense-categories', '/income-sources'):
+        first = client.get(base + path)
+        etag = first.headers['ETag']
+        with count_queries() as statements:
+            again = client.get(base + path, headers={'If-None-Match': etag})
+        assert again.status_code == 304
+        assert again.headers['ETag'] == etag
+        assert all('data_versions' in statement for statement in statements), statements
+
+    etag = client.get(base + '/wallets').headers['ETag']
+    client.post(base + '/transactions', json={'wallet_id': user['wallet_id'], 'transaction_type': 'expense',
+                                              'amount': 3, 'currency': 'BYN'})
+    response = client.get(base + '/wallets', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()[0]['balance'] == -3
+
+    etag = client.get(base + '/expense-categories').headers['ETag']
+    client.delete(f"{base}/expense-categories/{user['category_id']}")
+    response = client.get(base + '/expense-categories', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.get_json() == []
+
+    bootstrap = client.get(base + '/bootstrap').get_json()
+    for scope, path in (('wallets', '/wallets'), ('expense_categories', '/expense-categories'),
+                        ('income_sources', '/income-sources')):
+        assert client.get(base + path, headers={'If-None-Match': bootstrap['etags'][scope]}).status_code == 304
+
+
+def test_admin_fx_rates_convert_the_summary(client, user, monkeypatch):
+    from config import Config
+    base = f"/api/user/{user['telegram_id']}"
+    url = '/api/admin/fx-rates'
+    csv_body = 'date,currency,rate\n2000-01-01,USD,2.5\n'
+
+    assert client.post(url, data=csv_body).status_code == 404
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'secret')
+    assert client.post(url, data=csv_body, headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.post(url, json=[{'date': 'x'}], headers={'X-Admin-Token': 'secret'}).status_code == 400
+    response = client.post(url, data=csv_body, headers={'X-Admin-Token': 'secret'})
+    assert response.get_json() == {'loaded': 1}
+
+    db = SessionLocal()
+    try:
+        db_manager = DatabaseManager(db)
+        usd_wallet = db_manager.create_wallet(user['id'], 'Dollars', 'USD')
+        db_manager.create_transaction(user['id'], usd_wallet.id, 'income', 10, 'USD')
+        db_manager.create_transaction(user['id'], user['wallet_id'], 'income', 5, 'BYN')
+    finally:
+        db.close()
+
+    data = client.get(base + '/summary').get_json()
+    assert data['summary']['currency'] == 'BYN'
+    assert data['summary']['total_income'] == pytest.approx(5 + 25)
+    assert data['net_worth'] == {'currency': 'BYN', 'total': pytest.approx(30), 'unconverted_currencies': []}
+
+    data = client.get(base + '/summary?currency=USD').get_json()
+    assert data['summary']['total_income'] == pytest.approx(2 + 10)
+    assert client.get(base + '/summary?currency=EUR').status_code == 400
+
+
+def test_admin_cache_stats(client, user, monkeypatch):
+    from config import Config
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'secret')
+    base = f"/api/user/{user['telegram_id']}"
+    for _ in range(3):
+        client.get(base + '/summary?period=7')
+
+    assert client.get('/api/admin/cache').status_code == 403
+    stats = client.get('/api/admin/cache', headers={'X-Admin-Token': 'secret'}).get_json()
+    assert stats['results']['backend'] == 'LRUCache'
+    # The summary and the wallet balances of each request
+    assert (stats['results']['hits'], stats['results']['misses']) == (4, 2)
+    assert stats['results']['avg_hit_ms'] <= stats['results']['avg_miss_ms']
+    assert stats['users']['hits'] >= 2
+
+
+def test_timeseries_endpoint(client, user):
+    add_transactions(user, 48)  # one every hour, back from now
+    base = f"/api/user/{user['telegram_id']}/timeseries"
+
+    data = client.get(base + '?bucket=day&by_category=1').get_json()
+    assert len(data['periods']) == 31
+    assert sum(data['transaction_count']) == 48
+    assert sum(data['expense']) == pytest.approx(sum(10.0 + n for n in range(48) if n % 3))
+    assert set(data['expenses_by_category']) == {'Food'}
+    assert data['forecast']['expense']['period'] == data['periods'][-1]
+    assert data['currency'] == 'BYN'
+
+    monthly = client.get(base).get_json()
+    assert monthly['bucket'] == 'month' and len(monthly['periods']) in (12, 13)
+    assert sum(monthly['expense']) == pytest.approx(sum(data['expense']))
+
+    assert client.get(base + '?bucket=year').status_code == 400
+    assert client.get(base + '?start=2024-02-01&end=2024-01-01').status_code == 400
+    assert client.get(base + '?bucket=day&start=2000-01-01').status_code == 400
+    # Valid dates at the edges of the calendar
+    assert client.get(base + '?end=0001-01-05').status_code == 400
+    assert client.get(base + '?start=9999-12-01&end=9999-12-31&bucket=day').status_code == 400
+    assert client.get(base + '?start=0001-01-01&end=0001-03-31').status_code == 200
+
+
+def test_metrics_endpoint(client, user):
+    base = f"/api/user/{user['telegram_id']}"
+    client.get(base + '/wallets')
+    client.get('/no/such/page')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    # Routes are labelled by rule, never by the concrete id
+    assert 'route="/api/user/<int:telegram_id>/wallets",status="200"' in body
+    assert str(user['telegram_id']) not in body
+    assert 'finance_http_requests_total{method="GET",route="unmatched",status="404"}' in body
+    assert 'finance_http_request_sql_statements_bucket{method="GET",route="/api/user/<int:telegram_id>/wallets"' in body
+    assert 'finance_db_pool_connections' in body
+    assert 'finance_cache_hits_total{cache="users"}' in body
+
+
+def test_admin_slow_queries(client, monkeypatch, tmp_path):
+    import slowlog
+    from config import Config
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'secret')
+    log = slowlog.attach(engine, path=str(tmp_path / 'slow.jsonl'), threshold_ms=1e-9)
+    monkeypatch.setattr(Config, 'SLOW_QUERY_LOG', log.path)
+    try:
+        client.get('/api/user/1')
+    finally:
+        slowlog.detach(log)
+
+    headers = {'X-Admin-Token': 'secret'}
+    assert client.get('/api/admin/slow-queries').status_code == 403
+    assert client.get('/api/admin/slow-queries?sort=bad', headers=headers).status_code == 400
+    queries = client.get('/api/admin/slow-queries?top=5', headers=headers).get_json()['queries']
+    assert 0 < len(queries) <= 5
+    assert {'GET /api/user/<int:telegram_id>'} & set().union(*(query['sources'] for query in queries))
+
+
+def test_import_does_not_touch_database(tmp_path):
+    # gunicorn preloads the app in the master; the database may not even be reachable there
+    import os
+    import subprocess
+    import sys
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp_path}/missing/dir/app.db')
+    result = subprocess.run([sys.executable, '-c', 'import wsgi, bot'], env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert not (tmp_path / 'missing').exists()
+
+
+def test_init_db_creates_and_migrates_schema(tmp_path):
+    from sqlalchemy import create_engine, inspect
+    from migrate_db import MIGRATIONS, get_schema_version, init_database
+    fresh = create_engine(f'sqlite:///{tmp_path}/fresh.db')
+    try:
+        assert init_database(fresh) and init_database(fresh)
+        with fresh.connect() as conn:
+            assert get_schema_version(conn) == MIGRATIONS[-1][0]
+        assert {'users', 'transactions', 'daily_rollups', 'fx_rates'} <= set(inspect(fresh).get_table_names())
+    finally:
+        fresh.dispose()
+
+
+def test_healthz(client, monkeypatch):
+    assert client.get('/healthz').get_json() == {'status': 'ok'}
+
+    from sqlalchemy.exc import OperationalError
+    def unavailable(*args, **kwargs):
+        raise OperationalError('SELECT 1', {}, Exception('connection refused'))
+    monkeypatch.setattr('sqlalchemy.orm.Session.execute', unavailable)
+    response = client.get('/healthz')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'unavailable'
@@ -1,24 +1,151 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
-from models import get_db, create_tables
+from models import SessionLocal
 from database import DatabaseManager
-from datetime import datetime, timedelta
+from cache import user_cache, result_cache
+from ledger import ledger_cache
+from importer import import_transactions, detect_format, FORMATS
+import exporter
+import fx
+import metrics
+import slowlog
+import reports
+from datetime import date, datetime, timedelta, time
+import hmac
+import io
 import json
 from config import Config
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 
 app = Flask(__name__)
 CORS(app)
 app.config['SECRET_KEY'] = Config.SECRET_KEY
 
-# Create database tables
-create_tables()
+# Importing this module must not touch the database: gunicorn preloads it in the
+# master before forking workers. Schema setup is `python manage.py init-db`.
 
-# Run migration if needed
-try:
-    from migrate_db import migrate_database
-    migrate_database()
-except Exception as e:
-    print(f"Migration warning: {e}")
+def get_db_manager():
+    """DatabaseManager bound to the current request's session"""
+    if 'db' not in g:
+        g.db = SessionLocal()
+    return DatabaseManager(g.db)
+
+@app.teardown_appcontext
+def close_db(exception=None):
+    # Runs after streamed responses finish too, returning the connection to the pool
+    db = g.pop('db', None)
+    if db is not None:
+        db.close()
+
+def request_route() -> str:
+    # Metrics and the slow query log name requests by URL rule, not path, so ids do not create new series
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_timer = metrics.start_request(request.method, request_route())
+
+def finish_request_metrics(status: int):
+    timer = g.pop('metrics_timer', None)
+    if timer is not None:
+        metrics.finish_request(timer, request.method, request_route(), status)
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed bodies (exports) are timed to their headers
+    finish_request_metrics(response.status_code)
+    return response
+
+@app.teardown_request
+def record_failed_request_metrics(exception=None):
+    # Only still pending when an exception skipped after_request
+    finish_request_metrics(500)
+
+def list_etag(user_id, scope, version):
+    """Strong validator of a reference list, derived from its change counter"""
+    return f'{scope}-{user_id}-{version}'
+
+def conditional_list(db_manager, user_id, scope, load):
+    """JSON list with an ETag; 304 when the client already holds this version.
+    
+    The version is read before the list, so a concurrent write can only
+    make the tag older than the data, never newer.
+    """
+    etag = list_etag(user_id, scope, db_manager.get_version(user_id, scope))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(load())
+    response.set_etag(etag)
+    # Always revalidate: other clients (the bot, other devices) change these lists
+    response.cache_control.no_cache = True
+    return response
+
+def serialize_user(user):
+    return {
+        'id': user.id,
+        'telegram_id': user.telegram_id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'default_currency': user.default_currency
+    }
+
+def serialize_wallet(wallet):
+    return {
+        'id': wallet.id,
+        'name': wallet.name,
+        'currency': wallet.currency,
+        'balance': wallet.balance,
+        'is_active': wallet.is_active
+    }
+
+def serialize_wallet_balances(wallets):
+    # Same shape as DatabaseManager.get_wallet_balances, from an already loaded list
+    return [{
+        'id': wallet.id,
+        'name': wallet.name,
+        'currency': wallet.currency,
+        'balance': wallet.balance
+    } for wallet in wallets]
+
+def serialize_income_source(source):
+    return {
+        'id': source.id,
+        'name': source.name,
+        'description': source.description,
+        'is_active': source.is_active
+    }
+
+def serialize_expense_category(category):
+    return {
+        'id': category.id,
+        'name': category.name,
+        'description': category.description,
+        'color': category.color,
+        'icon': category.icon,
+        'is_active': category.is_active
+    }
+
+def serialize_transaction(t):
+    """Serialize a transaction loaded with its wallet, source and category"""
+    return {
+        'id': t.id,
+        'wallet_id': t.wallet_id,
+        'wallet_name': t.wallet.name,
+        'transaction_type': t.transaction_type,
+        'amount': t.amount,
+        'currency': t.currency,
+        'description': t.description,
+        'date': t.date.isoformat(),
+        'income_source_id': t.income_source_id,
+        'income_source_name': t.income_source.name if t.income_source else None,
+        'expense_category_id': t.expense_category_id,
+        'expense_category_name': t.expense_category.name if t.expense_category else None,
+        'expense_category_color': t.expense_category.color if t.expense_category else None,
+        'expense_category_icon': t.expense_category.icon if t.expense_category else None
+    }
 
 @app.route('/')
 def index():
@@ -26,20 +153,12 @@ def index():
 
 @app.route('/api/user/<int:telegram_id>', methods=['GET', 'POST'])
 def user_endpoint(telegram_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
     
     if request.method == 'GET':
         user = db_manager.get_user(telegram_id)
         if user:
-            return jsonify({
-                'id': user.id,
-                'telegram_id': user.telegram_id,
-                'username': user.username,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'default_currency': user.default_currency
-            })
+            return jsonify(serialize_user(user))
         return jsonify({'error': 'User not found'}), 404
     
     elif request.method == 'POST':
@@ -50,19 +169,11 @@ def user_endpoint(telegram_id):
             first_name=data.get('first_name'),
             last_name=data.get('last_name')
         )
-        return jsonify({
-            'id': user.id,
-            'telegram_id': user.telegram_id,
-            'username': user.username,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'default_currency': user.default_currency
-        })
+        return jsonify(serialize_user(user))
 
 @app.route('/api/user/<int:telegram_id>/currency', methods=['PUT'])
 def update_user_currency(telegram_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
     
     data = request.get_json()
     currency = data.get('currency')
@@ -77,22 +188,16 @@ def update_user_currency(telegram_id):
 
 @app.route('/api/user/<int:telegram_id>/wallets', methods=['GET', 'POST'])
 def wallets_endpoint(telegram_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
     
-    user = db_manager.get_user(telegram_id)
+    user = db_manager.resolve_user(telegram_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
     if request.method == 'GET':
-        wallets = db_manager.get_user_wallets(user.id)
-        return jsonify([{
-            'id': wallet.id,
-            'name': wallet.name,
-            'currency': wallet.currency,
-            'balance': wallet.balance,
-            'is_active': wallet.is_active
-        } for wallet in wallets])
+        return conditional_list(db_manager, user.id, 'wallets', lambda: [
+            serialize_wallet(wallet) for wallet in db_manager.get_user_wallets(user.id)
+        ])
     
     elif request.method == 'POST':
         data = request.get_json()
@@ -110,10 +215,9 @@ def wallets_endpoint(telegram_id):
 
 @app.route('/api/user/<int:telegram_id>/wallets/<int:wallet_id>', methods=['DELETE'])
 def delete_wallet(telegram_id, wallet_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
     
-    user = db_manager.get_user(telegram_id)
+    user = db_manager.resolve_user(telegram_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
@@ -124,21 +228,16 @@ def delete_wallet(telegram_id, wallet_id):
 
 @app.route('/api/user/<int:telegram_id>/income-sources', methods=['GET', 'POST'])
 def income_sources_endpoint(telegram_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
     
-    user = db_manager.get_user(telegram_id)
+    user = db_manager.resolve_user(telegram_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
     if request.method == 'GET':
-        sources = db_manager.get_user_income_sources(user.id)
-        return jsonify([{
-            'id': source.id,
-            'name': source.name,
-            'description': source.description,
-            'is_active': source.is_active
-        } for source in sources])
+        return conditional_list(db_manager, user.id, 'income_sources', lambda: [
+            serialize_income_source(source) for source in db_manager.get_user_income_sources(user.id)
+        ])
     
     elif request.method == 'POST':
         data = request.get_json()
@@ -155,10 +254,9 @@ def income_sources_endpoint(telegram_id):
 
 @app.route('/api/user/<int:telegram_id>/income-sources/<int:source_id>', methods=['DELETE'])
 def delete_income_source(telegram_id, source_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
     
-    user = db_manager.get_user(telegram_id)
+    user = db_manager.resolve_user(telegram_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
@@ -169,23 +267,16 @@ def delete_income_source(telegram_id, source_id):
 
 @app.route('/api/user/<int:telegram_id>/expense-categories', methods=['GET', 'POST'])
 def expense_categories_endpoint(telegram_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
     
-    user = db_manager.get_user(telegram_id)
+    user = db_manager.resolve_user(telegram_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
     if request.method == 'GET':
-        categories = db_manager.get_user_expense_categories(user.id)
-        return jsonify([{
-            'id': category.id,
-            'name': category.name,
-            'description': category.description,
-            'color': category.color,
-            'icon': category.icon,
-            'is_active': category.is_active
-        } for category in categories])
+        return conditional_list(db_manager, user.id, 'expense_categories', lambda: [
+            serialize_expense_category(category) for category in db_manager.get_user_expense_categories(user.id)
+        ])
     
     elif request.method == 'POST':
         data = request.get_json()
@@ -206,10 +297,9 @@ def expense_categories_endpoint(telegram_id):
 
 @app.route('/api/user/<int:telegram_id>/expense-categories/<int:category_id>', methods=['DELETE'])
 def delete_expense_category(telegram_id, category_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
     
-    user = db_manager.get_user(telegram_id)
+    user = db_manager.resolve_user(telegram_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
@@ -218,36 +308,40 @@ def delete_expense_category(telegram_id, category_id):
         return jsonify({'message': 'Expense category deleted successfully'})
     return jsonify({'error': 'Expense category not found'}), 404
 
+# Most transactions one GET may return; larger limits are capped
+TRANSACTIONS_MAX_LIMIT = 500
+
 @app.route('/api/user/<int:telegram_id>/transactions', methods=['GET', 'POST'])
 def transactions_endpoint(telegram_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
     
-    user = db_manager.get_user(telegram_id)
+    user = db_manager.resolve_user(telegram_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
     if request.method == 'GET':
         limit = request.args.get('limit', 50, type=int)
+        if limit < 1:
+            return jsonify({'error': 'limit must be at least 1'}), 400
+        limit = min(limit, TRANSACTIONS_MAX_LIMIT)
+        
+        # Keyset mode: pass an empty cursor for the first page, then next_cursor
+        if 'cursor' in request.args:
+            try:
+                transactions, next_cursor = db_manager.get_user_transactions_page(
+                    user.id, limit, request.args['cursor'] or None
+                )
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            return jsonify({
+                'transactions': [serialize_transaction(t) for t in transactions],
+                'next_cursor': next_cursor
+            })
+        
         offset = request.args.get('offset', 0, type=int)
         transactions = db_manager.get_user_transactions(user.id, limit, offset)
         
-        return jsonify([{
-            'id': t.id,
-            'wallet_id': t.wallet_id,
-            'wallet_name': t.wallet.name,
-            'transaction_type': t.transaction_type,
-            'amount': t.amount,
-            'currency': t.currency,
-            'description': t.description,
-            'date': t.date.isoformat(),
-            'income_source_id': t.income_source_id,
-            'income_source_name': t.income_source.name if t.income_source else None,
-            'expense_category_id': t.expense_category_id,
-            'expense_category_name': t.expense_category.name if t.expense_category else None,
-            'expense_category_color': t.expense_category.color if t.expense_category else None,
-            'expense_category_icon': t.expense_category.icon if t.expense_category else None
-        } for t in transactions])
+        return jsonify([serialize_transaction(t) for t in transactions])
     
     elif request.method == 'POST':
         data = request.get_json()
@@ -284,12 +378,36 @@ def transactions_endpoint(telegram_id):
             'date': transaction.date.isoformat()
         })
 
+@app.route('/api/user/<int:telegram_id>/transactions/import', methods=['POST'])
+def import_transactions_endpoint(telegram_id):
+    db_manager = get_db_manager()
+    
+    user = db_manager.resolve_user(telegram_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    # Either a multipart upload in the "file" field or the raw request body
+    upload = request.files.get('file')
+    if upload:
+        stream = upload.stream
+        fmt = request.args.get('format') or detect_format(upload.filename, upload.mimetype)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or detect_format(content_type=request.mimetype)
+    
+    if fmt not in FORMATS:
+        return jsonify({'error': 'Unsupported format'}), 400
+    
+    # Rows are decoded and parsed as they are read, never buffered whole
+    report = import_transactions(db_manager, user.id, stream, fmt)
+    # Unreadable input: the report says how many rows before it were stored
+    return jsonify(report), 400 if 'error' in report else 200
+
 @app.route('/api/user/<int:telegram_id>/transactions/<int:transaction_id>', methods=['DELETE'])
 def delete_transaction(telegram_id, transaction_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
     
-    user = db_manager.get_user(telegram_id)
+    user = db_manager.resolve_user(telegram_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
@@ -298,27 +416,220 @@ def delete_transaction(telegram_id, transaction_id):
         return jsonify({'message': 'Transaction deleted successfully'})
     return jsonify({'error': 'Transaction not found'}), 404
 
+@app.route('/api/user/<int:telegram_id>/export', methods=['GET'])
+def export_transactions(telegram_id):
+    db_manager = get_db_manager()
+    
+    user = db_manager.resolve_user(telegram_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in exporter.FORMATS:
+        return jsonify({'error': 'Unsupported format'}), 400
+    
+    # Optional ISO bounds; a bare end date includes that whole day
+    try:
+        start = request.args.get('start')
+        start_date = datetime.fromisoformat(start) if start else None
+        end = request.args.get('end')
+        end_date = datetime.fromisoformat(end) if end else None
+        if end and len(end) == 10:
+            end_date = datetime.combine(end_date.date(), time.max)
+    except ValueError:
+        return jsonify({'error': 'Invalid date'}), 400
+    
+    rows = db_manager.iter_transactions_by_period(user.id, start_date, end_date)
+    return Response(
+        stream_with_context(exporter.export_rows(rows, fmt)),
+        mimetype=exporter.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename=transactions-{telegram_id}.{fmt}'}
+    )
+
 @app.route('/api/user/<int:telegram_id>/summary', methods=['GET'])
 def user_summary(telegram_id):
-    db = next(get_db())
-    db_manager = DatabaseManager(db)
+    db_manager = get_db_manager()
+    
+    user = db_manager.resolve_user(telegram_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    period_days = request.args.get('period', 30, type=int)
+    currency = request.args.get('currency', user.default_currency)
+    if currency not in Config.SUPPORTED_CURRENCIES:
+        return jsonify({'error': 'Unsupported currency'}), 400
+    
+    balances = db_manager.get_wallet_balances(user.id)
+    
+    return jsonify({
+        'summary': db_manager.get_user_summary(user.id, period_days, currency),
+        'wallet_balances': balances,
+        'net_worth': db_manager.get_net_worth(user.id, currency, balances)
+    })
+
+# Buckets shown when no start date is given, and the most one response may hold
+TIMESERIES_DEFAULT_DAYS = {'day': 30, 'week': 7 * 12, 'month': 365}
+TIMESERIES_MAX_BUCKETS = 3700
+
+@app.route('/api/user/<int:telegram_id>/timeseries', methods=['GET'])
+def user_timeseries(telegram_id):
+    db_manager = get_db_manager()
+    
+    user = db_manager.resolve_user(telegram_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    bucket = request.args.get('bucket', 'month')
+    if bucket not in reports.BUCKETS:
+        return jsonify({'error': 'Unsupported bucket'}), 400
+    currency = request.args.get('currency', user.default_currency)
+    if currency not in Config.SUPPORTED_CURRENCIES:
+        return jsonify({'error': 'Unsupported currency'}), 400
+    window = request.args.get('window', 3, type=int)
+    by_category = request.args.get('by_category', '').lower() in ('1', 'true', 'yes')
+    
+    today = datetime.utcnow().date()
+    try:
+        end = request.args.get('end')
+        end_day = date.fromisoformat(end[:10]) if end else today
+        start = request.args.get('start')
+        start_day = date.fromisoformat(start[:10]) if start else \
+            reports.bucket_start(end_day - timedelta(days=TIMESERIES_DEFAULT_DAYS[bucket]), bucket)
+        # The report looks one bucket past end's; near date.max there is none
+        reports.next_bucket(reports.bucket_start(end_day, bucket), bucket)
+    except (ValueError, OverflowError):
+        return jsonify({'error': 'Invalid date'}), 400
+    if start_day > end_day or window < 1:
+        return jsonify({'error': 'Invalid range'}), 400
+    if reports.bucket_count(start_day, end_day, bucket) > TIMESERIES_MAX_BUCKETS:
+        return jsonify({'error': 'Range too long for this bucket'}), 400
+    
+    groups, unconverted = db_manager.get_timeseries_groups(
+        user.id, start_day, end_day, bucket, by_category, currency
+    )
+    result = reports.build_timeseries(groups, start_day, end_day, bucket, window, by_category,
+                                      today=min(today, end_day))
+    result['currency'] = currency
+    result['unconverted_currencies'] = unconverted
+    return jsonify(result)
+
+@app.route('/api/user/<int:telegram_id>/bootstrap', methods=['GET'])
+def user_bootstrap(telegram_id):
+    """Everything the mini-app needs on open, in one response"""
+    db_manager = get_db_manager()
     
     user = db_manager.get_user(telegram_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
     period_days = request.args.get('period', 30, type=int)
-    summary = db_manager.get_user_summary(user.id, period_days)
-    wallet_balances = db_manager.get_wallet_balances(user.id)
+    if period_days < 1:
+        return jsonify({'error': 'period must be at least 1'}), 400
+    limit = request.args.get('limit', 5, type=int)
+    if limit < 1:
+        return jsonify({'error': 'limit must be at least 1'}), 400
+    limit = min(limit, 100)
+    # Read before the lists, as in conditional_list
+    versions = db_manager.get_versions(user.id)
+    wallets = db_manager.get_user_wallets(user.id)
+    balances = serialize_wallet_balances(wallets)
     
     return jsonify({
-        'summary': summary,
-        'wallet_balances': wallet_balances
+        'user': serialize_user(user),
+        'summary': db_manager.get_user_summary(user.id, period_days, user.default_currency),
+        'wallet_balances': balances,
+        'net_worth': db_manager.get_net_worth(user.id, user.default_currency, balances),
+        'wallets': [serialize_wallet(wallet) for wallet in wallets],
+        'expense_categories': [serialize_expense_category(category)
+                               for category in db_manager.get_user_expense_categories(user.id)],
+        'income_sources': [serialize_income_source(source)
+                           for source in db_manager.get_user_income_sources(user.id)],
+        'recent_transactions': [serialize_transaction(t)
+                                for t in db_manager.get_user_transactions(user.id, limit)],
+        # Lets the client revalidate the lists above with If-None-Match
+        'etags': {scope: f'"{list_etag(user.id, scope, version)}"' for scope, version in versions.items()},
+        'currencies': Config.SUPPORTED_CURRENCIES
     })
 
 @app.route('/api/currencies', methods=['GET'])
 def get_currencies():
     return jsonify(Config.SUPPORTED_CURRENCIES)
 
+@app.route('/healthz', methods=['GET'])
+def health():
+    """Readiness probe: the worker is serving and the database answers"""
+    try:
+        get_db_manager().db.execute(text('SELECT 1'))
+    except SQLAlchemyError as e:
+        return jsonify({'status': 'unavailable', 'error': type(e).__name__}), 503
+    return jsonify({'status': 'ok'})
+
+def admin_denied():
+    """Error response unless the request carries the admin token"""
+    if not Config.ADMIN_TOKEN:
+        return jsonify({'error': 'Admin API is disabled'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), Config.ADMIN_TOKEN):
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+@app.route('/api/admin/fx-rates', methods=['GET', 'POST'])
+def admin_fx_rates():
+    denied = admin_denied()
+    if denied:
+        return denied
+    db_manager = get_db_manager()
+    
+    if request.method == 'GET':
+        return jsonify({
+            'base': Config.FX_BASE_CURRENCY,
+            'rates': [{'date': day.isoformat(), 'currency': currency, 'rate': rate}
+                      for day, currency, rate in sorted(db_manager.get_fx_rates())]
+        })
+    
+    # JSON list of {date, currency, rate} or a date,currency,rate CSV body
+    try:
+        if request.is_json:
+            rates = fx.parse_rates(request.get_json())
+        else:
+            rates = fx.read_rates_csv(io.StringIO(request.get_data(as_text=True)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'loaded': db_manager.upsert_fx_rates(rates)})
+
+@app.route('/api/admin/cache', methods=['GET'])
+def admin_cache_stats():
+    """Hit ratios and latency of this worker's caches"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    return jsonify({
+        'users': user_cache.stats(),
+        'results': result_cache.stats(),
+        'ledgers': ledger_cache.stats()
+    })
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+def admin_slow_queries():
+    """Top statements of the slow query log (?top=20&sort=total|mean|max|count&since=YYYY-MM-DD)"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    sort = request.args.get('sort', 'total')
+    if sort not in slowlog.SORT_KEYS:
+        return jsonify({'error': f"sort must be one of {', '.join(slowlog.SORT_KEYS)}"}), 400
+    top = min(max(request.args.get('top', 20, type=int), 1), 200)
+    return jsonify({
+        'threshold_ms': Config.SLOW_QUERY_MS,
+        'queries': slowlog.report(slowlog.read_log(), top=top, sort=sort, since=request.args.get('since'))
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint for this worker; the bot serves its own on BOT_METRICS_PORT"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
+    from migrate_db import init_database
+    init_database()
     app.run(debug=Config.DEBUG, host='0.0.0.0', port=5000) 
\ No newline at end of file
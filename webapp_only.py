@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Finance Manager Web App - Web Only Version
-For deployment on platforms like Render, Railway, etc.
+Development server; production runs gunicorn -c gunicorn.conf.py wsgi:app
 """
 
 import os
@@ -12,6 +12,8 @@ from webapp import app
 load_dotenv()
 
 if __name__ == '__main__':
+    from migrate_db import init_database
+    init_database()
     port = int(os.environ.get('PORT', 5000))
     print(f"🌐 Starting web app on port {port}")
     app.run(host='0.0.0.0', port=port, debug=False) 
\ No newline at end of file
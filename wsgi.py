@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+"""
+WSGI entry point for production
+
+    python manage.py init-db                  # once per deploy
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing it loads the Flask app without touching the database, so
+gunicorn can preload it once in the master and fork the workers.
+"""
+
+from webapp import app